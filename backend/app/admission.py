@@ -0,0 +1,265 @@
+"""Admission Control: Uploads dürfen die kleinen Anfragen des Frontends nicht verdrängen.
+
+Jede Anfrage wird einer Spur zugeordnet: Multipart-Uploads (Vertragsdokumente, E-Rechnungen)
+laufen in der Spur "upload", alles andere in "read". Jede Spur hat eine eigene Obergrenze
+gleichzeitiger Anfragen und eine begrenzte Warteschlange. Reihenfolge der Prüfungen:
+
+1. Content-Length über dem Limit der Spur -> 413, bevor der Body gelesen oder gespoolt wird
+   (ohne Content-Length wird beim Lesen mitgezählt und abgebrochen)
+2. Token-Bucket je Client und Spur leer -> 429 mit Retry-After
+3. Warteschlange voll oder Wartezeit abgelaufen -> 503 mit Retry-After
+
+Vor einer Ablehnung wird ein kleiner Body (bis ADMISSION_DRAIN_MB, Standard 1 MB) gelesen und verworfen.
+Sonst schließt der Server die Verbindung mit ungelesenen Daten im Puffer, und der Client sieht statt
+der Antwort einen Verbindungsabbruch. Größere Bodies werden nicht gelesen, damit abgelehnte Uploads
+die Event-Loop nicht beschäftigen; die Antwort trägt dann `Connection: close`, und der Client erhält
+unter Umständen nur den Verbindungsabbruch (Clients mit `Expect: 100-continue` senden den Body gar
+nicht erst).
+
+Der Token-Bucket gilt je Client-IP. Anfragen von ADMISSION_TRUSTED_PROXIES (z. B. dem Frontend, über
+das alle Benutzer mit derselben IP kommen) werden stattdessen nach dem Header X-Client-Id unterschieden.
+"""
+import asyncio
+import ipaddress
+import json
+import math
+import os
+import threading
+import time
+
+EXEMPT_PATHS = {"/health", "/changes/", "/changes/stream"}  # Healthcheck und Long-Polling/Streams
+EXEMPT_PREFIXES = ("/admin/",)  # Diagnose muss auch unter Last erreichbar bleiben
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+MAX_CLIENTS = 10000
+DRAIN_LIMIT = int(float(os.getenv("ADMISSION_DRAIN_MB", "1")) * 1024 * 1024)
+TRUSTED_PROXIES = {
+    ipaddress.ip_address(address.strip())
+    for address in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if address.strip()
+}
+CLIENT_ID_HEADER = b"x-client-id"
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+class Lane:
+    def __init__(self, name: str, concurrency: int, queue_size: int, max_body: int, rate: float, burst: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_body = max_body
+        self.rate = rate      # Token pro Sekunde und Client
+        self.burst = burst    # Größe des Buckets
+        self.active = 0
+        self.waiting = 0
+        self.rejected = {"too_large": 0, "rate_limited": 0, "overloaded": 0}
+        self._semaphore = None
+        self._buckets = {}    # Client -> (Token, Zeitpunkt)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, name: str, concurrency: int, queue_size: int, max_mb: int, rate: float, burst: int):
+        prefix = name.upper()
+        return cls(
+            name,
+            int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+            int(os.getenv(f"{prefix}_QUEUE", str(queue_size))),
+            int(float(os.getenv(f"{prefix}_MAX_MB", str(max_mb))) * 1024 * 1024),
+            float(os.getenv(f"{prefix}_RATE_PER_SECOND", str(rate))),
+            int(os.getenv(f"{prefix}_RATE_BURST", str(burst))),
+        )
+
+    def take_token(self, client: str) -> float:
+        """Entnimmt ein Token; liefert 0 oder die Sekunden bis zum nächsten freien Token."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[client] = (tokens, now)
+                return (1 - tokens) / self.rate
+            self._buckets[client] = (tokens - 1, now)
+            if len(self._buckets) > MAX_CLIENTS:
+                # Volle Buckets entsprechen dem Ausgangszustand und können entfallen
+                idle = self.burst / self.rate
+                self._buckets = {key: value for key, value in self._buckets.items() if now - value[1] < idle}
+            return 0.0
+
+    async def acquire(self) -> bool:
+        if self._semaphore is None:
+            # Erst in der laufenden Event-Loop anlegen (Python 3.9 bindet Semaphoren an die Loop der Erzeugung)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        if self._semaphore.locked() and self.waiting >= self.queue_size:
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "max_body_bytes": self.max_body,
+            "rate_per_second": self.rate,
+            "rate_burst": self.burst,
+            "clients": len(self._buckets),
+            "rejected": dict(self.rejected),
+        }
+
+
+LANES = {
+    "upload": Lane.from_env("upload", concurrency=2, queue_size=8, max_mb=50, rate=1, burst=10),
+    "read": Lane.from_env("read", concurrency=32, queue_size=256, max_mb=20, rate=100, burst=400),
+}
+
+
+def stats() -> dict:
+    return {"queue_timeout_seconds": QUEUE_TIMEOUT, "lanes": {name: lane.stats() for name, lane in LANES.items()}}
+
+
+def _lane_for(scope, headers: dict) -> Lane:
+    content_type = headers.get(b"content-type", b"")
+    if scope["method"] in ("POST", "PUT") and content_type.startswith(b"multipart/form-data"):
+        return LANES["upload"]
+    return LANES["read"]
+
+
+def _client_key(scope, headers: dict) -> str:
+    if not scope.get("client"):
+        return "unknown"
+    host = scope["client"][0]
+    client_id = headers.get(CLIENT_ID_HEADER)
+    if client_id and TRUSTED_PROXIES:
+        try:
+            trusted = ipaddress.ip_address(host) in TRUSTED_PROXIES
+        except ValueError:
+            trusted = False
+        if trusted:
+            # Länge begrenzen: der Schlüssel landet im Speicher der Buckets
+            return f"{host}/{client_id[:64].decode('latin-1')}"
+    return host
+
+
+def _has_body(headers: dict) -> bool:
+    return headers.get(b"transfer-encoding", b"").lower() == b"chunked" or headers.get(b"content-length", b"0") not in (b"", b"0")
+
+
+async def _drain(receive, headers: dict, received: int = 0) -> bool:
+    """Liest den restlichen Body und verwirft ihn; True, wenn danach nichts Ungelesenes mehr aussteht."""
+    if not _has_body(headers) or headers.get(b"expect", b"").lower() == b"100-continue":
+        # Ohne Body nichts zu tun; bei 100-continue sendet der Client erst nach unserer Zusage
+        return True
+    content_length = headers.get(b"content-length", b"")
+    if content_length.isdigit() and int(content_length) > DRAIN_LIMIT:
+        return False
+    while received <= DRAIN_LIMIT:
+        message = await receive()
+        if message["type"] != "http.request":
+            return True  # Client hat die Verbindung bereits geschlossen
+        received += len(message.get("body", b""))
+        if not message.get("more_body", False):
+            return True
+    return False
+
+
+async def _reject(send, status: int, detail: str, retry_after: float = None, close: bool = False):
+    headers = [(b"content-type", b"application/json")]
+    if retry_after is not None:
+        headers.append((b"retry-after", str(max(1, math.ceil(retry_after))).encode()))
+    if close:
+        headers.append((b"connection", b"close"))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode()})
+
+
+class AdmissionMiddleware:
+    """Reine ASGI-Middleware; lehnt ab, bevor FastAPI den Body liest oder Uploads spoolt."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", ()))
+        lane = _lane_for(scope, headers)
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > lane.max_body:
+            lane.rejected["too_large"] += 1
+            drained = await _drain(receive, headers)
+            await _reject(send, 413, f"Request body exceeds {lane.max_body} bytes", close=not drained)
+            return
+
+        wait = lane.take_token(_client_key(scope, headers))
+        if wait:
+            lane.rejected["rate_limited"] += 1
+            drained = await _drain(receive, headers)
+            await _reject(send, 429, "Too many requests", retry_after=wait, close=not drained)
+            return
+
+        queued = time.monotonic()
+        if not await lane.acquire():
+            lane.rejected["overloaded"] += 1
+            drained = await _drain(receive, headers)
+            await _reject(send, 503, f"Too many concurrent {lane.name} requests", retry_after=QUEUE_TIMEOUT / 2, close=not drained)
+            return
+        # Wartezeit in der Warteschlange für innere Middleware (der Profiler läuft erst danach an)
+        scope.setdefault("state", {})["admission_wait"] = time.monotonic() - queued
+
+        received = 0
+        body_complete = False
+        too_large = False
+        started = False
+
+        async def limited_receive():
+            # Chunked Uploads ohne Content-Length: beim Lesen mitzählen
+            nonlocal received, body_complete, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                body_complete = not message.get("more_body", False)
+                if received > lane.max_body:
+                    too_large = True
+                    raise RequestTooLarge()
+            return message
+
+        async def limited_send(message):
+            nonlocal started
+            if too_large:
+                # FastAPI fängt Fehler beim Lesen des Formulars ab und antwortet mit 400; stattdessen 413
+                if message["type"] == "http.response.start" and not started:
+                    started = True
+                    drained = body_complete or await _drain(receive, headers, received)
+                    await _reject(send, 413, f"Request body exceeds {lane.max_body} bytes", close=not drained)
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except RequestTooLarge:
+            if not started:
+                started = True
+                drained = body_complete or await _drain(receive, headers, received)
+                await _reject(send, 413, f"Request body exceeds {lane.max_body} bytes", close=not drained)
+        finally:
+            if too_large:
+                lane.rejected["too_large"] += 1
+            lane.release()
@@ -0,0 +1,381 @@
+"""Spaltenorientierter Analyse-Snapshot (Apache Arrow) für Auswertungen.
+
+Verträge, Rechnungen, Budgets und Ausgaben werden einmalig aus der Datenbank gelesen und
+danach nur noch inkrementell aus dem Änderungsprotokoll (change_log) fortgeschrieben.
+Auswertungen laufen vektorisiert über die Arrow-Tabellen im Speicher und berühren die
+Vertragsdatenbank nicht. Der Stand wird als Parquet unter DATA_DIR/snapshot abgelegt und
+beim Start per Memory-Mapping geladen.
+"""
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlalchemy import func, select
+
+from . import crud, partitions
+from .database import DATA_DIR, SessionLocal
+from .models import Budget, ChangeLog, Contract, Expense, Invoice
+
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshot")
+REFRESH_INTERVAL = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "30"))
+PERSIST_INTERVAL = float(os.getenv("ANALYTICS_PERSIST_SECONDS", "300"))
+CHANGES_BATCH = 5000
+
+# Nur auswertungsrelevante Spalten; Notizen und Dokumentpfade bleiben in der Datenbank
+SCHEMAS = {
+    "contract": (Contract, pa.schema([
+        ("id", pa.int64()),
+        ("contract_number", pa.string()),
+        ("partner", pa.string()),
+        ("partner_id", pa.int64()),
+        ("category", pa.string()),
+        ("contract_date", pa.date32()),
+        ("start_date", pa.date32()),
+        ("end_date", pa.date32()),
+        ("amount", pa.float64()),
+        ("payment_interval", pa.string()),
+    ])),
+    "invoice": (Invoice, pa.schema([
+        ("id", pa.int64()),
+        ("invoice_number", pa.string()),
+        ("invoice_date", pa.date32()),
+        ("contract_number", pa.string()),
+        ("cost_center", pa.string()),
+        ("amount_net", pa.float64()),
+        ("amount_gross", pa.float64()),
+    ])),
+    "budget": (Budget, pa.schema([
+        ("id", pa.int64()),
+        ("contract_number", pa.string()),
+        ("initial_amount", pa.float64()),
+        ("start_date", pa.date32()),
+        ("end_date", pa.date32()),
+    ])),
+    "expense": (Expense, pa.schema([
+        ("id", pa.int64()),
+        ("budget_id", pa.int64()),
+        ("amount", pa.float64()),
+        ("date", pa.date32()),
+    ])),
+}
+
+
+class Snapshot:
+    def __init__(self, tables: dict, seq: int):
+        self.tables = tables  # Entität -> pa.Table
+        self.seq = seq        # Letzte eingearbeitete Sequenznummer des Änderungsprotokolls
+        self.refreshed_at = datetime.now()
+
+
+_lock = threading.Lock()
+_snapshot = None
+_persisted = (None, float("-inf"))  # (Sequenznummer, Zeitpunkt) des zuletzt geschriebenen Parquet-Stands
+_full_rebuild = False
+
+
+def _path(entity: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{entity}.parquet")
+
+
+def _from_rows(entity: str, rows) -> pa.Table:
+    schema = SCHEMAS[entity][1]
+    return pa.Table.from_pylist(rows, schema=schema)
+
+
+def _convert_payload(entity: str, payload: dict) -> dict:
+    # Das Änderungsprotokoll speichert Datumswerte als ISO-Strings
+    row = {}
+    for field in SCHEMAS[entity][1]:
+        value = payload.get(field.name)
+        if value is not None and field.type == pa.date32():
+            value = date.fromisoformat(value[:10])
+        row[field.name] = value
+    return row
+
+
+def build(db) -> Snapshot:
+    """Vollständiger Aufbau aus der Datenbank (nur beim ersten Start oder nach invalidate())."""
+    # Sequenznummer zuerst lesen: Änderungen danach werden beim nächsten Refresh idempotent nachgezogen
+    seq = _latest_seq(db)
+    tables = {}
+    for entity, (model, schema) in SCHEMAS.items():
+        rows = []
+        # Rechnungen und Ausgaben: Hauptbestand plus archivierte Geschäftsjahre
+        for table in partitions.tables(db, model.__table__):
+            rows.extend(db.execute(select(*(table.c[field.name] for field in schema))))
+        tables[entity] = pa.Table.from_pydict(
+            {field.name: [row[i] for row in rows] for i, field in enumerate(schema)}, schema=schema
+        )
+    return Snapshot(tables, seq)
+
+
+def apply_changes(snapshot: Snapshot, changes) -> Snapshot:
+    """Arbeitet Änderungen ein: betroffene IDs werden vektorisiert entfernt und mit dem letzten Stand angehängt."""
+    latest = {}
+    seq = snapshot.seq
+    for change in changes:
+        seq = change.seq
+        if change.entity in SCHEMAS:
+            # Bei mehreren Änderungen derselben Zeile zählt nur die letzte
+            latest.setdefault(change.entity, {})[change.entity_id] = change
+    tables = dict(snapshot.tables)
+    for entity, by_id in latest.items():
+        table = tables[entity]
+        keep = pc.invert(pc.is_in(table["id"], value_set=pa.array(list(by_id), pa.int64())))
+        upserts = [
+            _convert_payload(entity, json.loads(change.payload))
+            for change in by_id.values() if change.operation != "delete"
+        ]
+        tables[entity] = pa.concat_tables([table.filter(keep), _from_rows(entity, upserts)]).combine_chunks()
+    return Snapshot(tables, seq)
+
+
+def _load_persisted():
+    if not all(os.path.exists(_path(entity)) for entity in SCHEMAS):
+        return None
+    tables = {}
+    seq = None
+    for entity, (_, schema) in SCHEMAS.items():
+        table = pq.read_table(_path(entity), memory_map=True)
+        if not table.schema.remove_metadata().equals(schema):
+            # Spalten haben sich geändert: Snapshot neu aufbauen
+            return None
+        entity_seq = int(table.schema.metadata[b"seq"])
+        seq = entity_seq if seq is None else min(seq, entity_seq)
+        tables[entity] = table.replace_schema_metadata(None)
+    return Snapshot(tables, seq)
+
+
+def persist(snapshot: Snapshot):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    for entity, table in snapshot.tables.items():
+        # Atomar ersetzen, damit ein Abbruch keinen halben Snapshot hinterlässt
+        tmp_path = _path(entity) + ".tmp"
+        pq.write_table(table.replace_schema_metadata({"seq": str(snapshot.seq)}), tmp_path)
+        os.replace(tmp_path, _path(entity))
+
+
+def _latest_seq(db) -> int:
+    return db.query(func.coalesce(func.max(ChangeLog.seq), 0)).scalar()
+
+
+def _catch_up(db, snapshot: Snapshot) -> Snapshot:
+    while True:
+        changes = crud.get_changes(db, snapshot.seq, CHANGES_BATCH)
+        if not changes:
+            return snapshot
+        snapshot = apply_changes(snapshot, changes)
+
+
+def _matches_database(db, snapshot: Snapshot) -> bool:
+    # Günstige Plausibilitätsprüfung beim Laden von der Platte: Zeilenzahl je Tabelle
+    return all(
+        sum(db.execute(select(func.count()).select_from(table)).scalar() for table in partitions.tables(db, model.__table__))
+        == snapshot.tables[entity].num_rows
+        for entity, (model, _) in SCHEMAS.items()
+    )
+
+
+def refresh() -> Snapshot:
+    """Bringt den Snapshot auf den aktuellen Stand des Änderungsprotokolls."""
+    global _snapshot, _persisted, _full_rebuild
+    with _lock:
+        snapshot = _snapshot
+        rebuild = _full_rebuild
+        _full_rebuild = False
+        db = SessionLocal()
+        try:
+            loaded = False
+            if snapshot is None and not rebuild:
+                snapshot = _load_persisted()
+                loaded = snapshot is not None
+                if loaded:
+                    _persisted = (snapshot.seq, time.monotonic())
+            if snapshot is not None and snapshot.seq > _latest_seq(db):
+                # Datenbank wurde zurückgesetzt (z. B. Backup eingespielt)
+                rebuild = True
+            if snapshot is None or rebuild:
+                snapshot = build(db)
+                _persisted = (None, float("-inf"))
+            snapshot = _catch_up(db, snapshot)
+            if loaded and not _matches_database(db, snapshot):
+                # Zeilen wurden am Änderungsprotokoll vorbei geschrieben (Migration, Import per SQL)
+                snapshot = _catch_up(db, build(db))
+                _persisted = (None, float("-inf"))
+        finally:
+            db.close()
+        snapshot.refreshed_at = datetime.now()
+        _snapshot = snapshot
+        # Parquet nicht bei jedem Refresh neu schreiben, sondern höchstens alle PERSIST_INTERVAL Sekunden
+        persisted_seq, persisted_at = _persisted
+        if snapshot.seq != persisted_seq and time.monotonic() - persisted_at >= PERSIST_INTERVAL:
+            persist(snapshot)
+            _persisted = (snapshot.seq, time.monotonic())
+        return snapshot
+
+
+def invalidate():
+    # Für Änderungen, die am Änderungsprotokoll vorbeigehen (z. B. Partner-Zuordnung per Batch-Job)
+    global _full_rebuild
+    with _lock:
+        _full_rebuild = True
+
+
+def current() -> Snapshot:
+    snapshot = _snapshot
+    return snapshot if snapshot is not None else refresh()
+
+
+def run_refresh_loop():
+    while True:
+        try:
+            refresh()
+        except Exception as e:  # Auswertungen dürfen den Server nicht stoppen
+            print(f"Analytics snapshot refresh failed: {e}", flush=True)
+        time.sleep(REFRESH_INTERVAL)
+
+
+def status() -> dict:
+    snapshot = current()
+    return {
+        "seq": snapshot.seq,
+        "refreshed_at": snapshot.refreshed_at,
+        "rows": {entity: table.num_rows for entity, table in snapshot.tables.items()},
+        "bytes": sum(table.nbytes for table in snapshot.tables.values()),
+    }
+
+
+def _in_period(table: pa.Table, column: str, date_from: date = None, date_to: date = None) -> pa.Table:
+    mask = None
+    if date_from:
+        mask = pc.greater_equal(table[column], pa.scalar(date_from, pa.date32()))
+    if date_to:
+        upper = pc.less_equal(table[column], pa.scalar(date_to, pa.date32()))
+        mask = upper if mask is None else pc.and_(mask, upper)
+    return table if mask is None else table.filter(mask)
+
+
+def _sorted_rows(table: pa.Table, sort_keys, limit: int = None) -> list:
+    table = table.sort_by(sort_keys)
+    if limit:
+        table = table.slice(0, limit)
+    return table.to_pylist()
+
+
+def invoices_by_month(date_from: date = None, date_to: date = None, cost_center: str = None) -> list:
+    invoices = _in_period(current().tables["invoice"], "invoice_date", date_from, date_to)
+    if cost_center:
+        invoices = invoices.filter(pc.equal(invoices["cost_center"], cost_center))
+    dates = invoices["invoice_date"]
+    grouped = (
+        pa.table({
+            "year": pc.year(dates),
+            "month": pc.month(dates),
+            "amount_net": invoices["amount_net"],
+            "amount_gross": invoices["amount_gross"],
+        })
+        .group_by(["year", "month"])
+        .aggregate([("amount_net", "sum"), ("amount_gross", "sum"), ("amount_net", "count")])
+    )
+    rows = _sorted_rows(grouped, [("year", "ascending"), ("month", "ascending")])
+    return [
+        {
+            "month": f"{row['year']:04d}-{row['month']:02d}",
+            "amount_net": round(row["amount_net_sum"], 2),
+            "amount_gross": round(row["amount_gross_sum"], 2),
+            "invoices": row["amount_net_count"],
+        }
+        for row in rows
+    ]
+
+
+def invoices_by_cost_center(date_from: date = None, date_to: date = None) -> list:
+    invoices = _in_period(current().tables["invoice"], "invoice_date", date_from, date_to)
+    grouped = invoices.group_by("cost_center").aggregate(
+        [("amount_net", "sum"), ("amount_gross", "sum"), ("amount_net", "count")]
+    )
+    return [
+        {
+            "cost_center": row["cost_center"],
+            "amount_net": round(row["amount_net_sum"], 2),
+            "amount_gross": round(row["amount_gross_sum"], 2),
+            "invoices": row["amount_net_count"],
+        }
+        for row in _sorted_rows(grouped, [("amount_net_sum", "descending")])
+    ]
+
+
+def spend_by_partner(date_from: date = None, date_to: date = None, limit: int = 50) -> list:
+    """Rechnungssummen je Vertragspartner (Zuordnung über die Vertragsnummer)."""
+    snapshot = current()
+    invoices = _in_period(snapshot.tables["invoice"], "invoice_date", date_from, date_to)
+    contracts = snapshot.tables["contract"].filter(pc.is_valid(snapshot.tables["contract"]["contract_number"]))
+    # Eine Zeile je Vertragsnummer, damit doppelt vergebene Nummern Beträge nicht mehrfach zählen
+    partner_by_number = contracts.group_by("contract_number").aggregate([("partner_id", "min")])
+    joined = invoices.select(["contract_number", "amount_net", "amount_gross"]).join(
+        partner_by_number, keys="contract_number", join_type="left outer"
+    )
+    grouped = joined.group_by("partner_id_min").aggregate(
+        [("amount_net", "sum"), ("amount_gross", "sum"), ("amount_net", "count")]
+    )
+    rows = _sorted_rows(grouped, [("amount_net_sum", "descending")], limit)
+
+    # Anzeigenamen nur für die Ergebniszeilen nachschlagen
+    partner_ids = [row["partner_id_min"] for row in rows if row["partner_id_min"] is not None]
+    names = {}
+    named = snapshot.tables["contract"].filter(pc.is_in(snapshot.tables["contract"]["partner_id"], pa.array(partner_ids, pa.int64())))
+    for partner_id, partner in zip(named["partner_id"].to_pylist(), named["partner"].to_pylist()):
+        names.setdefault(partner_id, partner)
+    return [
+        {
+            "partner_id": row["partner_id_min"],
+            "partner": names.get(row["partner_id_min"]),
+            "amount_net": round(row["amount_net_sum"], 2),
+            "amount_gross": round(row["amount_gross_sum"], 2),
+            "invoices": row["amount_net_count"],
+        }
+        for row in rows
+    ]
+
+
+def budget_utilization(limit: int = None) -> list:
+    snapshot = current()
+    spent = snapshot.tables["expense"].group_by("budget_id").aggregate([("amount", "sum"), ("amount", "count")])
+    joined = snapshot.tables["budget"].join(spent, keys="id", right_keys="budget_id", join_type="left outer")
+    spent_amount = pc.fill_null(joined["amount_sum"], 0.0)
+    initial = joined["initial_amount"]
+    table = pa.table({
+        "budget_id": joined["id"],
+        "contract_number": joined["contract_number"],
+        "initial_amount": initial,
+        "spent": spent_amount,
+        "remaining": pc.subtract(initial, spent_amount),
+        "utilization": pc.if_else(pc.greater(initial, 0), pc.divide(spent_amount, initial), pa.scalar(None, pa.float64())),
+        "expenses": pc.fill_null(joined["amount_count"], 0),
+        "end_date": joined["end_date"],
+    })
+    rows = _sorted_rows(table, [("utilization", "descending")], limit)
+    for row in rows:
+        row["spent"] = round(row["spent"], 2)
+        row["remaining"] = round(row["remaining"], 2)
+        row["utilization"] = round(row["utilization"], 4) if row["utilization"] is not None else None
+    return rows
+
+
+def contracts_by_category(active_on: date = None) -> list:
+    contracts = current().tables["contract"]
+    if active_on:
+        day = pa.scalar(active_on, pa.date32())
+        contracts = contracts.filter(pc.and_(
+            pc.less_equal(contracts["start_date"], day), pc.greater_equal(contracts["end_date"], day)
+        ))
+    grouped = contracts.group_by("category").aggregate([("amount", "sum"), ("id", "count")])
+    return [
+        {"category": row["category"], "amount": round(row["amount_sum"] or 0.0, 2), "contracts": row["id_count"]}
+        for row in _sorted_rows(grouped, [("amount_sum", "descending")])
+    ]
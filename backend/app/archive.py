@@ -0,0 +1,177 @@
+import contextlib
+import fcntl
+import hashlib
+import os
+import time
+import zlib
+from datetime import date, datetime
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .database import ARCHIVE_DIR, SessionLocal, init_db
+from .models import ArchivedDocument, Contract
+
+# Neues Paket anfangen, sobald das aktuelle diese Größe erreicht
+PACK_MAX_SIZE = 256 * 1024 * 1024
+# Komprimierung nur behalten, wenn sie mindestens 5 % spart (PDFs sind oft schon komprimiert)
+MIN_SAVING_RATIO = 0.05
+
+last_report = None
+
+
+class CorruptDocumentError(ValueError):
+    pass
+
+
+@contextlib.contextmanager
+def _compaction_lock():
+    # Dateisperre statt threading.Lock: schützt auch gegen `python -m app.archive` neben dem laufenden Server
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with open(os.path.join(ARCHIVE_DIR, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _current_pack():
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    packs = sorted(name for name in os.listdir(ARCHIVE_DIR) if name.endswith(".pack"))
+    if packs:
+        last = packs[-1]
+        if os.path.getsize(os.path.join(ARCHIVE_DIR, last)) < PACK_MAX_SIZE:
+            return last
+        number = int(last[len("archive_"):-len(".pack")]) + 1
+    else:
+        number = 1
+    return f"archive_{number:04d}.pack"
+
+
+def _encode(data: bytes):
+    compressed = zlib.compress(data, 9)
+    if len(compressed) <= len(data) * (1 - MIN_SAVING_RATIO):
+        return compressed, "zlib"
+    return data, "store"
+
+
+def compact_archive(db: Session, today: date = None) -> dict:
+    """Packt die Dokumente abgelaufener Verträge (end_date < heute) in Archivpakete."""
+    global last_report
+    today = today or date.today()
+    started = time.perf_counter()
+    report = {"files": 0, "original_bytes": 0, "stored_bytes": 0, "skipped": 0}
+
+    with _compaction_lock():
+        archived = {path for (path,) in db.query(ArchivedDocument.document_path)}
+        candidates = (
+            db.query(Contract.document_path)
+            .filter(Contract.end_date < today, Contract.document_path.isnot(None))
+            .distinct()
+            .all()
+        )
+
+        pack_name = _current_pack()
+        pack_path = os.path.join(ARCHIVE_DIR, pack_name)
+        archived_files = []
+        with open(pack_path, "ab") as pack:
+            for (document_path,) in candidates:
+                if document_path in archived or not os.path.exists(document_path):
+                    report["skipped"] += 1
+                    continue
+                with open(document_path, "rb") as f:
+                    data = f.read()
+                payload, method = _encode(data)
+                offset = pack.tell()
+                pack.write(payload)
+                db.add(ArchivedDocument(
+                    document_path=document_path,
+                    pack_file=pack_name,
+                    offset=offset,
+                    stored_size=len(payload),
+                    original_size=len(data),
+                    method=method,
+                    sha256=hashlib.sha256(data).hexdigest(),
+                    archived_at=datetime.now(),
+                ))
+                archived_files.append(document_path)
+                report["files"] += 1
+                report["original_bytes"] += len(data)
+                report["stored_bytes"] += len(payload)
+            # Erst das Paket dauerhaft schreiben, dann den Index committen, dann Originale löschen
+            pack.flush()
+            os.fsync(pack.fileno())
+        db.commit()
+
+        for document_path in archived_files:
+            os.remove(document_path)
+
+    report["saved_bytes"] = report["original_bytes"] - report["stored_bytes"]
+    report["duration_seconds"] = round(time.perf_counter() - started, 3)
+    report["finished_at"] = datetime.now().isoformat(timespec="seconds")
+    last_report = report
+    return report
+
+
+def run_compaction():
+    # Einstiegspunkt für BackgroundTasks: eigene Session, da die Request-Session bereits geschlossen ist
+    db = SessionLocal()
+    try:
+        return compact_archive(db)
+    finally:
+        db.close()
+
+
+def read_document(db: Session, document_path: str):
+    """Liest ein archiviertes Dokument über den Index aus dem Paket (wahlfreier Zugriff)."""
+    entry = db.query(ArchivedDocument).filter(ArchivedDocument.document_path == document_path).first()
+    if not entry:
+        return None
+    with open(os.path.join(ARCHIVE_DIR, entry.pack_file), "rb") as pack:
+        pack.seek(entry.offset)
+        payload = pack.read(entry.stored_size)
+    try:
+        data = zlib.decompress(payload) if entry.method == "zlib" else payload
+    except zlib.error:
+        data = None
+    # Beschädigte Paketeinträge nicht stillschweigend ausliefern
+    if data is None or hashlib.sha256(data).hexdigest() != entry.sha256:
+        raise CorruptDocumentError(f"Archived document {document_path} failed checksum verification")
+    return data
+
+
+def forget_document(db: Session, document_path: str):
+    """Entfernt den Indexeintrag eines Dokuments, auf das kein Vertrag mehr verweist (ohne Commit).
+
+    Die Bytes im Paket bleiben als ungenutzter Bereich stehen; archive_stats zählt sie nicht mehr mit.
+    """
+    if not document_path:
+        return
+    still_referenced = db.query(Contract.id).filter(Contract.document_path == document_path).first()
+    if still_referenced is None:
+        db.query(ArchivedDocument).filter(ArchivedDocument.document_path == document_path).delete(
+            synchronize_session=False
+        )
+
+
+def archive_stats(db: Session) -> dict:
+    count, original, stored = db.query(
+        func.count(ArchivedDocument.id),
+        func.coalesce(func.sum(ArchivedDocument.original_size), 0),
+        func.coalesce(func.sum(ArchivedDocument.stored_size), 0),
+    ).one()
+    return {
+        "documents": count,
+        "original_bytes": original,
+        "stored_bytes": stored,
+        "saved_bytes": original - stored,
+        "saving_ratio": round(1 - stored / original, 4) if original else 0.0,
+        "last_compaction": last_report,
+    }
+
+
+if __name__ == "__main__":
+    # z. B. per Cron: docker-compose exec backend python -m app.archive
+    init_db()
+    print(run_compaction())
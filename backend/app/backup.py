@@ -0,0 +1,341 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+from . import archive
+from .database import ARCHIVE_DIR, DATA_DIR, PARTITION_DIR, PARTITION_FILE, engine, init_db
+
+DB_PATH = engine.url.database
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(DATA_DIR, "backups"))
+# Seiten pro Schritt der Backup-API (nur Fallback, wenn VACUUM INTO nicht verfügbar ist)
+BACKUP_PAGES_PER_STEP = 1024
+CHUNK_SIZE = 1024 * 1024
+# Große Dateien (Archivpakete wachsen nur am Ende) in Blöcken ablegen: unveränderte Blöcke nicht erneut kopieren
+OBJECT_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _object_path(sha):
+    return os.path.join(BACKUP_DIR, "objects", sha[:2], sha)
+
+
+def _snapshot_database(target, db_path=DB_PATH):
+    # VACUUM INTO liest aus einem einzigen Snapshot; im WAL-Modus laufen Schreiber ungehindert weiter
+    source = sqlite3.connect(db_path, timeout=30)
+    try:
+        try:
+            source.execute("VACUUM INTO ?", (target,))
+        except sqlite3.OperationalError:
+            # Ältere SQLite-Versionen: Backup-API in kleinen Schritten mit Pausen
+            dest = sqlite3.connect(target)
+            try:
+                source.backup(dest, pages=BACKUP_PAGES_PER_STEP, sleep=0.005)
+            finally:
+                dest.close()
+    finally:
+        source.close()
+
+
+def _snapshot_with_documents(target) -> tuple:
+    """Sichert contracts.db und liest die Dokumentliste in derselben Lesetransaktion.
+
+    VACUUM INTO ist innerhalb einer Transaktion nicht erlaubt; die Backup-API liest dagegen
+    über die offene Lesetransaktion und damit exakt denselben Stand wie die Dokumentliste.
+    """
+    source = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    try:
+        source.execute("BEGIN")
+        documents = {path for (path,) in source.execute("SELECT document_path FROM contracts WHERE document_path IS NOT NULL")}
+        packs = {os.path.join(ARCHIVE_DIR, name) for (name,) in source.execute("SELECT DISTINCT pack_file FROM archived_documents")}
+        # Archivierte Dokumente liegen nur noch im Paket
+        documents -= {path for (path,) in source.execute("SELECT document_path FROM archived_documents")}
+        dest = sqlite3.connect(target)
+        try:
+            source.backup(dest, pages=BACKUP_PAGES_PER_STEP, sleep=0.005)
+        finally:
+            dest.close()
+        source.execute("COMMIT")
+    finally:
+        source.close()
+    return documents, packs
+
+
+def _table_counts(db_path):
+    # Nur lesend öffnen: verify_backup prüft Snapshot und Objekte an Ort und Stelle
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        tables = [name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )]
+        return {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+    finally:
+        conn.close()
+
+
+def _store_object(data: bytes, sha: str) -> bool:
+    target = _object_path(sha)
+    if os.path.exists(target):
+        return False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Erst in eine temporäre Datei schreiben, damit keine halben Objekte entstehen
+    with open(target + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(target + ".tmp", target)
+    return True
+
+
+def _store_file(path) -> tuple:
+    """Legt eine Datei blockweise im Objektspeicher ab; liefert (sha256, Blöcke, kopierte Bytes)."""
+    digest = hashlib.sha256()
+    chunks = []
+    copied = 0
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(OBJECT_CHUNK_SIZE), b""):
+            digest.update(data)
+            sha = hashlib.sha256(data).hexdigest()
+            if _store_object(data, sha):
+                copied += len(data)
+            chunks.append(sha)
+    if not chunks:
+        # Leere Datei: ein leeres Objekt, damit Wiederherstellung und Prüfung einheitlich bleiben
+        chunks.append(digest.hexdigest())
+        _store_object(b"", chunks[0])
+    return digest.hexdigest(), chunks, copied
+
+
+def _objects(entry) -> list:
+    # Einteilige Dateien (und Manifeste ohne "chunks") liegen unter ihrer eigenen Prüfsumme
+    return entry.get("chunks") or [entry["sha256"]]
+
+
+def _iter_files(directory):
+    for root, _, names in os.walk(directory):
+        for name in names:
+            yield os.path.join(root, name)
+
+
+def _snapshot_partitions(snapshot_dir) -> tuple:
+    """Sichert die Geschäftsjahres-Dateien (eingebunden und ausgehängt) inhaltsadressiert.
+
+    VACUUM INTO erzeugt für unveränderte Daten byteidentische Dateien; abgeschlossene Jahre
+    werden daher nur beim ersten Backup nach einer Änderung kopiert.
+    """
+    partitions = []
+    copied = 0
+    for path in sorted(_iter_files(PARTITION_DIR)):
+        if not PARTITION_FILE.match(os.path.basename(path)):
+            continue
+        tmp_path = os.path.join(snapshot_dir, "partition.tmp")
+        _snapshot_database(tmp_path, path)
+        sha = _sha256(tmp_path)
+        entry = {"path": path, "size": os.path.getsize(tmp_path), "sha256": sha, "tables": _table_counts(tmp_path)}
+        target = _object_path(sha)
+        if os.path.exists(target):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_path, target)
+            copied += 1
+        partitions.append(entry)
+    return partitions, copied
+
+
+def _load_previous_manifest():
+    snapshots_dir = os.path.join(BACKUP_DIR, "snapshots")
+    if not os.path.isdir(snapshots_dir):
+        return None
+    for name in sorted(os.listdir(snapshots_dir), reverse=True):
+        manifest = os.path.join(snapshots_dir, name, "manifest.json")
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                return json.load(f)
+    return None
+
+
+def create_backup() -> dict:
+    """Erstellt einen Snapshot der Datenbank und sichert die referenzierten Dokumente inkrementell."""
+    started = time.perf_counter()
+    name = datetime.now().strftime("%Y%m%d%H%M%S")
+    snapshot_dir = os.path.join(BACKUP_DIR, "snapshots", name)
+    # Mehrere Backups in derselben Sekunde: Zähler anhängen (sortiert weiterhin chronologisch)
+    suffix = 1
+    while os.path.exists(snapshot_dir):
+        snapshot_dir = os.path.join(BACKUP_DIR, "snapshots", f"{name}_{suffix}")
+        suffix += 1
+    name = os.path.basename(snapshot_dir)
+    os.makedirs(snapshot_dir)
+
+    db_target = os.path.join(snapshot_dir, "contracts.db")
+    # Die Kompaktierung löscht Originale nach dem Packen; währenddessen nicht sichern
+    with archive._compaction_lock():
+        documents, packs = _snapshot_with_documents(db_target)
+        partitions, copied_partitions = _snapshot_partitions(snapshot_dir)
+        db_seconds = time.perf_counter() - started
+
+        # Hashes aus dem letzten Manifest wiederverwenden, solange Größe und mtime unverändert sind
+        previous = _load_previous_manifest() or {"files": []}
+        known = {(f["path"], f["size"], f["mtime"]): f for f in previous["files"]}
+
+        files = []
+        missing = []
+        copied_bytes = 0
+        copied_files = 0
+        for path in sorted(documents | packs):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                missing.append(path)
+                continue
+            entry = {"path": path, "size": st.st_size, "mtime": st.st_mtime}
+            reused = known.get((path, st.st_size, st.st_mtime))
+            if reused and all(os.path.exists(_object_path(sha)) for sha in _objects(reused)):
+                entry["sha256"] = reused["sha256"]
+                if reused.get("chunks"):
+                    entry["chunks"] = reused["chunks"]
+            else:
+                entry["sha256"], chunks, copied = _store_file(path)
+                if len(chunks) > 1:
+                    entry["chunks"] = chunks
+                if copied:
+                    copied_bytes += copied
+                    copied_files += 1
+            files.append(entry)
+
+    manifest = {
+        "name": name,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "database": {
+            "file": "contracts.db",
+            "size": os.path.getsize(db_target),
+            "sha256": _sha256(db_target),
+            "tables": _table_counts(db_target),
+        },
+        "partitions": partitions,
+        "files": files,
+        "missing": missing,
+    }
+    with open(os.path.join(snapshot_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return {
+        "snapshot": name,
+        "database_bytes": manifest["database"]["size"],
+        "database_seconds": round(db_seconds, 3),
+        "partitions": len(partitions),
+        "copied_partitions": copied_partitions,
+        "documents": len(files),
+        "documents_bytes": sum(f["size"] for f in files),
+        "missing_documents": missing,
+        "copied_files": copied_files,
+        "copied_bytes": copied_bytes,
+        "duration_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def restore_backup(name: str, target_dir: str) -> dict:
+    """Stellt einen Snapshot in target_dir wieder her (contracts.db plus Geschäftsjahre und Dokumente relativ zu DATA_DIR)."""
+    snapshot_dir = os.path.join(BACKUP_DIR, "snapshots", name)
+    with open(os.path.join(snapshot_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    os.makedirs(target_dir, exist_ok=True)
+    shutil.copyfile(os.path.join(snapshot_dir, manifest["database"]["file"]), os.path.join(target_dir, "contracts.db"))
+    # Ältere Manifeste kennen noch keine Partitionen
+    for entry in manifest.get("partitions", []) + manifest["files"]:
+        target = os.path.join(target_dir, os.path.relpath(entry["path"], DATA_DIR))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as out:
+            for sha in _objects(entry):
+                with open(_object_path(sha), "rb") as f:
+                    shutil.copyfileobj(f, out, CHUNK_SIZE)
+    return manifest
+
+
+def verify_backup(name: str) -> dict:
+    """Prüft Snapshot und Objektspeicher gegen das Manifest, ohne wiederherzustellen.
+
+    Jedes Objekt wird einmal gehasht, auch wenn mehrere Dokumente darauf verweisen.
+    """
+    started = time.perf_counter()
+    errors = []
+    snapshot_dir = os.path.join(BACKUP_DIR, "snapshots", name)
+    with open(os.path.join(snapshot_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    db_path = os.path.join(snapshot_dir, manifest["database"]["file"])
+    if _sha256(db_path) != manifest["database"]["sha256"]:
+        errors.append("database checksum mismatch")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        errors.append(f"database integrity_check: {result}")
+    if _table_counts(db_path) != manifest["database"]["tables"]:
+        errors.append("table row counts differ from manifest")
+
+    checked = {}
+
+    def object_ok(sha):
+        if sha not in checked:
+            path = _object_path(sha)
+            checked[sha] = os.path.exists(path) and _sha256(path) == sha
+        return checked[sha]
+
+    for entry in manifest.get("partitions", []):
+        if not object_ok(entry["sha256"]):
+            errors.append(f"checksum mismatch: {entry['path']}")
+        elif _table_counts(_object_path(entry["sha256"])) != entry["tables"]:
+            errors.append(f"table row counts differ from manifest: {entry['path']}")
+
+    for entry in manifest["files"]:
+        if not all(object_ok(sha) for sha in _objects(entry)):
+            errors.append(f"checksum mismatch: {entry['path']}")
+
+    return {
+        "snapshot": name,
+        "ok": not errors,
+        "errors": errors,
+        # Schon beim Backup fehlende Dokumente (verwaiste Verweise, siehe app.integrity) sind kein Backup-Fehler
+        "missing": manifest.get("missing", []),
+        "documents": len(manifest["files"]),
+        "objects_checked": len(checked),
+        "duration_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+if __name__ == "__main__":
+    # docker-compose exec backend python -m app.backup [verify <snapshot> | restore <snapshot> <ziel>]
+    parser = argparse.ArgumentParser(description="Online-Backup für contracts.db und Dokumente")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("create")
+    verify_parser = subparsers.add_parser("verify")
+    verify_parser.add_argument("snapshot")
+    restore_parser = subparsers.add_parser("restore")
+    restore_parser.add_argument("snapshot")
+    restore_parser.add_argument("target")
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "verify":
+        print(json.dumps(verify_backup(args.snapshot), indent=2))
+    elif args.command == "restore":
+        restore_backup(args.snapshot, args.target)
+        print(f"Snapshot {args.snapshot} nach {args.target} wiederhergestellt.")
+    else:
+        report = create_backup()
+        print(json.dumps(report, indent=2))
+        print(json.dumps(verify_backup(report["snapshot"]), indent=2))
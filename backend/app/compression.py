@@ -0,0 +1,26 @@
+import os
+
+from starlette.middleware.gzip import GZipMiddleware
+
+# Kleine Antworten lohnen die Kompression nicht; Stufe 5 statt 9 spart CPU bei kaum größerer Ausgabe
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+
+
+class CompressionMiddleware:
+    """GZip für API-Antworten ab GZIP_MINIMUM_SIZE Bytes.
+
+    Ausgenommen sind der Server-Sent-Events-Stream (GZipMiddleware puffert Streams, Ereignisse
+    kämen verspätet an) und Dokument-Downloads (PDFs und Scans sind bereits komprimiert).
+    """
+
+    def __init__(self, app, minimum_size: int = GZIP_MINIMUM_SIZE, compresslevel: int = GZIP_LEVEL):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path == "/changes/stream" or path.endswith("/document"):
+            await self.app(scope, receive, send)
+            return
+        await self.gzip(scope, receive, send)
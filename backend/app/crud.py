@@ -0,0 +1,86 @@
+import json
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import duplicates
+from .models import ChangeLog, Invoice
+
+VAT_FACTOR = 1.19  # 19 % USt.
+
+
+def row_to_dict(obj) -> dict:
+    return jsonable_encoder({column.name: getattr(obj, column.name) for column in obj.__table__.columns})
+
+
+def record_change(db: Session, entity: str, operation: str, obj):
+    """Merkt eine Änderung für das Änderungsprotokoll vor; vor dem Commit aufrufen.
+
+    Die Einträge werden erst beim Commit geschrieben (ein Flush für alle vorgemerkten Objekte,
+    danach die ChangeLog-Zeilen in derselben Transaktion). Bei "delete" wird der letzte Stand
+    sofort festgehalten, da das Objekt nach dem Flush nicht mehr geladen werden kann.
+    """
+    payload = json.dumps(row_to_dict(obj)) if operation == "delete" else None
+    db.info.setdefault("pending_changes", []).append((entity, operation, obj, payload))
+
+
+@event.listens_for(Session, "before_commit")
+def _write_change_log(db: Session):
+    pending = db.info.pop("pending_changes", None)
+    if not pending:
+        return
+    # Ein Flush vergibt IDs und Versionen aller vorgemerkten Objekte (Bulk-Pfade: nicht einer je Objekt)
+    db.flush()
+    now = datetime.now()
+    db.add_all([
+        ChangeLog(
+            entity=entity,
+            entity_id=obj.id,
+            operation=operation,
+            payload=payload or json.dumps(row_to_dict(obj)),
+            created_at=now,
+        )
+        for entity, operation, obj, payload in pending
+    ])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_change_log(db: Session):
+    db.info.pop("pending_changes", None)
+
+
+def get_changes(db: Session, since: int = 0, limit: int = 500):
+    return (
+        db.query(ChangeLog)
+        .filter(ChangeLog.seq > since)
+        .order_by(ChangeLog.seq)
+        .limit(limit)
+        .all()
+    )
+
+
+def change_to_dict(change: ChangeLog) -> dict:
+    return {
+        "seq": change.seq,
+        "entity": change.entity,
+        "entity_id": change.entity_id,
+        "operation": change.operation,
+        "payload": json.loads(change.payload) if change.payload else None,
+        "created_at": change.created_at.isoformat(),
+    }
+
+
+def create_invoice(db: Session, invoice, key: str = None, amount_gross: float = None) -> Invoice:
+    # Gemeinsamer Pfad für Einzelanlage und Import; committet nicht
+    db_invoice = Invoice(
+        **invoice.dict(),
+        amount_gross=amount_gross if amount_gross is not None else invoice.amount_net * VAT_FACTOR,
+        dedup_key=key or duplicates.dedup_key(
+            invoice.invoice_number, invoice.cost_center, invoice.amount_net, invoice.invoice_date
+        ),
+    )
+    db.add(db_invoice)
+    record_change(db, "invoice", "create", db_invoice)
+    return db_invoice
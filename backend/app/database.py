@@ -1,14 +1,92 @@
-from sqlalchemy import create_engine
+import os
+import re
+import threading
+import time
+from sqlalchemy import create_engine, event, exc
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-# Pfad zur Datenbank im Container (wird via Volume gemountet)
-SQLALCHEMY_DATABASE_URL = "sqlite:////app/data/contracts.db"
+# Datenverzeichnis im Container (wird via Volume gemountet); per DATA_DIR überschreibbar, z. B. für Benchmarks
+DATA_DIR = os.getenv("DATA_DIR", "/app/data")
+
+# Pfad zur Datenbank
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{DATA_DIR}/contracts.db"
+
+# Ablage für hochgeladene Dokumente und gepackte Archive (Cold Storage)
+DOCUMENT_DIR = os.path.join(DATA_DIR, "documents")
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+# Abgeschlossene Geschäftsjahre von Rechnungen und Ausgaben (eine SQLite-Datei je Jahr, siehe partitions.py)
+PARTITION_DIR = os.path.join(DATA_DIR, "partitions")
+PARTITION_FILE = re.compile(r"^fy(\d{4})\.db$")
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False}  # Wichtig für SQLite
 )
+
+# Änderungszähler der Jahresdateien: partitions.py erhöht ihn bei attach/detach/archive, sodass das
+# Auschecken einer Verbindung nur eine Zahl vergleicht statt das Verzeichnis zu lesen
+PARTITION_RECHECK_SECONDS = 1.0
+_partition_lock = threading.Lock()
+_partition_generation = 0
+_partition_dir_mtime = None
+_partition_dir_checked = float("-inf")
+
+def partition_files() -> tuple:
+    try:
+        names = os.listdir(PARTITION_DIR)
+    except FileNotFoundError:
+        return ()
+    return tuple(sorted(name for name in names if PARTITION_FILE.match(name)))
+
+def partitions_changed():
+    # Nach dem Anlegen, Verschieben oder Einbinden einer Jahresdatei aufrufen
+    global _partition_generation
+    with _partition_lock:
+        _partition_generation += 1
+
+def partition_generation() -> int:
+    # Änderungen anderer Prozesse (z. B. `python -m app.partitions archive`) höchstens einmal pro Sekunde
+    # über die mtime des Verzeichnisses erkennen
+    global _partition_generation, _partition_dir_mtime, _partition_dir_checked
+    now = time.monotonic()
+    if now - _partition_dir_checked >= PARTITION_RECHECK_SECONDS:
+        with _partition_lock:
+            _partition_dir_checked = now
+            try:
+                mtime = os.stat(PARTITION_DIR).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime != _partition_dir_mtime:
+                _partition_dir_mtime = mtime
+                _partition_generation += 1
+    return _partition_generation
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL: Leser (z. B. Online-Backups) blockieren keine Schreiber und umgekehrt
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    # Archivierte Geschäftsjahre als Schema "fyJJJJ" einbinden; Stand vor dem Lesen des Verzeichnisses merken
+    connection_record.info["partition_generation"] = partition_generation()
+    for name in partition_files():
+        cursor.execute(f"ATTACH DATABASE ? AS {name[:-3]}", (os.path.join(PARTITION_DIR, name),))
+    cursor.close()
+
+@event.listens_for(engine, "checkout")
+def _check_partitions(dbapi_connection, connection_record, connection_proxy):
+    # Wurde seither ein Jahr archiviert oder ausgehängt, Verbindung neu aufbauen
+    if connection_record.info.get("partition_generation") != partition_generation():
+        raise exc.DisconnectionError("partition set changed")
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+
+def init_db():
+    """Legt Schema und Datenverzeichnisse an; beim Serverstart und in jedem Kommandozeilenwerkzeug aufrufen."""
+    from . import models  # noqa: F401  (registriert die Tabellen an Base)
+    Base.metadata.create_all(bind=engine)
+    os.makedirs(DOCUMENT_DIR, exist_ok=True)
@@ -0,0 +1,127 @@
+import hashlib
+import re
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from . import partitions
+from .models import Invoice
+
+# SQLite erlaubt nur eine begrenzte Zahl an Parametern pro Abfrage
+CHUNK_SIZE = 500
+
+
+def normalize_number(invoice_number: str) -> str:
+    # "R-2026/001", "r 2026 001" und "R2026001" gelten als dieselbe Rechnungsnummer
+    return re.sub(r"[^0-9A-Z]", "", (invoice_number or "").upper())
+
+
+def normalize_cost_center(cost_center: str) -> str:
+    return (cost_center or "").strip().upper()
+
+
+def dedup_key(invoice_number, cost_center, amount_net, invoice_date) -> str:
+    # Datums-Bucket = Monat: dieselbe Rechnung wird oft mit leicht abweichendem Buchungsdatum erfasst
+    raw = "|".join([
+        normalize_number(invoice_number),
+        normalize_cost_center(cost_center),
+        str(round((amount_net or 0) * 100)),
+        invoice_date.strftime("%Y-%m") if invoice_date else "",
+    ])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def find_existing(db: Session, keys, dates=None) -> dict:
+    """Bereits gespeicherte Rechnungen je Schlüssel (eine indizierte Abfrage pro Block und Geschäftsjahr).
+
+    Der Schlüssel enthält den Rechnungsmonat; mit den Rechnungsdaten (dates) werden nur die
+    Geschäftsjahre abgefragt, in denen ein Treffer liegen kann.
+    """
+    keys = list(set(keys))
+    dates = [day for day in dates or () if day]
+    date_range = (min(dates), max(dates)) if dates else (None, None)
+    existing = {}
+    for table in partitions.tables(db, Invoice.__table__, *date_range):
+        for i in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[i:i + CHUNK_SIZE]
+            for invoice_id, key in db.execute(select(table.c.id, table.c.dedup_key).where(table.c.dedup_key.in_(chunk))):
+                existing.setdefault(key, invoice_id)
+    return existing
+
+
+def backfill_keys(db: Session) -> int:
+    # Rechnungen aus der Zeit vor dem Duplikat-Index nachträglich mit Schlüssel versehen
+    rows = (
+        db.query(Invoice.id, Invoice.invoice_number, Invoice.cost_center, Invoice.amount_net, Invoice.invoice_date)
+        .filter(Invoice.dedup_key.is_(None))
+        .all()
+    )
+    if rows:
+        # Core-executemany statt bulk_update_mappings: abgeleiteter Wert, Zeilenversion bleibt unverändert
+        table = Invoice.__table__
+        db.connection().execute(
+            update(table).where(table.c.id == bindparam("_id")).values(dedup_key=bindparam("dedup_key")),
+            [
+                {"_id": row.id, "dedup_key": dedup_key(row.invoice_number, row.cost_center, row.amount_net, row.invoice_date)}
+                for row in rows
+            ],
+        )
+        db.commit()
+    return len(rows)
+
+
+def _find(parent, x):
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+
+def scan(db: Session) -> list:
+    """Clustert wahrscheinliche Duplikate über die ganze Tabelle ohne paarweisen Vergleich.
+
+    Jede Rechnung wird über mehrere Blocking-Schlüssel in Hash-Buckets einsortiert; Rechnungen,
+    die sich einen Bucket teilen, werden per Union-Find zu einem Cluster verbunden.
+    """
+    rows = []
+    for table in partitions.tables(db, Invoice.__table__):
+        rows.extend(db.execute(select(
+            table.c.id, table.c.invoice_number, table.c.invoice_date, table.c.cost_center, table.c.amount_net, table.c.dedup_key
+        )))
+    by_id = {row.id: row for row in rows}
+    parent = {row.id: row.id for row in rows}
+    reasons = {}
+    buckets = {}
+
+    for row in rows:
+        cost_center = normalize_cost_center(row.cost_center)
+        cents = round((row.amount_net or 0) * 100)
+        blocking_keys = [
+            ("same_number_amount_month", row.dedup_key),
+            ("same_number", (normalize_number(row.invoice_number), cost_center)),
+            ("same_amount_date", (cost_center, cents, row.invoice_date)),
+        ]
+        for reason, key in blocking_keys:
+            first = buckets.setdefault((reason, key), row.id)
+            if first == row.id:
+                continue
+            a, b = _find(parent, first), _find(parent, row.id)
+            if a != b:
+                parent[b] = a
+            reasons.setdefault(row.id, set()).add(reason)
+            reasons.setdefault(first, set()).add(reason)
+
+    clusters = {}
+    for invoice_id in reasons:
+        clusters.setdefault(_find(parent, invoice_id), []).append(invoice_id)
+
+    result = []
+    for members in clusters.values():
+        members.sort()
+        result.append({
+            "invoice_ids": members,
+            "invoice_numbers": sorted({by_id[m].invoice_number for m in members}),
+            "reasons": sorted(set().union(*(reasons[m] for m in members))),
+        })
+    result.sort(key=lambda cluster: cluster["invoice_ids"][0])
+    return result
@@ -0,0 +1,293 @@
+import argparse
+import io
+import os
+import re
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from xml.etree.ElementTree import ParseError, iterparse
+
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from . import crud, duplicates
+from .database import SessionLocal, init_db
+from .schemas import InvoiceCreate
+
+# Rechnungen werden in Blöcken committet statt einzeln
+BATCH_SIZE = 500
+WORKERS = int(os.getenv("EINVOICE_WORKERS", str(os.cpu_count() or 2)))
+DEFAULT_COST_CENTER = "EINGANG"
+
+# Pfade relativ zum Wurzelelement, jeweils als Folge lokaler Elementnamen (ohne Namespace).
+# UBL (XRechnung) und CII (XRechnung/ZUGFeRD/Factur-X) verwenden unterschiedliche Strukturen.
+UBL_FIELDS = {
+    "invoice_number": ("ID",),
+    "invoice_date": ("IssueDate",),
+    "contract_number": ("ContractDocumentReference", "ID"),
+    "cost_center": ("AccountingCost",),
+    "amount_net": ("LegalMonetaryTotal", "TaxExclusiveAmount"),
+    "amount_gross": ("LegalMonetaryTotal", "TaxInclusiveAmount"),
+}
+CII_SETTLEMENT = ("SupplyChainTradeTransaction", "ApplicableHeaderTradeSettlement")
+CII_FIELDS = {
+    "invoice_number": ("ExchangedDocument", "ID"),
+    "invoice_date": ("ExchangedDocument", "IssueDateTime", "DateTimeString"),
+    "contract_number": ("SupplyChainTradeTransaction", "ApplicableHeaderTradeAgreement", "ContractReferencedDocument", "IssuerAssignedID"),
+    "cost_center": CII_SETTLEMENT + ("ReceivableSpecifiedTradeAccountingAccount", "ID"),
+    "amount_net": CII_SETTLEMENT + ("SpecifiedTradeSettlementHeaderMonetarySummation", "TaxBasisTotalAmount"),
+    "amount_gross": CII_SETTLEMENT + ("SpecifiedTradeSettlementHeaderMonetarySummation", "GrandTotalAmount"),
+}
+# Positionen enthalten ebenfalls IDs und Beträge; sie werden beim Parsen übersprungen
+SKIPPED_ELEMENTS = {"InvoiceLine", "IncludedSupplyChainTradeLineItem"}
+
+
+class EInvoiceError(ValueError):
+    pass
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_xml(stream) -> dict:
+    """Liest die Kopfdaten einer XRechnung/ZUGFeRD-Rechnung inkrementell (iterparse).
+
+    Elemente werden nach der Verarbeitung sofort verworfen, sodass auch große Dateien mit
+    vielen Positionen nur wenig Speicher benötigen.
+    """
+    path = []
+    fields = None
+    values = {}
+    skip_depth = 0
+    try:
+        for event, element in iterparse(stream, events=("start", "end")):
+            name = _local(element.tag)
+            if event == "start":
+                if fields is None:
+                    # Wurzelelement bestimmt das Format
+                    if name == "Invoice":
+                        fields = UBL_FIELDS
+                    elif name == "CrossIndustryInvoice":
+                        fields = CII_FIELDS
+                    else:
+                        raise EInvoiceError(f"Unsupported root element: {name}")
+                else:
+                    path.append(name)
+                    if name in SKIPPED_ELEMENTS:
+                        skip_depth += 1
+                continue
+
+            if path:
+                if not skip_depth:
+                    current = tuple(path)
+                    for field, field_path in fields.items():
+                        if current == field_path and field not in values:
+                            values[field] = (element.text or "").strip()
+                if path[-1] in SKIPPED_ELEMENTS:
+                    skip_depth -= 1
+                path.pop()
+            element.clear()
+    except ParseError as e:
+        # ParseError ist ein SyntaxError und würde sonst am Fehlerbericht je Datei vorbeilaufen
+        raise EInvoiceError(f"Malformed XML: {e}")
+
+    if fields is None:
+        raise EInvoiceError("Empty document")
+    return values
+
+
+def _stream_payload(data: bytes, dictionary: bytes, start: int):
+    # Bevorzugt /Length, sofern direkt angegeben und danach wirklich "endstream" folgt
+    length = re.search(rb"/Length\s+(\d+)", dictionary)
+    if length:
+        end = start + int(length.group(1))
+        if re.match(rb"\s*endstream", data[end:end + 32]):
+            return data[start:end]
+    end = data.find(b"endstream", start)
+    if end < 0:
+        return None
+    # Sonst nur das eine Zeilenende vor "endstream" abschneiden; komprimierte Daten dürfen selbst auf \r oder \n enden
+    if data[end - 2:end] == b"\r\n":
+        end -= 2
+    elif data[end - 1:end] in (b"\r", b"\n"):
+        end -= 1
+    return data[start:end]
+
+
+def extract_xml_from_pdf(data: bytes) -> bytes:
+    """Sucht die eingebettete Rechnungs-XML in einem PDF/A-3 (ZUGFeRD/Factur-X)."""
+    for match in re.finditer(rb"<<(.*?)>>\s*stream\r?\n", data, re.S):
+        dictionary = match.group(1)
+        if b"/EmbeddedFile" not in dictionary:
+            continue
+        start = match.end()
+        payload = _stream_payload(data, dictionary, start)
+        if payload is None:
+            continue
+        if b"/FlateDecode" in dictionary:
+            try:
+                # decompressobj ignoriert Bytes nach dem Ende des zlib-Datenstroms (z. B. Füllbytes)
+                payload = zlib.decompressobj().decompress(payload)
+            except zlib.error:
+                continue
+        if b"CrossIndustryInvoice" in payload[:2048] or b"<Invoice" in payload[:2048]:
+            return payload
+    raise EInvoiceError("No embedded e-invoice XML found in PDF")
+
+
+def _parse_date(value: str):
+    # UBL: YYYY-MM-DD, CII (Format 102): YYYYMMDD
+    for fmt in ("%Y-%m-%d", "%Y%m%d"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise EInvoiceError(f"Invalid invoice date: {value!r}")
+
+
+def parse_document(stream) -> dict:
+    """Parst eine XML- oder PDF-Datei (binäres, seekbares Dateiobjekt) und liefert die Felder für InvoiceCreate.
+
+    XML wird direkt aus dem Dateiobjekt per iterparse gelesen; PDFs werden vollständig gelesen,
+    da die eingebettete XML erst gesucht werden muss.
+    """
+    head = stream.read(5)
+    stream.seek(0)
+    if head == b"%PDF-":
+        stream = io.BytesIO(extract_xml_from_pdf(stream.read()))
+    values = parse_xml(stream)
+
+    if not values.get("invoice_number") or not values.get("invoice_date") or not values.get("amount_net"):
+        raise EInvoiceError("Missing invoice number, date or net amount")
+    invoice_date = _parse_date(values["invoice_date"])
+    try:
+        parsed = {
+            "invoice_number": values["invoice_number"],
+            "invoice_date": invoice_date,
+            "contract_number": values.get("contract_number") or None,
+            "cost_center": values.get("cost_center") or DEFAULT_COST_CENTER,
+            "amount_net": float(values["amount_net"]),
+            "amount_gross": float(values["amount_gross"]) if values.get("amount_gross") else None,
+        }
+        # Schon hier validieren, damit eine fehlerhafte Datei nicht erst beim Speichern den ganzen Block abbricht
+        InvoiceCreate(**{k: v for k, v in parsed.items() if k != "amount_gross"})
+    except (ValueError, ValidationError) as e:
+        raise EInvoiceError(f"Invalid invoice data: {e}")
+    return parsed
+
+
+def _parse_file(path: str):
+    # Läuft im Worker-Prozess; Fehler werden als Ergebnis zurückgegeben statt geworfen
+    try:
+        with open(path, "rb") as f:
+            return path, parse_document(f), None
+    except (OSError, ValueError, SyntaxError) as e:
+        return path, None, str(e)
+
+
+def _store(db: Session, parsed: dict, key: str):
+    invoice = InvoiceCreate(**{k: v for k, v in parsed.items() if k != "amount_gross"})
+    # Bruttobetrag aus der E-Rechnung übernehmen (kann von 19 % abweichen, z. B. bei 7 % USt.)
+    return crud.create_invoice(db, invoice, key, amount_gross=parsed["amount_gross"])
+
+
+def ingest_parsed(db: Session, parsed_documents, allow_duplicates: bool = False) -> dict:
+    """Schreibt bereits geparste Rechnungen blockweise in die Datenbank."""
+    report = {"imported": 0, "duplicates": 0, "errors": []}
+    seen = set()
+    batch = []
+
+    def flush():
+        keys = [
+            duplicates.dedup_key(p["invoice_number"], p["cost_center"], p["amount_net"], p["invoice_date"])
+            for _, p in batch
+        ]
+        existing = {} if allow_duplicates else duplicates.find_existing(db, keys, [p["invoice_date"] for _, p in batch])
+        for (name, parsed), key in zip(batch, keys):
+            if not allow_duplicates and (key in existing or key in seen):
+                report["duplicates"] += 1
+                continue
+            seen.add(key)
+            _store(db, parsed, key)
+            report["imported"] += 1
+        db.commit()
+        batch.clear()
+
+    for name, parsed, error in parsed_documents:
+        if error:
+            report["errors"].append({"file": name, "error": error})
+            continue
+        batch.append((name, parsed))
+        if len(batch) >= BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+    return report
+
+
+def ingest_files(paths, allow_duplicates: bool = False, workers: int = WORKERS) -> dict:
+    """Parst Dateien parallel in einem Prozesspool und importiert sie mit Batch-Commits."""
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_parse_file, paths, chunksize=32)
+            report = ingest_parsed(db, results, allow_duplicates)
+    finally:
+        db.close()
+    elapsed = time.perf_counter() - started
+    report["files"] = len(paths)
+    report["duration_seconds"] = round(elapsed, 3)
+    report["files_per_second"] = round(len(paths) / elapsed, 1) if elapsed else None
+    return report
+
+
+def import_inbox(directory: str, allow_duplicates: bool = False) -> dict:
+    """Importiert alle Dateien eines Eingangsverzeichnisses; verarbeitete Dateien wandern nach done/ bzw. failed/."""
+    done_dir = os.path.join(directory, "done")
+    failed_dir = os.path.join(directory, "failed")
+    os.makedirs(done_dir, exist_ok=True)
+    os.makedirs(failed_dir, exist_ok=True)
+    paths = sorted(
+        entry.path for entry in os.scandir(directory)
+        if entry.is_file() and entry.name.lower().endswith((".xml", ".pdf"))
+    )
+    if not paths:
+        return None
+    report = ingest_files(paths, allow_duplicates)
+    failed = {error["file"] for error in report["errors"]}
+    for path in paths:
+        target = failed_dir if path in failed else done_dir
+        os.replace(path, os.path.join(target, os.path.basename(path)))
+    return report
+
+
+def watch(directory: str, interval: float = 5.0, allow_duplicates: bool = False):
+    """Überwacht ein Verzeichnis und importiert neue Dateien (siehe import_inbox)."""
+    while True:
+        report = import_inbox(directory, allow_duplicates)
+        if report:
+            print(report, flush=True)
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    # docker-compose exec backend python -m app.einvoice /app/data/inbox [--watch]
+    parser = argparse.ArgumentParser(description="Import von XRechnung/ZUGFeRD-Rechnungen")
+    parser.add_argument("directory")
+    parser.add_argument("--watch", action="store_true", help="Verzeichnis dauerhaft überwachen")
+    parser.add_argument("--interval", type=float, default=5.0)
+    parser.add_argument("--allow-duplicates", action="store_true")
+    args = parser.parse_args()
+
+    init_db()
+    if args.watch:
+        watch(args.directory, args.interval, args.allow_duplicates)
+    else:
+        files = sorted(
+            entry.path for entry in os.scandir(args.directory)
+            if entry.is_file() and entry.name.lower().endswith((".xml", ".pdf"))
+        )
+        print(ingest_files(files, args.allow_duplicates))
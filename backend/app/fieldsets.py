@@ -0,0 +1,67 @@
+"""Sparse Fieldsets für Listen- und Detailrouten.
+
+`?fields=id,partner,amount` wählt Spalten aus, die bereits in der SQL-Abfrage projiziert
+werden; lange Spalten wie `notes` werden dann gar nicht erst gelesen. `?include=` ergänzt
+optionale Teile (bei Budgets z. B. die Ausgaben). Ohne beide Parameter bleibt die Antwort
+unverändert.
+"""
+import json
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import HTTPException, Query
+from fastapi.responses import JSONResponse
+
+
+def allowed(model, schema) -> list:
+    # Spalten des Modells, die auch im Antwortschema stehen (in Tabellenreihenfolge)
+    return [column.name for column in model.__table__.columns if column.name in schema.__fields__]
+
+
+def selector(model, schema):
+    """Dependency für `fields`, mit Prüfung gegen die erlaubten Spalten."""
+    allowed_fields = allowed(model, schema)
+
+    def dependency(fields: Optional[str] = Query(None, description=f"Kommagetrennt, erlaubt: {', '.join(allowed_fields)}")):
+        if fields is None:
+            return None
+        names = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = names.difference(allowed_fields)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        # Die ID wird immer mitgeliefert (Auswahl in Tabellen, Folgeanfragen)
+        return [name for name in allowed_fields if name in names or name == "id"]
+
+    return dependency
+
+
+def includes(include: Optional[str], choices) -> Optional[set]:
+    if include is None:
+        return None
+    names = {name.strip() for name in include.split(",") if name.strip()}
+    unknown = names.difference(choices)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include: {', '.join(sorted(unknown))}")
+    return names
+
+
+def columns(table, names) -> list:
+    return [table.c[name] for name in names]
+
+
+def rows_to_dicts(rows, names) -> list:
+    return [dict(zip(names, row)) for row in rows]
+
+
+def _encode(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class SparseResponse(JSONResponse):
+    # Zeilen sind bereits auf die angefragten Spalten reduziert; keine erneute Validierung über das Antwortschema
+    def render(self, content) -> bytes:
+        return json.dumps(
+            content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_encode
+        ).encode("utf-8")
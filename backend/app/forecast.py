@@ -0,0 +1,114 @@
+import threading
+from datetime import date, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import partitions
+from .models import Budget, Expense
+
+# Ergebnis bleibt gültig, bis eine Ausgabe oder ein Budget geschrieben wird (oder der Tag wechselt)
+_lock = threading.Lock()
+_generation = 0
+_cache = {"generation": None, "today": None, "result": None}
+
+
+def invalidate():
+    global _generation
+    with _lock:
+        _generation += 1
+
+
+def _aggregate(db: Session):
+    # Ein einziger Durchlauf über alle Ausgaben (aller eingebundenen Geschäftsjahre): Summe und Anzahl je Budget per GROUP BY
+    expenses = partitions.source(db, Expense.__table__)
+    return (
+        db.query(
+            Budget.id,
+            Budget.contract_number,
+            Budget.initial_amount,
+            Budget.start_date,
+            Budget.end_date,
+            func.coalesce(func.sum(expenses.c.amount), 0.0).label("spent"),
+            func.count(expenses.c.id).label("expense_count"),
+        )
+        .outerjoin(expenses, expenses.c.budget_id == Budget.id)
+        .group_by(Budget.id)
+        .all()
+    )
+
+
+def _not_started(row, spent: float, initial: float) -> dict:
+    # Vor Laufzeitbeginn gibt es keine Burn-Rate; Vorauszahlungen zählen nur gegen den Restbetrag
+    remaining = initial - spent
+    return {
+        "budget_id": row.id,
+        "contract_number": row.contract_number,
+        "status": "not_started",
+        "initial_amount": initial,
+        "spent": round(spent, 2),
+        "remaining": round(remaining, 2),
+        "daily_burn_rate": 0.0,
+        "projected_spent_at_end": round(spent, 2),
+        "projected_remaining_at_end": round(remaining, 2),
+        "exhaustion_date": None,
+        "end_date": row.end_date,
+        "at_risk": remaining < 0,
+    }
+
+
+def _project(row, today: date) -> dict:
+    spent = row.spent or 0.0
+    initial = row.initial_amount or 0.0
+    if today < row.start_date:
+        return _not_started(row, spent, initial)
+    remaining = initial - spent
+
+    # Tägliche Burn-Rate über die bisher verstrichene Laufzeit (mindestens der Starttag)
+    elapsed_end = min(today, row.end_date)
+    elapsed_days = (elapsed_end - row.start_date).days + 1
+    burn_rate = spent / elapsed_days if row.expense_count and elapsed_days > 0 else 0.0
+    remaining_days = max((row.end_date - today).days, 0)
+
+    if remaining <= 0:
+        exhaustion_date = today if spent else None
+    elif burn_rate > 0:
+        exhaustion_date = today + timedelta(days=int(remaining / burn_rate))
+    else:
+        exhaustion_date = None
+
+    projected_spent = spent + burn_rate * remaining_days
+    at_risk = remaining < 0 or (
+        exhaustion_date is not None and today <= row.end_date and exhaustion_date < row.end_date
+    )
+    return {
+        "budget_id": row.id,
+        "contract_number": row.contract_number,
+        "status": "ended" if today > row.end_date else "active",
+        "initial_amount": initial,
+        "spent": round(spent, 2),
+        "remaining": round(remaining, 2),
+        "daily_burn_rate": round(burn_rate, 2),
+        "projected_spent_at_end": round(projected_spent, 2),
+        "projected_remaining_at_end": round(initial - projected_spent, 2),
+        "exhaustion_date": exhaustion_date,
+        "end_date": row.end_date,
+        "at_risk": at_risk,
+    }
+
+
+def budget_forecast(db: Session, today: date = None):
+    """Burn-Rate und voraussichtliches Erschöpfungsdatum für alle Budgets auf einmal."""
+    today = today or date.today()
+    with _lock:
+        generation = _generation
+        if _cache["generation"] == generation and _cache["today"] == today:
+            return _cache["result"]
+
+    result = [_project(row, today) for row in _aggregate(db)]
+
+    with _lock:
+        # Nur speichern, wenn zwischenzeitlich nichts geschrieben wurde
+        if _generation == generation:
+            _cache.update(generation=generation, today=today, result=result)
+    return result
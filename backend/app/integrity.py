@@ -0,0 +1,203 @@
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from .database import DOCUMENT_DIR, SessionLocal, init_db
+from .models import ArchivedDocument, Contract, DocumentChecksum
+
+SCAN_WORKERS = int(os.getenv("INTEGRITY_SCAN_WORKERS", "16"))
+# Frisch hochgeladene Dateien nicht löschen, solange der Commit noch laufen könnte
+GC_GRACE_SECONDS = 3600
+# Begrenzt die Länge der Pfadlisten im Bericht (Zähler sind immer vollständig)
+REPORT_LIMIT = 1000
+CHUNK_SIZE = 1024 * 1024
+
+
+class UnresolvedReferencesError(ValueError):
+    pass
+
+
+def _document_key(path):
+    """Pfad relativ zu DOCUMENT_DIR, damit Dateien und gespeicherte Verweise vergleichbar sind.
+
+    Contract.document_path enthält das DATA_DIR zum Zeitpunkt des Uploads (im Container /app/data). Liegt
+    der Pfad nicht unter dem aktuellen DOCUMENT_DIR, zählt der Teil hinter dem letzten gleichnamigen
+    Verzeichnis; lässt er sich so nicht zuordnen, ist das Ergebnis None.
+    """
+    path = os.path.normpath(path)
+    relative = os.path.relpath(path, DOCUMENT_DIR)
+    if relative != os.pardir and not relative.startswith(os.pardir + os.sep):
+        return relative
+    parts = path.split(os.sep)
+    name = os.path.basename(DOCUMENT_DIR)
+    positions = [i for i, part in enumerate(parts[:-1]) if part == name]
+    if not positions:
+        return None
+    return os.path.join(*parts[positions[-1] + 1:])
+
+
+def _keys(paths):
+    return {key for key in map(_document_key, paths) if key is not None}
+
+
+def _list_files(directory):
+    # Rekursiv über Unterverzeichnisse; stat() kommt bei scandir meist ohne extra Syscall aus
+    files = {}
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        files[entry.path] = (st.st_size, st.st_mtime)
+        except FileNotFoundError:
+            continue
+    return files
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return path, None
+    return path, digest.hexdigest()
+
+
+def _delete_checksums(db: Session, paths):
+    # In Blöcken löschen, um das Limit für SQL-Parameter von SQLite nicht zu überschreiten
+    for i in range(0, len(paths), 500):
+        chunk = paths[i:i + 500]
+        db.query(DocumentChecksum).filter(DocumentChecksum.path.in_(chunk)).delete(synchronize_session=False)
+
+
+def scan(db: Session, full: bool = False) -> dict:
+    """Gleicht Contract.document_path mit DOCUMENT_DIR ab und prüft Prüfsummen inkrementell.
+
+    Gehasht werden nur Dateien, deren Größe oder mtime sich seit dem letzten Scan geändert hat
+    (bei full=True alle Dateien, um stille Beschädigungen zu finden).
+    """
+    started = time.perf_counter()
+    files = _list_files(DOCUMENT_DIR)
+    references = {path for (path,) in db.query(Contract.document_path).filter(Contract.document_path.isnot(None))}
+    archived = {path for (path,) in db.query(ArchivedDocument.document_path)}
+    known = {
+        row.path: row for row in db.query(
+            DocumentChecksum.path, DocumentChecksum.size, DocumentChecksum.mtime, DocumentChecksum.sha256
+        )
+    }
+
+    to_hash = [
+        path for path, (size, mtime) in files.items()
+        if full or path not in known or known[path].size != size or known[path].mtime != mtime
+    ]
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+        hashes = dict(pool.map(_sha256, to_hash))
+
+    corrupted = []
+    now = datetime.now()
+    rows = []
+    for path, sha in hashes.items():
+        if sha is None:
+            continue
+        size, mtime = files[path]
+        previous = known.get(path)
+        # Gleiche Größe und mtime, aber anderer Inhalt: Datei wurde beschädigt
+        if previous and previous.size == size and previous.mtime == mtime and previous.sha256 != sha:
+            corrupted.append(path)
+        rows.append({"path": path, "size": size, "mtime": mtime, "sha256": sha, "checked_at": now})
+
+    if rows:
+        stmt = insert(DocumentChecksum)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[DocumentChecksum.path],
+            set_={c: stmt.excluded[c] for c in ("size", "mtime", "sha256", "checked_at")},
+        ), rows)
+    vanished = [path for path in known if path not in files]
+    _delete_checksums(db, vanished)
+    db.commit()
+
+    file_keys, reference_keys, archived_keys = _keys(files), _keys(references), _keys(archived)
+    orphans = sorted(path for path in files if _document_key(path) not in reference_keys)
+    dangling = sorted(
+        path for path in references
+        if _document_key(path) not in file_keys and _document_key(path) not in archived_keys
+    )
+    unreferenced_archive = sorted(path for path in archived if _document_key(path) not in reference_keys)
+    return {
+        "files": len(files),
+        "references": len(references),
+        "hashed": len(rows),
+        "orphan_count": len(orphans),
+        "orphans": orphans[:REPORT_LIMIT],
+        "dangling_count": len(dangling),
+        "dangling": dangling[:REPORT_LIMIT],
+        "corrupted_count": len(corrupted),
+        "corrupted": sorted(corrupted)[:REPORT_LIMIT],
+        "unreferenced_archive_count": len(unreferenced_archive),
+        "duration_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def collect_garbage(db: Session, dry_run: bool = True) -> dict:
+    """Löscht Dateien in DOCUMENT_DIR, auf die kein Vertrag mehr verweist.
+
+    Lässt sich kein einziger Verweis einer Datei oder einem Archiveintrag zuordnen, passt die Datenbank
+    offenbar nicht zu DOCUMENT_DIR; dann wird nichts gelöscht (UnresolvedReferencesError).
+    """
+    files = _list_files(DOCUMENT_DIR)
+    references = {path for (path,) in db.query(Contract.document_path).filter(Contract.document_path.isnot(None))}
+    reference_keys = _keys(references)
+    if references:
+        archived_keys = _keys(path for (path,) in db.query(ArchivedDocument.document_path))
+        if not reference_keys & (_keys(files) | archived_keys):
+            raise UnresolvedReferencesError(
+                f"None of the {len(references)} document references resolve under {DOCUMENT_DIR}; refusing to delete"
+            )
+    cutoff = time.time() - GC_GRACE_SECONDS
+    orphans = [
+        path for path, (_, mtime) in files.items()
+        if _document_key(path) not in reference_keys and mtime < cutoff
+    ]
+    freed = sum(files[path][0] for path in orphans)
+    if not dry_run:
+        for path in orphans:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        _delete_checksums(db, orphans)
+        db.commit()
+    return {
+        "dry_run": dry_run,
+        "removed_count": len(orphans),
+        "removed": sorted(orphans)[:REPORT_LIMIT],
+        "freed_bytes": freed,
+    }
+
+
+if __name__ == "__main__":
+    # docker-compose exec backend python -m app.integrity [--full] [--gc]
+    init_db()
+    db = SessionLocal()
+    try:
+        print(scan(db, full="--full" in sys.argv))
+        if "--gc" in sys.argv:
+            try:
+                print(collect_garbage(db, dry_run=False))
+            except UnresolvedReferencesError as e:
+                sys.exit(str(e))
+    finally:
+        db.close()
@@ -1,16 +1,29 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, BackgroundTasks, Query
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .models import Contract, Base, Budget, Expense, Invoice
-from .database import engine, SessionLocal
-from .schemas import ContractCreate, ContractResponse, BudgetCreate, BudgetResponse, ExpenseCreate, ExpenseResponse, InvoiceCreate, InvoiceResponse
+from fastapi.concurrency import run_in_threadpool
+from .models import Contract, Base, Budget, Expense, Invoice, PaymentSchedule
+from .database import engine, SessionLocal, DOCUMENT_DIR, init_db
+from . import archive, integrity, crud, forecast, schedule, duplicates, einvoice, partners, partitions, fieldsets, profiling, admission
+from .compression import CompressionMiddleware
+from .profiling import ProfilingMiddleware
+from .admission import AdmissionMiddleware
+from .schemas import ContractCreate, ContractResponse, BudgetCreate, BudgetUpdate, BudgetResponse, ExpenseCreate, ExpenseResponse, InvoiceCreate, InvoiceResponse, BudgetForecast, ScheduledPayment, CashFlowEntry, PartnerMatch
+from sqlalchemy import select
 from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.exc import StaleDataError
 import os
 import shutil
-from datetime import datetime
-from typing import List
+import mimetypes
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, date
+from typing import List, Optional
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
-from fastapi import Form 
+from fastapi import Form, Header
 
 # Pydantic-Modell für die direkte Eingabe (ohne "contract"-Wrapper)
 class DirectContractCreate(BaseModel):
@@ -22,15 +35,42 @@ class DirectContractCreate(BaseModel):
     amount: float
     category: str
     notes: str = None
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema und Verzeichnisse beim Start des Servers prüfen, nicht beim Import des Moduls
+    init_db()
+    db = SessionLocal()
+    try:
+        schedule.ensure_built(db)
+        duplicates.backfill_keys(db)
+        relinked = partners.ensure_linked(db)
+    finally:
+        db.close()
+    threading.Thread(target=partners.warm_index, daemon=True).start()
+    threading.Thread(target=_run_analytics, args=(relinked,), daemon=True).start()
+    yield
+
+def _run_analytics(rebuild: bool):
+    # pyarrow erst im Hintergrund importieren, damit der Server-Start nicht darauf wartet
+    from . import analytics
+    if rebuild:
+        analytics.invalidate()
+    analytics.run_refresh_loop()
 
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ProfilingMiddleware)
+# Abgelehnte Anfragen (413/429/503) erreichen weder Profiler noch Body-Parser
+app.add_middleware(AdmissionMiddleware)
+# Zuletzt hinzugefügt = äußerste Middleware: auch Ablehnungen tragen CORS-Header
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Profile-Id"],
 )
 
 # Healthcheck-Endpoint für Docker
@@ -38,10 +78,6 @@ app.add_middleware(
 async def health_check():
     return {"status": "healthy"}
 
-DOCUMENT_DIR = "/app/data/documents"  # ✅ Korrekt im Container
-
-os.makedirs(DOCUMENT_DIR, exist_ok=True)
-
 def get_db():
     db = SessionLocal()
     try:
@@ -49,8 +85,16 @@ def get_db():
     finally:
         db.close()
 
+# ?fields=... für Listen- und Detailrouten (app/fieldsets.py)
+contract_fields = fieldsets.selector(Contract, ContractResponse)
+budget_fields = fieldsets.selector(Budget, BudgetResponse)
+invoice_fields = fieldsets.selector(Invoice, InvoiceResponse)
+BUDGET_INCLUDES = ("expenses", "spent")
+
+# Uploads als normale Funktion: FastAPI führt sie im Threadpool aus, das Kopieren großer Scans
+# und die Datenbankarbeit blockieren so nicht die Event-Loop der übrigen Anfragen
 @app.post("/contracts/", response_model=ContractResponse)
-async def create_contract(
+def create_contract(
     # Daten direkt entgegenehmen (kein "contract"-Wrapper)
     contract_number: str = Form(None),
     partner: str = Form(...),
@@ -61,9 +105,13 @@ async def create_contract(
     amount: float = Form(...),
     category: str = Form(...),
     notes: str = Form(""),
+    payment_interval: str = Form(None),
     file: UploadFile = File(None),
     db: Session = Depends(get_db)
 ):
+    if payment_interval and payment_interval not in schedule.INTERVAL_MONTHS:
+        raise HTTPException(status_code=400, detail=f"Invalid payment_interval. Use one of: {', '.join(schedule.INTERVAL_MONTHS)}")
+
     # Parse date strings to date objects
     try:
         parsed_contract_date = datetime.strptime(contract_date, "%Y-%m-%d").date() if contract_date else None
@@ -82,7 +130,8 @@ async def create_contract(
         notice_period=notice_period,
         amount=amount,
         category=category,
-        notes=notes
+        notes=notes,
+        payment_interval=payment_interval or None
     )
 
     # Rest der Logik bleibt gleich
@@ -105,26 +154,48 @@ async def create_contract(
         amount=contract_data.amount,
         category=contract_data.category,
         document_path=document_path,
-        notes=contract_data.notes
+        notes=contract_data.notes,
+        payment_interval=contract_data.payment_interval
     )
     db.add(db_contract)
+    partners.link_contract(db, db_contract)
+    schedule.refresh_contract(db, db_contract)
+    crud.record_change(db, "contract", "create", db_contract)
     db.commit()
     db.refresh(db_contract)
     return db_contract
 
 @app.get("/contracts/", response_model=List[ContractResponse])
-async def get_contracts(db: Session = Depends(get_db)):
-    return db.query(Contract).all()
+async def get_contracts(
+    updated_since: Optional[datetime] = None,
+    partner_id: Optional[int] = None,
+    fields: Optional[list] = Depends(contract_fields),
+    db: Session = Depends(get_db),
+):
+    filters = []
+    if partner_id is not None:
+        filters.append(Contract.partner_id == partner_id)
+    if updated_since:
+        filters.append(Contract.updated_at >= updated_since)
+    if fields:
+        rows = db.execute(select(*fieldsets.columns(Contract.__table__, fields)).where(*filters))
+        return fieldsets.SparseResponse(fieldsets.rows_to_dicts(rows, fields))
+    return db.query(Contract).filter(*filters).all()
 
 @app.get("/contracts/{contract_id}", response_model=ContractResponse)
-async def get_contract(contract_id: int, db: Session = Depends(get_db)):
+async def get_contract(contract_id: int, fields: Optional[list] = Depends(contract_fields), db: Session = Depends(get_db)):
+    if fields:
+        row = db.execute(select(*fieldsets.columns(Contract.__table__, fields)).where(Contract.id == contract_id)).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Contract not found")
+        return fieldsets.SparseResponse(fieldsets.rows_to_dicts([row], fields)[0])
     contract = db.query(Contract).filter(Contract.id == contract_id).first()
     if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
     return contract
 
 @app.put("/contracts/{contract_id}", response_model=ContractResponse)
-async def update_contract(
+def update_contract(
     contract_id: int,
     contract_number: str = Form(None),
     partner: str = Form(...),
@@ -135,12 +206,18 @@ async def update_contract(
     amount: float = Form(...),
     category: str = Form(...),
     notes: str = Form(""),
+    payment_interval: str = Form(None),
+    version: int = Form(None),
     file: UploadFile = File(None),
     db: Session = Depends(get_db)
 ):
     contract = db.query(Contract).filter(Contract.id == contract_id).first()
     if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
+    if payment_interval and payment_interval not in schedule.INTERVAL_MONTHS:
+        raise HTTPException(status_code=400, detail=f"Invalid payment_interval. Use one of: {', '.join(schedule.INTERVAL_MONTHS)}")
+    if version is not None and version != contract.version:
+        raise HTTPException(status_code=409, detail="Contract was modified by someone else. Reload and try again.")
 
     # Parse date strings to date objects
     try:
@@ -159,7 +236,9 @@ async def update_contract(
     contract.amount = amount
     contract.category = category
     contract.notes = notes
+    contract.payment_interval = payment_interval or None
 
+    replaced_document_path = None
     if file:
         # Altes Dokument löschen, falls vorhanden (optional, hier nicht implementiert um Datenverlust zu vermeiden)
         # Neues speichern
@@ -169,9 +248,20 @@ async def update_contract(
         document_path = os.path.join(DOCUMENT_DIR, filename)
         with open(document_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
-        contract.document_path = document_path
+        replaced_document_path, contract.document_path = contract.document_path, document_path
 
-    db.commit()
+    try:
+        partners.link_contract(db, contract)
+        schedule.refresh_contract(db, contract)
+        crud.record_change(db, "contract", "update", contract)
+        if replaced_document_path:
+            db.flush()
+            archive.forget_document(db, replaced_document_path)
+        db.commit()
+    except StaleDataError:
+        # Gleichzeitige Änderung zwischen Lesen und Schreiben
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Contract was modified by someone else. Reload and try again.")
     db.refresh(contract)
     return contract
 
@@ -180,53 +270,209 @@ async def delete_contract(contract_id: int, db: Session = Depends(get_db)):
     contract = db.query(Contract).filter(Contract.id == contract_id).first()
     if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
+    crud.record_change(db, "contract", "delete", contract)
+    schedule.delete_contract(db, contract.id)
     db.delete(contract)
+    # Archiveintrag in derselben Transaktion entfernen, sonst bleibt er ohne Vertrag im Index stehen
+    db.flush()
+    archive.forget_document(db, contract.document_path)
     db.commit()
     return {"message": "Contract deleted successfully"}
 
+@app.get("/contracts/{contract_id}/payments", response_model=List[ScheduledPayment])
+async def get_contract_payments(contract_id: int, db: Session = Depends(get_db)):
+    return (
+        db.query(PaymentSchedule)
+        .filter(PaymentSchedule.contract_id == contract_id)
+        .order_by(PaymentSchedule.due_date)
+        .all()
+    )
+
+@app.get("/cashflow/", response_model=List[CashFlowEntry])
+async def get_cash_flow(date_from: Optional[date] = None, date_to: Optional[date] = None, db: Session = Depends(get_db)):
+    # Standard: laufender Monat plus die folgenden elf Monate
+    date_from = date_from or date.today().replace(day=1)
+    date_to = date_to or schedule.add_months(date_from, 11)
+    return schedule.cash_flow(db, date_from, date_to)
+
+@app.post("/cashflow/rebuild")
+def rebuild_payment_schedule(db: Session = Depends(get_db)):
+    return {"payments": schedule.rebuild_all(db)}
+
+# Normale Funktion: der erste Aufruf baut ggf. noch den Index auf und soll die Event-Loop nicht blockieren
+@app.get("/partners/autocomplete", response_model=List[PartnerMatch])
+def autocomplete_partners(q: str, limit: int = 10):
+    return partners.autocomplete(q, min(limit, 50))
+
+@app.post("/partners/dedupe")
+def dedupe_partners(db: Session = Depends(get_db)):
+    # Verträge neu den kanonischen Partnern zuordnen (z. B. nach Änderung der Normalisierungsregeln)
+    from . import analytics
+    result = partners.dedupe(db)
+    # Die Zuordnung läuft am Änderungsprotokoll vorbei: Analyse-Snapshot vollständig neu aufbauen
+    analytics.invalidate()
+    return result
+
 @app.get("/contracts/{contract_id}/document")
 async def get_contract_document(contract_id: int, db: Session = Depends(get_db)):
     contract = db.query(Contract).filter(Contract.id == contract_id).first()
     if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
-    if not contract.document_path or not os.path.exists(contract.document_path):
+    if not contract.document_path:
         raise HTTPException(status_code=404, detail="Document not found")
-    
-    return FileResponse(contract.document_path, filename=os.path.basename(contract.document_path))
+    filename = os.path.basename(contract.document_path)
+    if os.path.exists(contract.document_path):
+        return FileResponse(contract.document_path, filename=filename)
+
+    # Abgelaufene Verträge liegen ggf. komprimiert im Archiv
+    try:
+        data = archive.read_document(db, contract.document_path)
+    except archive.CorruptDocumentError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if data is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return Response(
+        content=data,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/archive/compact")
+async def compact_archive(background_tasks: BackgroundTasks):
+    background_tasks.add_task(archive.run_compaction)
+    return {"message": "Archive compaction started"}
+
+@app.get("/archive/stats")
+async def get_archive_stats(db: Session = Depends(get_db)):
+    return archive.archive_stats(db)
+
+# Blockierende Dateisystem-Scans als normale Funktionen, damit FastAPI sie im Threadpool ausführt
+@app.post("/integrity/scan")
+def scan_documents(full: bool = False, db: Session = Depends(get_db)):
+    return integrity.scan(db, full=full)
+
+@app.post("/integrity/gc")
+def collect_orphaned_documents(dry_run: bool = True, db: Session = Depends(get_db)):
+    try:
+        return integrity.collect_garbage(db, dry_run=dry_run)
+    except integrity.UnresolvedReferencesError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 @app.post("/budgets/", response_model=BudgetResponse)
 async def create_budget(budget: BudgetCreate, db: Session = Depends(get_db)):
     db_budget = Budget(**budget.dict())
     db.add(db_budget)
+    crud.record_change(db, "budget", "create", db_budget)
     db.commit()
+    forecast.invalidate()
     db.refresh(db_budget)
     return db_budget
 
+def _with_archived_expenses(db: Session, budgets: list, budget_id: int = None) -> list:
+    # Ausgaben archivierter Geschäftsjahre nur in der Antwort ergänzen; in budget.expenses würden sie neu eingefügt
+    archived = partitions.archived_expenses(db, budget_id)
+    if not archived:
+        return budgets
+    responses = []
+    for budget in budgets:
+        response = BudgetResponse.from_orm(budget)
+        response.expenses += [ExpenseResponse(**row) for row in archived.get(budget.id, [])]
+        responses.append(response)
+    return responses
+
+def _sparse_budgets(db: Session, fields: list, include: set, filters: list, budget_id: int = None) -> list:
+    # Nur die angefragten Budgetspalten; Ausgaben bzw. Verbrauch nur auf Anfrage
+    fields = fields or fieldsets.allowed(Budget, BudgetResponse)
+    budgets = fieldsets.rows_to_dicts(db.execute(select(*fieldsets.columns(Budget.__table__, fields)).where(*filters)), fields)
+    if "spent" in include:
+        # Aus der zwischengespeicherten Prognose statt einer eigenen Aggregation über alle Ausgaben
+        spent = {item["budget_id"]: item["spent"] for item in forecast.budget_forecast(db)}
+        for budget in budgets:
+            budget["spent"] = spent.get(budget["id"], 0.0)
+    if "expenses" in include:
+        names = fieldsets.allowed(Expense, ExpenseResponse)
+        expenses = {}
+        for table in partitions.tables(db, Expense.__table__):
+            query = select(*fieldsets.columns(table, names))
+            if budget_id is not None:
+                query = query.where(table.c.budget_id == budget_id)
+            for expense in fieldsets.rows_to_dicts(db.execute(query), names):
+                expenses.setdefault(expense["budget_id"], []).append(expense)
+        for budget in budgets:
+            budget["expenses"] = expenses.get(budget["id"], [])
+    return budgets
+
+def _changed_budgets(db: Session, updated_since: datetime):
+    # Budgets gelten auch als geändert, wenn eine ihrer Ausgaben geändert wurde (auch in archivierten Jahren)
+    expenses = partitions.source(db, Expense.__table__)
+    changed_expenses = select(expenses.c.budget_id).where(expenses.c.updated_at >= updated_since)
+    return (Budget.updated_at >= updated_since) | Budget.id.in_(changed_expenses)
+
 @app.get("/budgets/", response_model=List[BudgetResponse])
-async def get_budgets(db: Session = Depends(get_db)):
-    return db.query(Budget).options(joinedload(Budget.expenses)).all()
+async def get_budgets(
+    updated_since: Optional[datetime] = None,
+    fields: Optional[list] = Depends(budget_fields),
+    include: Optional[str] = Query(None, description="Kommagetrennt: expenses, spent"),
+    db: Session = Depends(get_db),
+):
+    filters = [_changed_budgets(db, updated_since)] if updated_since else []
+    include = fieldsets.includes(include, BUDGET_INCLUDES)
+    if fields or include is not None:
+        return fieldsets.SparseResponse(_sparse_budgets(db, fields, include or set(), filters))
+    query = db.query(Budget).options(joinedload(Budget.expenses)).filter(*filters)
+    return _with_archived_expenses(db, query.all())
+
+# Muss vor /budgets/{budget_id} stehen, sonst greift die Detail-Route
+@app.get("/budgets/forecast", response_model=List[BudgetForecast])
+async def get_budget_forecast(budget_id: Optional[int] = None, at_risk_only: bool = False, db: Session = Depends(get_db)):
+    result = forecast.budget_forecast(db)
+    if budget_id is not None:
+        result = [item for item in result if item["budget_id"] == budget_id]
+    if at_risk_only:
+        result = [item for item in result if item["at_risk"]]
+    return result
 
 @app.get("/budgets/{budget_id}", response_model=BudgetResponse)
-async def get_budget(budget_id: int, db: Session = Depends(get_db)):
+async def get_budget(
+    budget_id: int,
+    fields: Optional[list] = Depends(budget_fields),
+    include: Optional[str] = Query(None, description="Kommagetrennt: expenses, spent"),
+    db: Session = Depends(get_db),
+):
+    include = fieldsets.includes(include, BUDGET_INCLUDES)
+    if fields or include is not None:
+        budgets = _sparse_budgets(db, fields, include or set(), [Budget.id == budget_id], budget_id)
+        if not budgets:
+            raise HTTPException(status_code=404, detail="Budget not found")
+        return fieldsets.SparseResponse(budgets[0])
     budget = db.query(Budget).options(joinedload(Budget.expenses)).filter(Budget.id == budget_id).first()
     if not budget:
         raise HTTPException(status_code=404, detail="Budget not found")
-    return budget
+    return _with_archived_expenses(db, [budget], budget_id)[0]
 
 @app.put("/budgets/{budget_id}", response_model=BudgetResponse)
-async def update_budget(budget_id: int, budget: BudgetCreate, db: Session = Depends(get_db)):
+async def update_budget(budget_id: int, budget: BudgetUpdate, db: Session = Depends(get_db)):
     db_budget = db.query(Budget).filter(Budget.id == budget_id).first()
     if not db_budget:
         raise HTTPException(status_code=404, detail="Budget not found")
+    if budget.version is not None and budget.version != db_budget.version:
+        raise HTTPException(status_code=409, detail="Budget was modified by someone else. Reload and try again.")
     
     db_budget.contract_number = budget.contract_number
     db_budget.initial_amount = budget.initial_amount
     db_budget.start_date = budget.start_date
     db_budget.end_date = budget.end_date
     
-    db.commit()
+    try:
+        crud.record_change(db, "budget", "update", db_budget)
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Budget was modified by someone else. Reload and try again.")
+    forecast.invalidate()
     db.refresh(db_budget)
-    return db_budget
+    return _with_archived_expenses(db, [db_budget], budget_id)[0]
 
 @app.delete("/budgets/{budget_id}")
 async def delete_budget(budget_id: int, db: Session = Depends(get_db)):
@@ -234,40 +480,283 @@ async def delete_budget(budget_id: int, db: Session = Depends(get_db)):
     if not budget:
         raise HTTPException(status_code=404, detail="Budget not found")
     # Lösche zuerst alle zugehörigen Ausgaben
+    for expense in db.query(Expense).filter(Expense.budget_id == budget_id):
+        crud.record_change(db, "expense", "delete", expense)
     db.query(Expense).filter(Expense.budget_id == budget_id).delete()
+    for row in partitions.delete_archived(db, Expense.__table__, "budget_id", budget_id):
+        crud.record_change(db, "expense", "delete", Expense(**row))
+    crud.record_change(db, "budget", "delete", budget)
     db.delete(budget)
     db.commit()
+    forecast.invalidate()
     return {"message": "Budget deleted successfully"}
 
 @app.post("/expenses/", response_model=ExpenseResponse)
 async def create_expense(expense: ExpenseCreate, db: Session = Depends(get_db)):
     db_expense = Expense(**expense.dict())
     db.add(db_expense)
+    crud.record_change(db, "expense", "create", db_expense)
     db.commit()
+    forecast.invalidate()
     db.refresh(db_expense)
     return db_expense
 
 @app.post("/invoices/", response_model=InvoiceResponse)
-async def create_invoice(invoice: InvoiceCreate, db: Session = Depends(get_db)):
-    amount_gross = invoice.amount_net * 1.19  # Calculate gross (19% VAT)
-    db_invoice = Invoice(
-        **invoice.dict(),
-        amount_gross=amount_gross
-    )
-    db.add(db_invoice)
+async def create_invoice(invoice: InvoiceCreate, allow_duplicate: bool = False, db: Session = Depends(get_db)):
+    key = duplicates.dedup_key(invoice.invoice_number, invoice.cost_center, invoice.amount_net, invoice.invoice_date)
+    if not allow_duplicate:
+        existing = duplicates.find_existing(db, [key], [invoice.invoice_date])
+        if existing:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Possible duplicate invoice", "duplicate_of": existing[key]}
+            )
+    db_invoice = crud.create_invoice(db, invoice, key)
     db.commit()
     db.refresh(db_invoice)
     return db_invoice
 
+@app.post("/invoices/bulk")
+async def create_invoices_bulk(invoices: List[InvoiceCreate], allow_duplicates: bool = False, db: Session = Depends(get_db)):
+    # Jede Zeile wird per Hash-Schlüssel gegen die Datenbank und gegen die bisherigen Zeilen des Imports geprüft
+    keys = [
+        duplicates.dedup_key(invoice.invoice_number, invoice.cost_center, invoice.amount_net, invoice.invoice_date)
+        for invoice in invoices
+    ]
+    existing = {} if allow_duplicates else duplicates.find_existing(db, keys, [invoice.invoice_date for invoice in invoices])
+    seen = {}
+    created = []
+    skipped = []
+    for index, (invoice, key) in enumerate(zip(invoices, keys)):
+        if not allow_duplicates and (key in existing or key in seen):
+            skipped.append({
+                "index": index,
+                "invoice_number": invoice.invoice_number,
+                "duplicate_of": existing.get(key),
+                "duplicate_of_index": seen.get(key),
+            })
+            continue
+        seen[key] = index
+        created.append(crud.create_invoice(db, invoice, key))
+    db.commit()
+    return {"created": [invoice.id for invoice in created], "duplicates": skipped}
+
+@app.post("/invoices/import/einvoice")
+def import_einvoices(files: List[UploadFile] = File(...), allow_duplicates: bool = False, db: Session = Depends(get_db)):
+    # XRechnung/ZUGFeRD als XML oder PDF/A-3; große Bestände besser per "python -m app.einvoice <verzeichnis>"
+    started = time.perf_counter()
+    parsed = []
+    for upload in files:
+        try:
+            parsed.append((upload.filename, einvoice.parse_document(upload.file), None))
+        except ValueError as e:
+            parsed.append((upload.filename, None, str(e)))
+    report = einvoice.ingest_parsed(db, parsed, allow_duplicates)
+    report["files"] = len(files)
+    report["duration_seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+@app.get("/invoices/duplicates")
+def get_duplicate_invoices(db: Session = Depends(get_db)):
+    return duplicates.scan(db)
+
 @app.get("/invoices/", response_model=List[InvoiceResponse])
-async def get_invoices(db: Session = Depends(get_db)):
-    return db.query(Invoice).all()
+async def get_invoices(
+    updated_since: Optional[datetime] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    fields: Optional[list] = Depends(invoice_fields),
+    db: Session = Depends(get_db),
+):
+    # Hauptbestand plus nur die archivierten Geschäftsjahre, die den Zeitraum schneiden
+    result = []
+    for table in partitions.tables(db, Invoice.__table__, date_from, date_to):
+        query = select(*fieldsets.columns(table, fields)) if fields else select(table)
+        if updated_since:
+            query = query.where(table.c.updated_at >= updated_since)
+        if date_from:
+            query = query.where(table.c.invoice_date >= date_from)
+        if date_to:
+            query = query.where(table.c.invoice_date <= date_to)
+        result.extend(db.execute(query).all())
+    if fields:
+        return fieldsets.SparseResponse(fieldsets.rows_to_dicts(result, fields))
+    return result
 
 @app.delete("/invoices/{invoice_id}")
 async def delete_invoice(invoice_id: int, db: Session = Depends(get_db)):
     invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
-    if not invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
-    db.delete(invoice)
+    if invoice:
+        crud.record_change(db, "invoice", "delete", invoice)
+        db.delete(invoice)
+    else:
+        archived = partitions.delete_archived(db, Invoice.__table__, "id", invoice_id)
+        if not archived:
+            raise HTTPException(status_code=404, detail="Invoice not found")
+        crud.record_change(db, "invoice", "delete", Invoice(**archived[0]))
     db.commit()
     return {"message": "Invoice deleted successfully"}
+
+# Geschäftsjahre von Rechnungen und Ausgaben (app/partitions.py)
+@app.get("/partitions/")
+def get_partitions(db: Session = Depends(get_db)):
+    return partitions.status(db)
+
+@app.post("/partitions/{year}/archive")
+def archive_fiscal_year(year: int):
+    try:
+        return partitions.archive(year)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/partitions/{year}/detach")
+def detach_fiscal_year(year: int):
+    try:
+        partitions.detach(year)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    # Ausgehängte Jahre fließen weder in Budgets noch in Auswertungen ein
+    _partitions_changed()
+    return {"message": f"Fiscal year {year} detached"}
+
+@app.post("/partitions/{year}/attach")
+def attach_fiscal_year(year: int):
+    try:
+        partitions.attach(year)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _partitions_changed()
+    return {"message": f"Fiscal year {year} attached"}
+
+def _partitions_changed():
+    from . import analytics
+    forecast.invalidate()
+    analytics.invalidate()
+
+# Auswertungen aus dem spaltenorientierten Snapshot (app/analytics.py), nicht aus der Vertragsdatenbank.
+# Normale Funktionen: vektorisierte Arrow-Berechnungen laufen im Threadpool statt in der Event-Loop.
+@app.get("/reports/snapshot")
+def get_report_snapshot():
+    from . import analytics
+    return analytics.status()
+
+@app.post("/reports/snapshot/refresh")
+def refresh_report_snapshot(full: bool = False):
+    from . import analytics
+    if full:
+        analytics.invalidate()
+    analytics.refresh()
+    return analytics.status()
+
+@app.get("/reports/invoices/monthly")
+def report_invoices_by_month(date_from: Optional[date] = None, date_to: Optional[date] = None, cost_center: Optional[str] = None):
+    from . import analytics
+    return analytics.invoices_by_month(date_from, date_to, cost_center)
+
+@app.get("/reports/invoices/cost-centers")
+def report_invoices_by_cost_center(date_from: Optional[date] = None, date_to: Optional[date] = None):
+    from . import analytics
+    return analytics.invoices_by_cost_center(date_from, date_to)
+
+@app.get("/reports/partners/spend")
+def report_spend_by_partner(date_from: Optional[date] = None, date_to: Optional[date] = None, limit: int = 50):
+    from . import analytics
+    return analytics.spend_by_partner(date_from, date_to, limit)
+
+@app.get("/reports/budgets/utilization")
+def report_budget_utilization(limit: Optional[int] = None):
+    from . import analytics
+    return analytics.budget_utilization(limit)
+
+@app.get("/reports/contracts/categories")
+def report_contracts_by_category(active_on: Optional[date] = None):
+    from . import analytics
+    return analytics.contracts_by_category(active_on)
+
+# Change-Data-Capture: Abnehmer (ERP, Buchhaltung) holen nur Änderungen seit ihrer letzten Sequenznummer
+CHANGES_POLL_INTERVAL = 0.5  # Sekunden
+CHANGES_MAX_WAIT = 60  # Sekunden
+
+def _fetch_changes(since: int, limit: int):
+    # Eigene Session pro Abfrage, damit jeder Poll den aktuellen Stand sieht
+    db = SessionLocal()
+    try:
+        return [crud.change_to_dict(change) for change in crud.get_changes(db, since, limit)]
+    finally:
+        db.close()
+
+@app.get("/changes/")
+def get_changes(since: int = 0, limit: int = 500, wait: float = 0):
+    # Long-Polling: bis zu `wait` Sekunden auf neue Änderungen warten; normale Funktion, damit die
+    # SQLite-Abfragen im Threadpool statt in der Event-Loop laufen
+    deadline = time.monotonic() + min(wait, CHANGES_MAX_WAIT)
+    changes = _fetch_changes(since, limit)
+    while not changes and time.monotonic() < deadline:
+        time.sleep(CHANGES_POLL_INTERVAL)
+        changes = _fetch_changes(since, limit)
+    last_seq = changes[-1]["seq"] if changes else since
+    return {"changes": changes, "last_seq": last_seq}
+
+@app.get("/changes/stream")
+async def stream_changes(since: int = 0, last_event_id: str = Header(None)):
+    # Server-Sent Events; bei Reconnect setzt der Client über die letzte Event-ID wieder auf
+    if last_event_id and last_event_id.isdigit():
+        since = max(since, int(last_event_id))
+
+    async def event_stream():
+        last_seq = since
+        idle = 0.0
+        while True:
+            changes = await run_in_threadpool(_fetch_changes, last_seq, 500)
+            for change in changes:
+                last_seq = change["seq"]
+                yield f"id: {last_seq}\nevent: change\ndata: {json.dumps(change)}\n\n"
+            if changes:
+                idle = 0.0
+                continue
+            await asyncio.sleep(CHANGES_POLL_INTERVAL)
+            idle += CHANGES_POLL_INTERVAL
+            if idle >= 15:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+# Profiling einzelner Anfragen (app/profiling.py): Header "X-Profile: 1" oder hier vormerken
+@app.get("/admin/profiling")
+def get_profiling_status():
+    return profiling.status()
+
+@app.post("/admin/profiling")
+def arm_profiling(path: str, count: int = 1):
+    return profiling.arm(path, count)
+
+@app.delete("/admin/profiling")
+def disarm_profiling():
+    return profiling.disarm()
+
+@app.get("/admin/profiles")
+def get_profiles():
+    return profiling.profiles()
+
+@app.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: int, top: int = 25):
+    profile = profiling.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.report(top)
+
+@app.get("/admin/profiles/{profile_id}/flamegraph", response_class=PlainTextResponse)
+def get_profile_flamegraph(profile_id: int):
+    # Gefaltete Stacks, z. B. für flamegraph.pl oder https://www.speedscope.app
+    profile = profiling.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.collapsed()
+
+# Admission Control (app/admission.py): Auslastung und Ablehnungen je Spur
+@app.get("/admin/admission")
+def get_admission_status():
+    return admission.stats()
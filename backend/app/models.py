@@ -1,13 +1,26 @@
-from sqlalchemy import Column, Integer, String, Date, Float, Text, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Date, DateTime, Float, Text, ForeignKey
+from sqlalchemy.orm import relationship, declared_attr
+from datetime import datetime
 from .database import Base
 
-class Contract(Base):
+class VersionedMixin:
+    # Zeitstempel für inkrementelle Synchronisation (updated_since) und Zeilenversion für optimistisches Locking
+    created_at = Column(DateTime, default=datetime.now, index=True)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)
+    version = Column(Integer, nullable=False, default=1)
+
+    @declared_attr
+    def __mapper_args__(cls):
+        # SQLAlchemy erhöht die Version bei jedem UPDATE und prüft sie in der WHERE-Klausel
+        return {"version_id_col": cls.version}
+
+class Contract(VersionedMixin, Base):
     __tablename__ = "contracts"
 
     id = Column(Integer, primary_key=True, index=True)
     contract_number = Column(String, index=True, nullable=True)
     partner = Column(String, index=True)
+    partner_id = Column(Integer, ForeignKey("partners.id"), index=True, nullable=True)  # Normalisierter Vertragspartner
     contract_date = Column(Date, nullable=True)
     start_date = Column(Date)
     end_date = Column(Date)
@@ -16,8 +29,17 @@ class Contract(Base):
     category = Column(String)
     document_path = Column(String)
     notes = Column(Text)
+    payment_interval = Column(String, nullable=True)  # "monthly", "quarterly", "annual", "once"; leer = nach Kategorie
+
+class Partner(Base):
+    __tablename__ = "partners"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)                    # Kanonische Schreibweise (häufigste Variante der Verträge)
+    normalized = Column(String, index=True)  # Ohne Rechtsform, Satzzeichen und Wortreihenfolge
+    created_at = Column(DateTime, default=datetime.now)
 
-class Budget(Base):
+class Budget(VersionedMixin, Base):
     __tablename__ = "budgets"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -28,25 +50,75 @@ class Budget(Base):
     
     expenses = relationship("Expense", back_populates="budget")
 
-class Expense(Base):
+class Expense(VersionedMixin, Base):
     __tablename__ = "expenses"
 
     id = Column(Integer, primary_key=True, index=True)
-    budget_id = Column(Integer, ForeignKey("budgets.id"))
+    budget_id = Column(Integer, ForeignKey("budgets.id"), index=True)
     amount = Column(Float)
-    date = Column(Date)
+    date = Column(Date, index=True)  # Partitionsschlüssel (Geschäftsjahr, siehe partitions.py)
     description = Column(String, nullable=True)
 
     budget = relationship("Budget", back_populates="expenses")
 
-class Invoice(Base):
+class Invoice(VersionedMixin, Base):
     __tablename__ = "invoices"
 
     id = Column(Integer, primary_key=True, index=True)
     invoice_number = Column(String, index=True)
-    invoice_date = Column(Date)
+    invoice_date = Column(Date, index=True)  # Partitionsschlüssel (Geschäftsjahr, siehe partitions.py)
     contract_number = Column(String, nullable=True)
     cost_center = Column(String)
     amount_net = Column(Float)
     amount_gross = Column(Float)
+    dedup_key = Column(String, index=True)  # Hash aus normalisierter Nummer, Kostenstelle, Betrag und Monat
+
+
+class ArchivedDocument(Base):
+    __tablename__ = "archived_documents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_path = Column(String, unique=True, index=True)  # Ursprünglicher Pfad (Contract.document_path)
+    pack_file = Column(String)       # Dateiname des Archivpakets in ARCHIVE_DIR
+    offset = Column(Integer)         # Byte-Offset im Paket
+    stored_size = Column(Integer)    # Größe im Paket (ggf. komprimiert)
+    original_size = Column(Integer)
+    method = Column(String)          # "zlib" oder "store"
+    sha256 = Column(String)          # Prüfsumme des Originals
+    archived_at = Column(DateTime)
+
+class DocumentChecksum(Base):
+    __tablename__ = "document_checksums"
+
+    path = Column(String, primary_key=True)
+    size = Column(Integer)
+    mtime = Column(Float)
+    sha256 = Column(String)
+    checked_at = Column(DateTime)
+
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+    __table_args__ = {"sqlite_autoincrement": True}  # Sequenznummern werden nie wiederverwendet
+
+    seq = Column(Integer, primary_key=True)
+    entity = Column(String, index=True)     # "contract", "budget", "expense", "invoice"
+    entity_id = Column(Integer)
+    operation = Column(String)              # "create", "update", "delete"
+    payload = Column(Text)                  # Zeile als JSON (bei "delete" der letzte Stand)
+    created_at = Column(DateTime)
+
+class PaymentSchedule(Base):
+    __tablename__ = "payment_schedule"
+
+    id = Column(Integer, primary_key=True, index=True)
+    contract_id = Column(Integer, ForeignKey("contracts.id"), index=True)
+    due_date = Column(Date, index=True)
+    amount = Column(Float)
+
+class CashFlowMonth(Base):
+    __tablename__ = "cash_flow_months"
 
+    # Vorverdichtete Monatssummen des Zahlungsplans, werden bei jeder Vertragsänderung mitgepflegt
+    month = Column(String, primary_key=True)  # "YYYY-MM"
+    amount = Column(Float, default=0.0)
+    payments = Column(Integer, default=0)
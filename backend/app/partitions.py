@@ -0,0 +1,266 @@
+"""Partitionierung von Rechnungen und Ausgaben nach Geschäftsjahr.
+
+Offene Geschäftsjahre liegen in der Hauptdatenbank; jedes abgeschlossene Jahr kann in eine
+eigene SQLite-Datei PARTITION_DIR/fyJJJJ.db verschoben werden, die jede Verbindung per
+ATTACH als Schema "fyJJJJ" einbindet (siehe database.py). Neue Zeilen werden immer in der
+Hauptdatenbank angelegt, auch nachträglich erfasste Belege eines archivierten Jahres; ein
+erneuter Lauf von archive() zieht sie nach.
+
+Lesende Abfragen fragen die Hauptdatenbank und nur die Jahre ab, die den angefragten
+Zeitraum schneiden. Ausgehängte Jahre (PARTITION_DIR/detached) werden nicht mehr gelesen.
+
+SQLite garantiert im WAL-Modus keine Atomarität über mehrere Dateien hinweg. archive() kopiert
+deshalb erst in die Jahresdatei (synchron auf die Platte) und löscht danach in einem eigenen
+Commit im Hauptbestand. Bricht der Lauf dazwischen ab, gehen keine Zeilen verloren, sie stehen
+aber doppelt in beiden Dateien und werden von Listen und Summen doppelt gezählt, bis archive()
+erneut läuft (status() meldet sie als "pending").
+"""
+import argparse
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import MetaData, create_engine, event, func, insert, select, text, union_all
+from sqlalchemy.orm import Session
+
+from .database import Base, PARTITION_DIR, PARTITION_FILE, SessionLocal, init_db, partition_files, partitions_changed
+from .models import Expense, Invoice
+
+# Monat, in dem das Geschäftsjahr beginnt; das Jahr heißt nach dem Kalenderjahr seines Beginns
+FISCAL_YEAR_START_MONTH = int(os.getenv("FISCAL_YEAR_START_MONTH", "1"))
+DETACHED_DIR = os.path.join(PARTITION_DIR, "detached")
+# SQLite bindet standardmäßig höchstens 10 Datenbanken per ATTACH ein (SQLITE_MAX_ATTACHED)
+MAX_ATTACHED = 10
+
+# Partitionierte Tabellen und ihre Datumsspalte
+PARTITIONED = {Invoice.__table__: "invoice_date", Expense.__table__: "date"}
+SCHEMA_NAME = re.compile(r"^fy(\d{4})$")
+
+_lock = threading.Lock()
+_metadata = MetaData()
+
+
+def fiscal_year(day: date) -> int:
+    return day.year if day.month >= FISCAL_YEAR_START_MONTH else day.year - 1
+
+
+def fiscal_year_range(year: int) -> tuple:
+    start = date(year, FISCAL_YEAR_START_MONTH, 1)
+    return start, date(year + 1, FISCAL_YEAR_START_MONTH, 1) - timedelta(days=1)
+
+
+def partition_path(year: int, detached: bool = False) -> str:
+    return os.path.join(DETACHED_DIR if detached else PARTITION_DIR, f"fy{year}.db")
+
+
+def attached_years(db) -> list:
+    # Maßgeblich ist, was die Verbindung tatsächlich eingebunden hat, nicht der Verzeichnisinhalt (Session oder Connection)
+    years = []
+    for _, name, _ in db.execute(text("PRAGMA database_list")):
+        match = SCHEMA_NAME.match(name)
+        if match:
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+
+def partition_table(table, year: int):
+    # Gleiche Spalten wie die Haupttabelle, nur im Schema des Jahres
+    schema = f"fy{year}"
+    with _lock:
+        existing = _metadata.tables.get(f"{schema}.{table.name}")
+        return existing if existing is not None else table.to_metadata(_metadata, schema=schema)
+
+
+def tables(db: Session, table, date_from: date = None, date_to: date = None) -> list:
+    """Haupttabelle plus die eingebundenen Jahre, die den Zeitraum schneiden (Partition Pruning)."""
+    result = [table]
+    if table not in PARTITIONED:
+        return result
+    for year in attached_years(db):
+        start, end = fiscal_year_range(year)
+        if (date_from and date_from > end) or (date_to and date_to < start):
+            continue
+        result.append(partition_table(table, year))
+    return result
+
+
+def source(db: Session, table, date_from: date = None, date_to: date = None):
+    # Für Joins und Aggregationen: alle Partitionen als eine Tabelle (UNION ALL)
+    parts = tables(db, table, date_from, date_to)
+    if len(parts) == 1:
+        return table
+    return union_all(*(select(part) for part in parts)).subquery(f"all_{table.name}")
+
+
+def archived_expenses(db: Session, budget_id: int = None) -> dict:
+    """Ausgaben der eingebundenen Jahre je Budget (ohne budget_id: für alle Budgets)."""
+    grouped = defaultdict(list)
+    for part in tables(db, Expense.__table__)[1:]:
+        query = select(part)
+        if budget_id is not None:
+            query = query.where(part.c.budget_id == budget_id)
+        for row in db.execute(query).mappings():
+            grouped[row["budget_id"]].append(dict(row))
+    return grouped
+
+
+def delete_archived(db: Session, table, column: str, value) -> list:
+    """Löscht passende Zeilen aus den eingebundenen Jahren und liefert ihren letzten Stand (committet nicht)."""
+    deleted = []
+    for part in tables(db, table)[1:]:
+        condition = part.c[column] == value
+        rows = db.execute(select(part).where(condition)).mappings().all()
+        if rows:
+            db.execute(part.delete().where(condition))
+            deleted.extend(dict(row) for row in rows)
+    return deleted
+
+
+@event.listens_for(Session, "before_flush")
+def _keep_ids_unique(session, flush_context, instances):
+    # SQLite vergibt max(id) + 1 der Haupttabelle; wurde die höchste ID archiviert, würde sie erneut vergeben.
+    # Einmal je Flush zählen: before_insert läuft für alle Objekte, bevor das erste INSERT die Höchst-ID anhebt.
+    # Nötig nur bis zum ersten Flush nach archive(); danach liegt die Haupttabelle wieder vorn
+    pending = defaultdict(list)
+    for obj in session.new:
+        if isinstance(obj, (Invoice, Expense)) and obj.id is None:
+            pending[obj.__table__].append(obj)
+    if not pending:
+        return
+    connection = session.connection()
+    years = attached_years(connection)
+    if not years:
+        return
+    for table, objects in pending.items():
+        archived = max(connection.execute(select(func.max(partition_table(table, year).c.id))).scalar() or 0 for year in years)
+        current = connection.execute(select(func.max(table.c.id))).scalar() or 0
+        if archived > current:
+            for offset, obj in enumerate(objects, start=1):
+                obj.id = archived + offset
+
+
+def _create_partition(path: str):
+    # Unter temporärem Namen anlegen: andere Verbindungen sollen keine halb angelegte Datei einbinden
+    os.makedirs(PARTITION_DIR, exist_ok=True)
+    tmp_path = path + ".tmp"
+    partition_engine = create_engine(f"sqlite:///{tmp_path}")
+    try:
+        Base.metadata.create_all(partition_engine, tables=list(PARTITIONED))
+    finally:
+        partition_engine.dispose()
+    os.replace(tmp_path, path)
+    partitions_changed()
+
+
+def archive(year: int) -> dict:
+    """Verschiebt Rechnungen und Ausgaben eines abgeschlossenen Geschäftsjahrs in dessen Jahresdatei.
+
+    Wiederholbar: Zeilen werden per INSERT OR REPLACE kopiert und danach im Hauptbestand gelöscht.
+    Änderungen werden nicht protokolliert, da sich der logische Datenbestand nicht ändert.
+    """
+    if year >= fiscal_year(date.today()):
+        raise ValueError(f"Fiscal year {year} is not closed yet")
+    path = partition_path(year)
+    if not os.path.exists(path):
+        if os.path.exists(partition_path(year, detached=True)):
+            raise ValueError(f"Fiscal year {year} is detached; attach it first")
+        if len(partition_files()) >= MAX_ATTACHED:
+            raise ValueError(f"At most {MAX_ATTACHED} fiscal years can be attached; detach an older year first")
+        _create_partition(path)
+
+    start, end = fiscal_year_range(year)
+    schema = f"fy{year}"
+    moved = {}
+    # Neue Session: die Verbindung wird beim Auschecken mit der neuen Datei neu aufgebaut
+    db = SessionLocal()
+    try:
+        # Kopie vor dem Löschen dauerhaft schreiben (siehe Moduldokumentation)
+        db.execute(text(f"PRAGMA {schema}.synchronous=FULL"))
+        for table, column in PARTITIONED.items():
+            names = [c.name for c in table.columns]
+            db.execute(
+                insert(partition_table(table, year)).prefix_with("OR REPLACE").from_select(
+                    names, select(*(table.c[name] for name in names)).where(table.c[column].between(start, end))
+                )
+            )
+        db.commit()
+        for table, column in PARTITIONED.items():
+            moved[table.name] = db.execute(table.delete().where(table.c[column].between(start, end))).rowcount
+        db.commit()
+        db.execute(text(f"PRAGMA {schema}.synchronous=NORMAL"))
+    finally:
+        db.close()
+    return {"fiscal_year": year, "moved": moved}
+
+
+def detach(year: int):
+    # Datei in den Cold-Storage-Ordner verschieben; Verbindungen binden sie beim nächsten Auschecken nicht mehr ein
+    path = partition_path(year)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Fiscal year {year} is not attached")
+    os.makedirs(DETACHED_DIR, exist_ok=True)
+    os.replace(path, partition_path(year, detached=True))
+    partitions_changed()
+
+
+def attach(year: int):
+    path = partition_path(year, detached=True)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Fiscal year {year} is not detached")
+    if len(partition_files()) >= MAX_ATTACHED:
+        raise ValueError(f"At most {MAX_ATTACHED} fiscal years can be attached; detach an older year first")
+    os.replace(path, partition_path(year))
+    partitions_changed()
+
+
+def status(db: Session) -> list:
+    """Eingebundene und ausgehängte Jahre mit Zeilenzahlen und noch nicht verschobenen Nachzüglern."""
+    result = []
+    for year in attached_years(db):
+        start, end = fiscal_year_range(year)
+        entry = {
+            "fiscal_year": year, "start": start, "end": end, "attached": True,
+            "size_bytes": os.path.getsize(partition_path(year)), "rows": {}, "pending": {},
+        }
+        for table, column in PARTITIONED.items():
+            entry["rows"][table.name] = db.execute(select(func.count()).select_from(partition_table(table, year))).scalar()
+            entry["pending"][table.name] = db.execute(
+                select(func.count()).select_from(table).where(table.c[column].between(start, end))
+            ).scalar()
+        result.append(entry)
+    if os.path.isdir(DETACHED_DIR):
+        for name in sorted(os.listdir(DETACHED_DIR)):
+            match = PARTITION_FILE.match(name)
+            if match:
+                year = int(match.group(1))
+                start, end = fiscal_year_range(year)
+                result.append({
+                    "fiscal_year": year, "start": start, "end": end, "attached": False,
+                    "size_bytes": os.path.getsize(os.path.join(DETACHED_DIR, name)),
+                })
+    return sorted(result, key=lambda entry: entry["fiscal_year"])
+
+
+if __name__ == "__main__":
+    # docker-compose exec backend python -m app.partitions archive 2023
+    parser = argparse.ArgumentParser(description="Geschäftsjahre von Rechnungen und Ausgaben archivieren")
+    parser.add_argument("command", choices=["status", "archive", "detach", "attach"])
+    parser.add_argument("year", type=int, nargs="?")
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "status":
+        session = SessionLocal()
+        try:
+            print(json.dumps(status(session), default=str, indent=2))
+        finally:
+            session.close()
+    elif args.year is None:
+        parser.error("year is required")
+    elif args.command == "archive":
+        print(archive(args.year))
+    else:
+        (detach if args.command == "detach" else attach)(args.year)
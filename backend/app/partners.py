@@ -0,0 +1,257 @@
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+from sqlalchemy import bindparam, event, update
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import Contract, Partner
+
+# Rechtsformen und Füllwörter, die für die Zuordnung keine Rolle spielen
+LEGAL_FORMS = {
+    "gmbh", "mbh", "ag", "kg", "kgaa", "ohg", "gbr", "ug", "haftungsbeschraenkt", "ek", "ev", "eg", "se",
+    "co", "und", "ltd", "limited", "inc", "llc", "plc", "corp", "sarl", "sa", "bv", "nv",
+}
+UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+# Mindestanteil der Trigramme der Eingabe, den ein Treffer enthalten muss; der letzte Wert bestimmt die Tippfehler-Toleranz
+OVERLAP_STEPS = (0.8, 0.5)
+# SQLite erlaubt nur eine begrenzte Zahl an Parametern pro Abfrage
+CHUNK_SIZE = 500
+
+
+def _tokens(name: str) -> list:
+    text = (name or "").lower().translate(UMLAUTS)
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    # Punkte entfernen ("e.K." -> "ek"), übrige Satzzeichen trennen Wörter
+    text = re.sub(r"[^a-z0-9\s]", " ", text.replace(".", ""))
+    tokens = text.split()
+    return [token for token in tokens if token not in LEGAL_FORMS] or tokens
+
+
+def normalize(name: str) -> str:
+    # "Max Mustermann GmbH" und "Mustermann GmbH, Max" ergeben beide "max mustermann"
+    return " ".join(sorted(_tokens(name)))
+
+
+def trigrams(tokens, prefix: bool = False) -> set:
+    """Trigramme je Wort, vorne mit zwei und hinten mit einem Leerzeichen aufgefüllt.
+
+    Mit prefix=True fehlt beim letzten Wort das Wortende, damit eine noch unvollständige
+    Eingabe ("muster") auch längere Namen ("mustermann") findet.
+    """
+    grams = set()
+    for i, token in enumerate(tokens):
+        padded = f"  {token}" if prefix and i == len(tokens) - 1 else f"  {token} "
+        grams.update(padded[j:j + 3] for j in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """Invertierter Trigramm-Index über die normalisierten Partnernamen im Speicher.
+
+    Eine Abfrage zählt zuerst nur die Treffer der seltensten Trigramme der Eingabe
+    (Präfix-Filter: wer die Mindestüberdeckung erreicht, muss einen davon enthalten) und
+    prüft die häufigen Trigramme anschließend nur noch per Mengenschnitt mit den Kandidaten.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.names = {}
+        self.gram_counts = {}
+
+    def add(self, partner_id: int, name: str, normalized: str):
+        grams = trigrams(normalized.split())
+        for gram in grams:
+            self.postings[gram].add(partner_id)
+        self.names[partner_id] = name
+        self.gram_counts[partner_id] = len(grams)
+
+    def search(self, query: str, limit: int) -> list:
+        grams = sorted(trigrams(_tokens(query), prefix=True), key=lambda gram: len(self.postings.get(gram, ())))
+        if not grams:
+            return []
+        # Erst streng (wenige, seltene Trigramme als Kandidatenquelle), tolerant nur, wenn nichts gefunden wurde
+        for overlap in OVERLAP_STEPS:
+            result = self._search(grams, max(1, math.ceil(len(grams) * overlap)), limit)
+            if result:
+                break
+        return result
+
+    def _search(self, grams: list, min_hits: int, limit: int) -> list:
+        n = len(grams)
+        rare, frequent = grams[:n - min_hits + 1], grams[n - min_hits + 1:]
+
+        hits = Counter()
+        for gram in rare:
+            hits.update(self.postings.get(gram, ()))
+        candidates = set(hits)
+        for gram in frequent:
+            hits.update(candidates & self.postings.get(gram, set()))
+
+        # Jaccard-Ähnlichkeit zwischen den Trigrammen der Eingabe und des Namens
+        gram_counts = self.gram_counts
+        scored = (
+            (h / (n + gram_counts[partner_id] - h), partner_id)
+            for partner_id, h in hits.items() if h >= min_hits
+        )
+        return [
+            {"id": partner_id, "name": self.names[partner_id], "score": round(score, 3)}
+            for score, partner_id in heapq.nlargest(limit, scored)
+        ]
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def _load_index() -> TrigramIndex:
+    global _index
+    with _lock:
+        if _index is None:
+            index = TrigramIndex()
+            db = SessionLocal()
+            try:
+                for partner_id, name, normalized in db.query(Partner.id, Partner.name, Partner.normalized):
+                    index.add(partner_id, name, normalized)
+            finally:
+                db.close()
+            _index = index
+        return _index
+
+
+def warm_index():
+    # Index im Hintergrund aufbauen, damit die erste Eingabe nicht darauf warten muss
+    _load_index()
+
+
+def invalidate():
+    global _index
+    with _lock:
+        _index = None
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _index_new_partners(session):
+    # Neue Partner erst nach erfolgreichem Commit in den Index übernehmen
+    new_partners = session.info.pop("new_partners", None)
+    if new_partners:
+        with _lock:
+            if _index is not None:
+                for partner_id, name, normalized in new_partners:
+                    _index.add(partner_id, name, normalized)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_new_partners(session):
+    session.info.pop("new_partners", None)
+
+
+def resolve(db: Session, name: str) -> Partner:
+    # Vorhandenen Partner mit gleichem Normalschlüssel verwenden, sonst neu anlegen (committet nicht)
+    normalized = normalize(name)
+    partner = db.query(Partner).filter(Partner.normalized == normalized).order_by(Partner.id).first()
+    if partner:
+        return partner
+    partner = Partner(name=name.strip(), normalized=normalized)
+    db.add(partner)
+    db.flush()
+    db.info.setdefault("new_partners", []).append((partner.id, partner.name, normalized))
+    return partner
+
+
+def link_contract(db: Session, contract):
+    # Vor record_change aufrufen, damit partner_id im Änderungsprotokoll steht
+    contract.partner_id = resolve(db, contract.partner).id if contract.partner else None
+
+
+def autocomplete(query: str, limit: int = 10) -> list:
+    """Ähnlichste Partner zur Eingabe, absteigend nach Trigramm-Ähnlichkeit."""
+    index = _load_index()
+    with _lock:
+        return index.search(query, limit)
+
+
+def dedupe(db: Session) -> dict:
+    """Ordnet alle Verträge kanonischen Partnern zu.
+
+    Verträge werden nach Normalschlüssel gruppiert; Name des Partners wird die häufigste
+    Schreibweise. Bestehende Partner-IDs bleiben erhalten, doppelte und verwaiste Partner
+    werden entfernt.
+    """
+    spellings = defaultdict(Counter)
+    contract_keys = {}
+    for contract_id, partner, partner_id in db.query(Contract.id, Contract.partner, Contract.partner_id):
+        if not partner:
+            continue
+        key = normalize(partner)
+        spellings[key][partner.strip()] += 1
+        contract_keys[contract_id] = (key, partner_id)
+
+    # Vorhandene Partner neu normalisieren (Regeln können sich geändert haben); je Schlüssel gewinnt die kleinste ID
+    partner_ids = {}
+    all_ids = []
+    for partner_id, name in db.query(Partner.id, Partner.name).order_by(Partner.id):
+        partner_ids.setdefault(normalize(name), partner_id)
+        all_ids.append(partner_id)
+    kept = {partner_ids[key] for key in spellings if key in partner_ids}
+    obsolete = [partner_id for partner_id in all_ids if partner_id not in kept]
+
+    updated = []
+    created = {}
+    for key, names in spellings.items():
+        canonical = names.most_common(1)[0][0]
+        if key in partner_ids:
+            updated.append({"_id": partner_ids[key], "name": canonical, "normalized": key})
+        else:
+            created[key] = Partner(name=canonical, normalized=key)
+    # Ein Flush für alle neuen Partner; die IDs kommen gesammelt per RETURNING zurück
+    db.add_all(created.values())
+    db.flush()
+    partner_ids.update({key: partner.id for key, partner in created.items()})
+
+    partner_table = Partner.__table__
+    if updated:
+        db.connection().execute(
+            update(partner_table).where(partner_table.c.id == bindparam("_id")).values(
+                name=bindparam("name"), normalized=bindparam("normalized")
+            ),
+            updated,
+        )
+
+    # Abgeleitete Zuordnung: wie beim Duplikat-Schlüssel ohne Versionserhöhung und Änderungsprotokoll
+    changed = [
+        {"_id": contract_id, "partner_id": partner_ids[key]}
+        for contract_id, (key, current) in contract_keys.items()
+        if current != partner_ids[key]
+    ]
+    contract_table = Contract.__table__
+    if changed:
+        db.connection().execute(
+            update(contract_table).where(contract_table.c.id == bindparam("_id")).values(partner_id=bindparam("partner_id")),
+            changed,
+        )
+    db.query(Contract).filter(Contract.partner.is_(None), Contract.partner_id.isnot(None)).update(
+        {"partner_id": None}, synchronize_session=False
+    )
+    for i in range(0, len(obsolete), CHUNK_SIZE):
+        db.query(Partner).filter(Partner.id.in_(obsolete[i:i + CHUNK_SIZE])).delete(synchronize_session=False)
+    db.commit()
+    invalidate()
+    return {
+        "partners": len(spellings),
+        "partners_created": len(created),
+        "partners_removed": len(obsolete),
+        "contracts_relinked": len(changed),
+    }
+
+
+def ensure_linked(db: Session) -> bool:
+    # Beim Start: Verträge ohne Partner-Zuordnung (z. B. nach der Migration) einmalig zuordnen
+    if db.query(Contract.id).filter(Contract.partner_id.is_(None), Contract.partner.isnot(None)).first() is None:
+        return False
+    dedupe(db)
+    return True
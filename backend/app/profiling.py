@@ -0,0 +1,318 @@
+"""Sampling-Profiler für einzelne Anfragen, nur auf Anforderung.
+
+Eine Anfrage wird profiliert, wenn sie den Header `X-Profile: 1` trägt oder wenn über
+`POST /admin/profiling` Anfragen auf einen Pfad vorgemerkt wurden. Ein Hintergrund-Thread
+liest dann alle PROFILE_INTERVAL_MS Millisekunden die Aufrufstapel der Event-Loop und der
+Threadpool-Worker, die gerade für diese Anfrage arbeiten. Die Event-Loop teilen sich alle
+Anfragen; ihre Samples können daher auch andere async-Routen enthalten. SQL-Zeiten werden
+zusätzlich exakt über Engine-Events gemessen. Es läuft höchstens ein Profil gleichzeitig, und
+zwischen zwei Profilen liegen mindestens PROFILE_MIN_INTERVAL_SECONDS; sonst läuft die Anfrage
+normal weiter.
+
+Ohne Profil kostet die Middleware nur einen Blick auf die Header, die SQL-Events nur das
+Lesen einer Kontextvariablen.
+"""
+import collections
+import contextvars
+import itertools
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+
+from .database import engine
+
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_MIN_INTERVAL = float(os.getenv("PROFILE_MIN_INTERVAL_SECONDS", "1"))
+PROFILE_HEADER = b"x-profile"
+MAX_DEPTH = 128
+# Äußerste Frames eines Worker-Threads, in denen nach dem Kontext des laufenden Auftrags gesucht wird
+OUTER_FRAMES = 4
+WORKER_THREAD_NAME = "AnyIO worker thread"
+
+# Regeln: (Kategorie, Pfadfragment, Funktionsnamen oder None = alle). Zuerst bestimmt die Phase
+# der Antwortausgabe die Kategorie (irgendwo im Stack), sonst der innerste Datenbank-Frame.
+PHASE_RULES = [
+    ("json", "/json/", None),
+    ("json", "starlette/responses.py", {"render"}),
+    ("json", "app/fieldsets.py", {"render", "_encode"}),
+    ("serialization", "fastapi/encoders.py", None),
+    ("serialization", "fastapi/routing.py", {"serialize_response", "_prepare_response_content"}),
+    ("serialization", "pydantic/", None),
+    ("compression", "/gzip.py", {"write", "close", "compress"}),
+]
+DATA_RULES = [
+    ("sql", "sqlalchemy/engine/", None),
+    ("sql", "sqlalchemy/pool/", None),
+    ("sql", "sqlalchemy/dialects/", None),
+    ("orm", "sqlalchemy/", None),
+]
+# Wartende Threads (Event-Loop im select, Worker ohne Auftrag) zählen nicht als Rechenzeit
+IDLE_FILES = ("selectors.py", "threading.py", "queue.py")
+
+_current = contextvars.ContextVar("profile", default=None)
+_lock = threading.Lock()
+_profiles = collections.deque(maxlen=PROFILE_KEEP)
+_ids = itertools.count(1)
+_active = None
+_last_finished = float("-inf")
+_armed = {"path": None, "remaining": 0}
+_labels = {}
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        short = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+        label = _labels[code] = f"{short}:{code.co_name}"
+    return label
+
+
+def _match(code, rules):
+    filename = code.co_filename.replace("\\", "/")
+    for category, fragment, names in rules:
+        if fragment in filename and (names is None or code.co_name in names):
+            return category
+    return None
+
+
+def _request_context(frame):
+    # anyio führt jeden Auftrag des Threadpools per context.run(...) im kopierten Kontext der Anfrage aus;
+    # die Schleife des Worker-Threads (einer der äußersten Frames) hält diesen Kontext als lokale Variable
+    outer = collections.deque(maxlen=OUTER_FRAMES)
+    while frame is not None:
+        outer.append(frame)
+        frame = frame.f_back
+    for frame in reversed(outer):
+        for value in frame.f_locals.values():
+            if isinstance(value, contextvars.Context):
+                return value
+    return None
+
+
+def _category(stack) -> str:
+    for i, code in enumerate(stack):
+        category = _match(code, PHASE_RULES)
+        if category:
+            return category
+        if code.co_name == "run" and code.co_filename.endswith("_asyncio.py") and i > 0:
+            # Pydantic (kompiliert, ohne eigene Frames) validiert im Threadpool direkt aus dem Worker heraus;
+            # der erste Python-Frame ist dann ein ORM-Attributzugriff statt Code der Anwendung
+            if "sqlalchemy/orm/" in stack[i - 1].co_filename.replace("\\", "/"):
+                return "serialization"
+    for code in stack:
+        category = _match(code, DATA_RULES)
+        if category:
+            return category
+    return "handler"
+
+
+class Profile:
+    def __init__(self, scope):
+        self.id = next(_ids)
+        self.method = scope.get("method")
+        self.path = scope.get("path")
+        self.query = scope.get("query_string", b"").decode("latin-1")
+        self.started_at = datetime.now()
+        self.status = None
+        self.duration = None
+        # Von AdmissionMiddleware gesetzt, die vor dem Profiler läuft
+        self.admission_wait = scope.get("state", {}).get("admission_wait")
+        self.stacks = collections.Counter()
+        self.thread_samples = {"event_loop": 0, "worker": 0}
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self._loop_thread = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(PROFILE_INTERVAL):
+            workers = {thread.ident for thread in threading.enumerate() if thread.name.startswith(WORKER_THREAD_NAME)}
+            for ident, frame in sys._current_frames().items():
+                if ident == self._loop_thread:
+                    kind = "event_loop"
+                elif ident in workers:
+                    # Nur Worker, die gerade einen Auftrag dieser Anfrage ausführen (nicht die anderer Anfragen)
+                    context = _request_context(frame)
+                    if context is None or context.get(_current) is not self:
+                        continue
+                    kind = "worker"
+                else:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                if stack and not stack[0].co_filename.endswith(IDLE_FILES):
+                    self.stacks[tuple(stack)] += 1
+                    self.thread_samples[kind] += 1
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self._started
+        self._stop.set()
+        self._sampler.join()
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "admission_wait_ms": round(self.admission_wait * 1000, 1) if self.admission_wait is not None else None,
+            "samples": sum(self.stacks.values()),
+        }
+
+    def report(self, top: int = 25) -> dict:
+        """Zeitanteile je Kategorie, exakte SQL-Zeit und die Funktionen mit der meisten Eigenzeit."""
+        samples = sum(self.stacks.values())
+        categories = collections.Counter()
+        own = collections.Counter()
+        for stack, count in self.stacks.items():
+            categories[_category(stack)] += count
+            own[_label(stack[0])] += count
+        # Geschätzte Zeit = Anteil der Samples an der Gesamtdauer
+        scale = self.duration / samples if samples else 0.0
+        return {
+            **self.summary(),
+            "interval_ms": PROFILE_INTERVAL * 1000,
+            # Samples der Event-Loop können gleichzeitig laufende async-Routen enthalten
+            "thread_samples": dict(self.thread_samples),
+            "breakdown": {
+                category: {"samples": count, "share": round(count / samples, 3), "estimated_ms": round(count * scale * 1000, 1)}
+                for category, count in categories.most_common()
+            },
+            "sql": {"queries": self.sql_queries, "execute_ms": round(self.sql_seconds * 1000, 1)},
+            "top_functions": [
+                {"function": label, "samples": count, "share": round(count / samples, 3)}
+                for label, count in own.most_common(top)
+            ],
+        }
+
+    def collapsed(self) -> str:
+        # Format "äußerer;...;innerer Frame Anzahl" für flamegraph.pl, speedscope oder inferno
+        lines = collections.Counter()
+        for stack, count in self.stacks.items():
+            lines[";".join(_label(code) for code in reversed(stack))] += count
+        return "".join(f"{line} {count}\n" for line, count in sorted(lines.items()))
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is not None and conn.info.get("profile_started"):
+        profile.sql_seconds += time.perf_counter() - conn.info["profile_started"].pop()
+        profile.sql_queries += 1
+
+
+def arm(path: str, count: int = 1) -> dict:
+    # Die nächsten `count` Anfragen auf `path` profilieren (unterliegt derselben Ratenbegrenzung)
+    with _lock:
+        _armed.update(path=path, remaining=count)
+    return status()
+
+
+def disarm() -> dict:
+    with _lock:
+        _armed.update(path=None, remaining=0)
+    return status()
+
+
+def status() -> dict:
+    return {
+        "armed_path": _armed["path"],
+        "armed_remaining": _armed["remaining"],
+        "active": _active.summary() if _active else None,
+        "interval_ms": PROFILE_INTERVAL * 1000,
+        "min_interval_seconds": PROFILE_MIN_INTERVAL,
+        "stored": len(_profiles),
+    }
+
+
+def profiles() -> list:
+    return [profile.summary() for profile in reversed(_profiles)]
+
+
+def get(profile_id: int):
+    for profile in _profiles:
+        if profile.id == profile_id:
+            return profile
+    return None
+
+
+def _requested(scope) -> bool:
+    for name, value in scope.get("headers", ()):
+        if name == PROFILE_HEADER:
+            return value not in (b"", b"0", b"false")
+    return _armed["remaining"] > 0 and scope.get("path") == _armed["path"]
+
+
+def _try_start(scope):
+    global _active
+    with _lock:
+        if _active is not None or time.monotonic() - _last_finished < PROFILE_MIN_INTERVAL:
+            return None
+        if _armed["remaining"] > 0 and scope.get("path") == _armed["path"]:
+            _armed["remaining"] -= 1
+            if not _armed["remaining"]:
+                _armed["path"] = None
+        _active = Profile(scope)
+    return _active
+
+
+class ProfilingMiddleware:
+    """Reine ASGI-Middleware zwischen AdmissionMiddleware und Kompression (siehe main.py).
+
+    Kompression und JSON-Ausgabe zählen mit; die Wartezeit in der Admission-Warteschlange liegt davor
+    und steht getrennt als admission_wait_ms im Profil. Abgelehnte Anfragen werden nicht profiliert.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _active, _last_finished
+        if scope["type"] != "http" or not _requested(scope):
+            await self.app(scope, receive, send)
+            return
+        profile = _try_start(scope)
+        if profile is None:
+            # Ratenbegrenzt: Anfrage normal bedienen
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", str(profile.id).encode())]}
+            await send(message)
+
+        token = _current.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.stop()
+            _current.reset(token)
+            with _lock:
+                _profiles.append(profile)
+                _active = None
+                # Abstand ab Ende des Profils: lange Anfragen können nicht dauerhaft profiliert werden
+                _last_finished = time.monotonic()
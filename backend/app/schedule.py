@@ -0,0 +1,153 @@
+import calendar
+import os
+from collections import defaultdict
+from datetime import date
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from .models import CashFlowMonth, Contract, PaymentSchedule
+
+# Monate zwischen zwei Zahlungen; "once" = eine Zahlung zum Vertragsbeginn
+INTERVAL_MONTHS = {"monthly": 1, "quarterly": 3, "annual": 12, "once": None}
+
+# Standard-Zahlungsintervall, wenn am Vertrag keines gesetzt ist
+CATEGORY_INTERVALS = {
+    "Abonnement": "monthly",
+    "Dienstleistung": "monthly",
+    "Wartungsvertrag": "annual",
+    "Kaufvertrag": "once",
+    "Sonstiges": "once",
+}
+
+
+# Verträge mit weit entferntem Ende (z. B. 9999-12-31 für unbefristet) höchstens so viele Jahre ab Beginn einplanen
+SCHEDULE_MAX_YEARS = int(os.getenv("SCHEDULE_MAX_YEARS", "50"))
+
+
+def resolve_interval(contract) -> str:
+    return contract.payment_interval or CATEGORY_INTERVALS.get(contract.category, "once")
+
+
+def add_months(start: date, months: int) -> date:
+    # Monatsende beachten: 31.01. + 1 Monat = 28./29.02.
+    year, month = divmod(start.month - 1 + months, 12)
+    year += start.year
+    day = min(start.day, calendar.monthrange(year, month + 1)[1])
+    return date(year, month + 1, day)
+
+
+def schedule_rows(contract) -> list:
+    """Fällige Zahlungen eines Vertrags; `amount` gilt als Betrag pro Zahlungsintervall.
+
+    Geplant wird bis zum Vertragsende, höchstens aber SCHEDULE_MAX_YEARS Jahre ab Vertragsbeginn.
+    """
+    if not contract.start_date or not contract.end_date or not contract.amount:
+        return []
+    start = contract.start_date
+    step = INTERVAL_MONTHS.get(resolve_interval(contract))
+    if step is None:
+        return [{"contract_id": contract.id, "due_date": start, "amount": contract.amount}]
+
+    end = contract.end_date
+    if start.year + SCHEDULE_MAX_YEARS <= date.max.year:
+        end = min(end, add_months(start, 12 * SCHEDULE_MAX_YEARS))
+    # Anzahl der Zahlungen direkt berechnen; die letzte kann durch die Monatsend-Korrektur hinter `end` liegen
+    count = ((end.year - start.year) * 12 + end.month - start.month) // step + 1
+    if count > 0 and add_months(start, (count - 1) * step) > end:
+        count -= 1
+    # Immer vom Startdatum aus rechnen, damit sich Monatsend-Korrekturen nicht aufsummieren
+    return [
+        {"contract_id": contract.id, "due_date": add_months(start, n * step), "amount": contract.amount}
+        for n in range(max(count, 0))
+    ]
+
+
+def _cents(amount) -> int:
+    return round(amount * 100)
+
+
+def _monthly_totals(rows):
+    # In ganzen Cent summieren, damit sich über viele Änderungen keine Rundungsfehler ansammeln
+    totals = defaultdict(lambda: [0, 0])
+    for row in rows:
+        total = totals[row["due_date"].strftime("%Y-%m")]
+        total[0] += _cents(row["amount"])
+        total[1] += 1
+    return totals
+
+
+def _apply_monthly_totals(db: Session, totals, sign: int = 1):
+    # Monatssummen per Upsert fortschreiben (sign=-1 zieht entfernte Zahlungen ab). Gerechnet wird in
+    # ganzen Cent; gespeichert bleibt der Euro-Betrag, der so immer exakt auf einem Cent-Wert liegt
+    if not totals:
+        return
+    stmt = insert(CashFlowMonth)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[CashFlowMonth.month],
+            set_={
+                "amount": (func.round(CashFlowMonth.amount * 100) + func.round(stmt.excluded.amount * 100)) / 100.0,
+                "payments": CashFlowMonth.payments + stmt.excluded.payments,
+            },
+        ),
+        [{"month": month, "amount": sign * cents / 100, "payments": sign * count} for month, (cents, count) in totals.items()],
+    )
+
+
+def refresh_contract(db: Session, contract):
+    # In derselben Transaktion wie die Vertragsänderung aufrufen
+    db.flush()
+    delete_contract(db, contract.id)
+    rows = schedule_rows(contract)
+    if rows:
+        db.connection().execute(PaymentSchedule.__table__.insert(), rows)
+        _apply_monthly_totals(db, _monthly_totals(rows))
+
+
+def delete_contract(db: Session, contract_id: int):
+    existing = (
+        db.query(PaymentSchedule.due_date, PaymentSchedule.amount)
+        .filter(PaymentSchedule.contract_id == contract_id)
+        .all()
+    )
+    if not existing:
+        return
+    _apply_monthly_totals(db, _monthly_totals(row._mapping for row in existing), sign=-1)
+    db.query(PaymentSchedule).filter(PaymentSchedule.contract_id == contract_id).delete(synchronize_session=False)
+
+
+def rebuild_all(db: Session) -> int:
+    """Erzeugt den Zahlungsplan für alle Verträge neu und schreibt ihn mit einem Bulk-Insert."""
+    columns = (Contract.id, Contract.start_date, Contract.end_date, Contract.amount, Contract.category, Contract.payment_interval)
+    rows = [row for contract in db.query(*columns) for row in schedule_rows(contract)]
+    db.query(PaymentSchedule).delete(synchronize_session=False)
+    db.query(CashFlowMonth).delete(synchronize_session=False)
+    if rows:
+        # Core-executemany statt ORM-Objekten: deutlich schneller bei Hunderttausenden Zeilen
+        db.connection().execute(PaymentSchedule.__table__.insert(), rows)
+        _apply_monthly_totals(db, _monthly_totals(rows))
+    db.commit()
+    return len(rows)
+
+
+def ensure_built(db: Session):
+    # Beim Start: bestehende Verträge ohne Zahlungsplan (z. B. nach der Migration) einmalig einplanen
+    if db.query(PaymentSchedule.id).first() is None and db.query(Contract.id).first() is not None:
+        rebuild_all(db)
+
+
+def cash_flow(db: Session, date_from: date, date_to: date) -> list:
+    """Cashflow je Monat aus den vorverdichteten Monatssummen (ganze Monate von date_from bis date_to)."""
+    rows = (
+        db.query(CashFlowMonth)
+        .filter(
+            CashFlowMonth.month >= date_from.strftime("%Y-%m"),
+            CashFlowMonth.month <= date_to.strftime("%Y-%m"),
+            CashFlowMonth.payments > 0,
+        )
+        .order_by(CashFlowMonth.month)
+        .all()
+    )
+    return [{"month": row.month, "amount": round(row.amount, 2), "payments": row.payments} for row in rows]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from datetime import date
+from datetime import date, datetime
 from typing import List, Optional
 
 class ContractBase(BaseModel):
@@ -12,13 +12,18 @@ class ContractBase(BaseModel):
     amount: float
     category: str
     notes: str = None
+    payment_interval: Optional[str] = None
 
 class ContractCreate(ContractBase):
     pass
 
 class ContractResponse(ContractBase):
     id: int
+    partner_id: Optional[int] = None
     document_path: str = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    version: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -34,6 +39,9 @@ class ExpenseCreate(ExpenseBase):
 class ExpenseResponse(ExpenseBase):
     id: int
     budget_id: int
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    version: Optional[int] = None
     class Config:
         orm_mode = True
 
@@ -46,9 +54,16 @@ class BudgetBase(BaseModel):
 class BudgetCreate(BudgetBase):
     pass
 
+class BudgetUpdate(BudgetBase):
+    # Zuletzt gelesene Version; bei Abweichung antwortet das Backend mit 409
+    version: Optional[int] = None
+
 class BudgetResponse(BudgetBase):
     id: int
     expenses: List[ExpenseResponse] = []
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    version: Optional[int] = None
     class Config:
         orm_mode = True
 
@@ -65,5 +80,39 @@ class InvoiceCreate(InvoiceBase):
 class InvoiceResponse(InvoiceBase):
     id: int
     amount_gross: float
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    version: Optional[int] = None
+    class Config:
+        orm_mode = True
+
+class BudgetForecast(BaseModel):
+    budget_id: int
+    contract_number: Optional[str] = None
+    status: str  # "not_started", "active" oder "ended"
+    initial_amount: float
+    spent: float
+    remaining: float
+    daily_burn_rate: float
+    projected_spent_at_end: float
+    projected_remaining_at_end: float
+    exhaustion_date: Optional[date] = None
+    end_date: date
+    at_risk: bool
+
+class ScheduledPayment(BaseModel):
+    contract_id: int
+    due_date: date
+    amount: float
     class Config:
         orm_mode = True
+
+class CashFlowEntry(BaseModel):
+    month: str
+    amount: float
+    payments: int
+
+class PartnerMatch(BaseModel):
+    id: int
+    name: str
+    score: float
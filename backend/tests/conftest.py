@@ -0,0 +1,71 @@
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date
+
+import pytest
+
+# DATA_DIR wird beim Import von app.database gelesen: vor allen App-Importen auf ein Temp-Verzeichnis setzen
+DATA_DIR = tempfile.mkdtemp(prefix="contracts-test-")
+os.environ["DATA_DIR"] = DATA_DIR
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import Base, SessionLocal, engine, init_db  # noqa: E402
+
+
+def _reset():
+    engine.dispose()
+    for name in os.listdir(DATA_DIR):
+        path = os.path.join(DATA_DIR, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+    init_db()
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    engine.dispose()
+
+
+@pytest.fixture
+def db():
+    """Leere Datenbank und leere Datenverzeichnisse je Test."""
+    _reset()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_contract(db):
+    """Legt einen Vertrag an und schreibt sein Dokument nach DOCUMENT_DIR; gibt den Dokumentpfad zurück.
+
+    Mit data=None wird keine Datei geschrieben (Verweis auf ein fehlendes Dokument).
+    """
+    from app.database import DOCUMENT_DIR
+    from app.models import Contract
+
+    def make(name, data, end_date=date(2999, 12, 31)):
+        os.makedirs(DOCUMENT_DIR, exist_ok=True)
+        path = os.path.join(DOCUMENT_DIR, name)
+        if data is not None:
+            with open(path, "wb") as f:
+                f.write(data)
+        db.add(Contract(partner="Test GmbH", start_date=date(2020, 1, 1), end_date=end_date,
+                        notice_period="3 Monate", amount=100, category="IT", document_path=path))
+        db.commit()
+        return path
+
+    return make
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
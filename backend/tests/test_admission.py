@@ -0,0 +1,178 @@
+import asyncio
+import http.client
+import ipaddress
+import socket
+import threading
+import time
+
+import pytest
+
+from app import admission
+
+CHUNK = 64 * 1024
+
+
+async def _ok_app(scope, receive, send):
+    while (await receive()).get("more_body"):
+        pass
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+@pytest.fixture
+def lanes(monkeypatch):
+    upload = admission.Lane("upload", concurrency=1, queue_size=0, max_body=1024 * 1024, rate=0.001, burst=1)
+    read = admission.Lane("read", concurrency=4, queue_size=4, max_body=1024 * 1024, rate=100, burst=100)
+    monkeypatch.setattr(admission, "LANES", {"upload": upload, "read": read})
+    return upload
+
+
+def _call(app, body: bytes, headers=(), client="10.0.0.1", chunked=False):
+    """Schickt eine Upload-Anfrage in Blöcken durch die Middleware; liefert Antwort und gelesene Bytes."""
+    headers = [(b"content-type", b"multipart/form-data; boundary=x"), *headers]
+    headers.append((b"transfer-encoding", b"chunked") if chunked else (b"content-length", str(len(body)).encode()))
+    scope = {"type": "http", "method": "POST", "path": "/contracts/", "headers": headers, "client": (client, 5000)}
+    chunks = [body[i:i + CHUNK] for i in range(0, len(body), CHUNK)] or [b""]
+    consumed = []
+    sent = []
+
+    async def receive():
+        if len(consumed) < len(chunks):
+            consumed.append(chunks[len(consumed)])
+            return {"type": "http.request", "body": consumed[-1], "more_body": len(consumed) < len(chunks)}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(admission.AdmissionMiddleware(app)(scope, receive, send))
+    start = sent[0]
+    return start["status"], dict(start["headers"]), sum(len(chunk) for chunk in consumed)
+
+
+def test_too_large_body_is_drained_before_413(lanes):
+    lanes.max_body = 256 * 1024
+    body = b"x" * (512 * 1024)
+    status, headers, read = _call(_ok_app, body)
+    assert status == 413
+    assert read == len(body)
+    assert b"connection" not in headers
+
+
+def test_body_above_drain_limit_is_not_read_and_connection_closed(lanes):
+    status, headers, read = _call(_ok_app, b"x" * (admission.DRAIN_LIMIT + 1))
+    assert (status, read) == (413, 0)
+    assert headers[b"connection"] == b"close"
+
+
+def test_expect_continue_body_is_not_requested(lanes):
+    status, _, read = _call(_ok_app, b"x" * (2 * 1024 * 1024), headers=[(b"expect", b"100-continue")])
+    assert (status, read) == (413, 0)
+
+
+def test_chunked_upload_over_limit(lanes):
+    lanes.max_body = 256 * 1024
+    body = b"x" * (768 * 1024)
+    status, headers, read = _call(_ok_app, body, chunked=True)
+    assert status == 413
+    assert read == len(body)
+    assert lanes.rejected["too_large"] == 1
+
+
+def test_rate_limited_large_upload_is_not_read(lanes):
+    lanes.max_body = 64 * 1024 * 1024
+    assert _call(_ok_app, b"a")[0] == 200
+    # Abgelehnte Uploads über dem Drain-Limit kosten den Server keine Lesearbeit
+    status, headers, read = _call(_ok_app, b"x" * (20 * 1024 * 1024))
+    assert (status, read) == (429, 0)
+    assert headers[b"connection"] == b"close"
+
+
+def test_rate_limit_drains_and_sets_retry_after(lanes):
+    assert _call(_ok_app, b"a" * 1000)[0] == 200
+    status, headers, read = _call(_ok_app, b"a" * 1000)
+    assert status == 429
+    assert int(headers[b"retry-after"]) >= 1
+    assert read == 1000
+
+
+def test_client_id_only_trusted_from_proxies(lanes, monkeypatch):
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", {ipaddress.ip_address("172.28.0.10")})
+
+    def status(client, client_id):
+        return _call(_ok_app, b"a", headers=[(b"x-client-id", client_id)], client=client)[0]
+
+    # Benutzer hinter dem Frontend haben eigene Buckets
+    assert status("172.28.0.10", b"alice") == 200
+    assert status("172.28.0.10", b"bob") == 200
+    assert status("172.28.0.10", b"alice") == 429
+    # Andere Clients können sich per Header keinen neuen Bucket verschaffen
+    assert status("10.0.0.2", b"one") == 200
+    assert status("10.0.0.2", b"two") == 429
+
+
+def test_queue_full_returns_503(lanes):
+    lanes.burst = lanes.rate = 1000
+
+    async def main():
+        release = asyncio.Event()
+        started = asyncio.Event()
+
+        async def slow_app(scope, receive, send):
+            started.set()
+            await release.wait()
+            await _ok_app(scope, receive, send)
+
+        middleware = admission.AdmissionMiddleware(slow_app)
+        scope = {
+            "type": "http", "method": "POST", "path": "/contracts/", "client": ("10.0.0.1", 1),
+            "headers": [(b"content-type", b"multipart/form-data; boundary=x"), (b"content-length", b"1")],
+        }
+        responses = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"a", "more_body": False}
+
+        async def send(message):
+            responses.append(message)
+
+        first = asyncio.create_task(middleware(scope, receive, send))
+        await started.wait()
+        await middleware(scope, receive, send)
+        release.set()
+        await first
+        return [message for message in responses if message["type"] == "http.response.start"]
+
+    starts = asyncio.run(main())
+    assert [message["status"] for message in starts] == [503, 200]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_rejected_upload_reaches_client_over_real_socket(lanes):
+    # Ende-zu-Ende über uvicorn: abgelehnte Uploads liefern eine lesbare Antwort
+    uvicorn = pytest.importorskip("uvicorn")
+    lanes.max_body = 32 * 1024 * 1024
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(admission.AdmissionMiddleware(_ok_app), port=port, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        while not server.started:
+            time.sleep(0.01)
+        statuses = []
+        for _ in range(3):
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            connection.request("POST", "/contracts/", body=b"x" * (512 * 1024), headers={"Content-Type": "multipart/form-data; boundary=x"})
+            response = connection.getresponse()
+            response.read()
+            statuses.append(response.status)
+            connection.close()
+    finally:
+        server.should_exit = True
+        thread.join()
+    assert statuses == [200, 429, 429]
@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import text
+
+from app import analytics
+
+CONTRACT = {
+    "partner": "Stadtwerke Nord AG", "contract_number": "V-1", "start_date": "2024-01-01", "end_date": "2024-12-31",
+    "notice_period": "3 Monate", "amount": "50", "category": "Dienstleistung",
+}
+
+
+def _invoice(number, day, amount, cost_center="IT", contract_number="V-1"):
+    return {"invoice_number": number, "invoice_date": day, "cost_center": cost_center, "amount_net": amount, "contract_number": contract_number}
+
+
+@pytest.fixture
+def reports(client):
+    # Snapshot ist prozessweit: nach dem Zurücksetzen der Datenbank vollständig neu aufbauen
+    analytics.invalidate()
+    client.post("/contracts/", data=CONTRACT)
+    client.post("/invoices/", json=_invoice("R-1", "2024-01-10", 100))
+    client.post("/invoices/", json=_invoice("R-2", "2024-01-20", 50, cost_center="HR"))
+    client.post("/invoices/", json=_invoice("R-3", "2024-02-01", 10, contract_number=None))
+    client.post("/reports/snapshot/refresh")
+    return client
+
+
+def test_monthly_and_cost_center_totals(reports):
+    assert reports.get("/reports/invoices/monthly").json() == [
+        {"month": "2024-01", "amount_net": 150.0, "amount_gross": 178.5, "invoices": 2},
+        {"month": "2024-02", "amount_net": 10.0, "amount_gross": 11.9, "invoices": 1},
+    ]
+    february = reports.get("/reports/invoices/monthly", params={"date_from": "2024-02-01"}).json()
+    assert [row["month"] for row in february] == ["2024-02"]
+    assert [row["cost_center"] for row in reports.get("/reports/invoices/cost-centers").json()] == ["IT", "HR"]
+
+
+def test_spend_by_partner_joins_contract_numbers(reports):
+    rows = reports.get("/reports/partners/spend").json()
+    assert [(row["partner"], row["amount_net"], row["invoices"]) for row in rows] == [
+        ("Stadtwerke Nord AG", 150.0, 2),
+        (None, 10.0, 1),
+    ]
+
+
+def test_incremental_refresh_applies_updates_and_deletes(reports):
+    invoices = {invoice["invoice_number"]: invoice for invoice in reports.get("/invoices/").json()}
+    seq = reports.get("/reports/snapshot").json()["seq"]
+    reports.delete(f"/invoices/{invoices['R-3']['id']}")
+    budget_data = {"contract_number": "V-1", "initial_amount": 200, "start_date": "2024-01-01", "end_date": "2024-12-31"}
+    budget = reports.post("/budgets/", json=budget_data).json()
+    reports.post("/expenses/", json={"budget_id": budget["id"], "amount": 50, "date": "2024-03-01", "description": "x"})
+    version = reports.get(f"/budgets/{budget['id']}").json()["version"]
+    reports.put(f"/budgets/{budget['id']}", json={**budget_data, "initial_amount": 100, "version": version})
+
+    status = reports.post("/reports/snapshot/refresh").json()
+    assert status["seq"] > seq
+    assert status["rows"]["invoice"] == 2
+    assert [row["month"] for row in reports.get("/reports/invoices/monthly").json()] == ["2024-01"]
+    utilization = reports.get("/reports/budgets/utilization").json()
+    assert [(row["budget_id"], row["spent"], row["utilization"]) for row in utilization] == [(budget["id"], 50.0, 0.5)]
+
+
+def test_persisted_snapshot_is_rebuilt_when_rows_bypass_change_log(reports, db):
+    analytics.persist(analytics.current())
+    db.execute(text("DELETE FROM invoices WHERE invoice_number = 'R-3'"))
+    db.commit()
+
+    # Neustart simulieren: Snapshot von der Platte laden
+    analytics._snapshot = None
+    assert analytics.refresh().tables["invoice"].num_rows == 2
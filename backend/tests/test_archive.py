@@ -0,0 +1,56 @@
+import os
+from datetime import date
+
+import pytest
+
+from app import archive
+from app.database import ARCHIVE_DIR
+from app.models import ArchivedDocument, Contract
+
+
+def test_compaction_roundtrip(db, make_contract):
+    text = make_contract("text.txt", b"Vertragstext " * 1000, end_date=date(2020, 12, 31))
+    binary = make_contract("scan.pdf", os.urandom(4096), end_date=date(2020, 12, 31))
+    active = make_contract("active.pdf", b"laufend", end_date=date(2999, 1, 1))
+
+    report = archive.compact_archive(db, today=date(2021, 1, 1))
+
+    assert report["files"] == 2
+    assert not os.path.exists(text) and not os.path.exists(binary)
+    assert os.path.exists(active)
+    assert archive.read_document(db, text) == b"Vertragstext " * 1000
+    methods = {entry.document_path: entry.method for entry in db.query(ArchivedDocument)}
+    assert methods == {text: "zlib", binary: "store"}
+
+
+def test_read_document_detects_corruption(db, make_contract):
+    path = make_contract("scan.pdf", os.urandom(4096), end_date=date(2020, 12, 31))
+    archive.compact_archive(db, today=date(2021, 1, 1))
+    entry = db.query(ArchivedDocument).one()
+    with open(os.path.join(ARCHIVE_DIR, entry.pack_file), "r+b") as pack:
+        pack.seek(entry.offset + 10)
+        pack.write(b"\x00\x01\x02")
+
+    with pytest.raises(archive.CorruptDocumentError):
+        archive.read_document(db, path)
+
+
+def test_compaction_lock_is_exclusive_across_open_files(db):
+    import fcntl
+
+    with archive._compaction_lock():
+        # Eine zweite Sperre auf dieselbe Datei (wie von einem anderen Prozess) muss scheitern
+        with open(os.path.join(ARCHIVE_DIR, ".lock"), "w") as other:
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def test_deleting_contract_removes_archive_entry(db, make_contract, client):
+    make_contract("scan.pdf", os.urandom(4096), end_date=date(2020, 12, 31))
+    archive.compact_archive(db, today=date(2021, 1, 1))
+    contract_id = db.query(Contract.id).scalar()
+
+    assert client.delete(f"/contracts/{contract_id}").status_code == 200
+    db.expire_all()
+    assert db.query(ArchivedDocument).count() == 0
+    assert archive.archive_stats(db)["documents"] == 0
@@ -0,0 +1,66 @@
+import json
+import os
+import sqlite3
+from datetime import date
+
+import pytest
+
+from app import archive, backup
+from app.database import DATA_DIR, DOCUMENT_DIR
+
+
+@pytest.fixture
+def backup_dir(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path / "backups"))
+    return tmp_path
+
+
+def test_backup_verify_and_restore(db, make_contract, backup_dir):
+    path = make_contract("a.pdf", b"Inhalt A")
+    make_contract("old.txt", b"abgelaufen " * 500, end_date=date(2020, 12, 31))
+    archive.compact_archive(db, today=date(2021, 1, 1))
+    # Nicht referenzierte Uploads gehören nicht in den Snapshot
+    with open(os.path.join(DOCUMENT_DIR, "orphan.pdf"), "wb") as f:
+        f.write(b"verwaist")
+
+    report = backup.create_backup()
+    assert report["documents"] == 2  # a.pdf und das Archivpaket
+    verified = backup.verify_backup(report["snapshot"])
+    assert verified["ok"], verified["errors"]
+
+    target = backup_dir / "restore"
+    backup.restore_backup(report["snapshot"], str(target))
+    with open(target / os.path.relpath(path, DATA_DIR), "rb") as f:
+        assert f.read() == b"Inhalt A"
+    assert not (target / "documents" / "orphan.pdf").exists()
+    conn = sqlite3.connect(target / "contracts.db")
+    assert conn.execute("SELECT COUNT(*) FROM contracts").fetchone()[0] == 2
+    conn.close()
+
+
+def test_verify_detects_corrupt_object(make_contract, backup_dir):
+    make_contract("a.pdf", b"Inhalt A")
+    name = backup.create_backup()["snapshot"]
+    with open(os.path.join(backup.BACKUP_DIR, "snapshots", name, "manifest.json")) as f:
+        entry = json.load(f)["files"][0]
+    with open(backup._object_path(entry["sha256"]), "wb") as f:
+        f.write(b"kaputt")
+
+    verified = backup.verify_backup(name)
+    assert not verified["ok"]
+    assert verified["errors"] == [f"checksum mismatch: {entry['path']}"]
+
+
+def test_growing_files_only_copy_new_chunks(make_contract, backup_dir, monkeypatch):
+    monkeypatch.setattr(backup, "OBJECT_CHUNK_SIZE", 1024)
+    path = make_contract("gross.bin", os.urandom(4096))
+    first = backup.create_backup()
+    assert first["copied_bytes"] == 4096
+
+    with open(path, "ab") as f:
+        f.write(os.urandom(100))
+    os.utime(path, (1, 1))
+    second = backup.create_backup()
+    assert second["copied_bytes"] == 100
+    assert backup.verify_backup(second["snapshot"])["ok"]
+
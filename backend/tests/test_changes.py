@@ -0,0 +1,73 @@
+import threading
+import time
+from datetime import date
+
+from sqlalchemy import event
+
+from app import crud
+from app.models import ChangeLog, Contract
+from app.schemas import InvoiceCreate
+
+
+def _invoice(number):
+    return InvoiceCreate(invoice_number=number, invoice_date=date(2024, 3, 1), contract_number="K1",
+                         cost_center="CC", amount_net=100.0)
+
+
+def test_bulk_changes_flush_once(db):
+    flushes = []
+    event.listen(db, "after_flush", lambda session, context: flushes.append(1))
+    invoices = [crud.create_invoice(db, _invoice(f"R{i}")) for i in range(50)]
+    db.commit()
+
+    # Ein Flush für die Rechnungen, einer für die ChangeLog-Zeilen
+    assert len(flushes) == 2
+    changes = db.query(ChangeLog).order_by(ChangeLog.seq).all()
+    assert [change.entity_id for change in changes] == [invoice.id for invoice in invoices]
+
+
+def test_rollback_discards_pending_changes(db):
+    crud.create_invoice(db, _invoice("R1"))
+    db.rollback()
+    db.add(Contract(partner="Test GmbH", start_date=date(2024, 1, 1), end_date=date(2024, 12, 31),
+                    notice_period="3 Monate", amount=100, category="IT"))
+    db.commit()
+    assert db.query(ChangeLog).count() == 0
+
+
+def test_feed_reports_updates_and_deletes(client):
+    form = {"partner": "Test GmbH", "start_date": "2024-01-01", "end_date": "2024-12-31",
+            "notice_period": "3 Monate", "amount": "100", "category": "IT"}
+    contract = client.post("/contracts/", data=form).json()
+    updated = client.put(f"/contracts/{contract['id']}", data={**form, "amount": "200", "version": str(contract["version"])}).json()
+    client.delete(f"/contracts/{contract['id']}")
+
+    feed = client.get("/changes/?since=0").json()
+    operations = [(change["operation"], change["payload"]["amount"], change["payload"]["version"]) for change in feed["changes"]]
+    # Die Payload trägt den Stand nach dem Flush, also dieselbe Zeilenversion wie die Antwort
+    assert operations == [
+        ("create", 100, contract["version"]),
+        ("update", 200, updated["version"]),
+        ("delete", 200, updated["version"]),
+    ]
+    assert client.get(f"/changes/?since={feed['last_seq']}").json()["changes"] == []
+
+
+def test_long_poll_does_not_block_the_event_loop(client, monkeypatch):
+    from app import main
+
+    fetch = main._fetch_changes
+
+    def slow_fetch(since, limit):
+        time.sleep(0.3)
+        return fetch(since, limit)
+
+    monkeypatch.setattr(main, "_fetch_changes", slow_fetch)
+    poll = threading.Thread(target=client.get, args=("/changes/?wait=1.5",))
+    poll.start()
+    time.sleep(0.1)
+    # Die Abfragen des Long-Polls laufen im Threadpool; andere Anfragen warten nicht darauf
+    started = time.perf_counter()
+    assert client.get("/health").status_code == 200
+    assert time.perf_counter() - started < 0.2
+    poll.join()
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("args", [
+    ["app.archive"],
+    ["app.integrity"],
+    ["app.partitions", "status"],
+    ["app.einvoice", "inbox"],
+])
+def test_cli_runs_on_fresh_data_dir(tmp_path, args):
+    # Die Werkzeuge laufen ohne vorherigen Serverstart und legen das Schema selbst an
+    (tmp_path / "inbox").mkdir()
+    args = [str(tmp_path / arg) if arg == "inbox" else arg for arg in args]
+    result = subprocess.run(
+        [sys.executable, "-m", *args],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "DATA_DIR": str(tmp_path)},
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
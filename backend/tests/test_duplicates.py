@@ -0,0 +1,57 @@
+from datetime import date
+
+from app import duplicates
+from app.models import Invoice
+
+INVOICE = {"invoice_number": "R-2024/001", "invoice_date": "2024-03-05", "cost_center": "it", "amount_net": 100.0}
+
+
+def test_dedup_key_normalizes_number_cost_center_and_month():
+    key = duplicates.dedup_key("R-2024/001", "it ", 100.0, date(2024, 3, 5))
+    assert duplicates.dedup_key("r 2024 001", "IT", 100.0, date(2024, 3, 28)) == key
+    assert duplicates.dedup_key("R-2024/001", "IT", 100.01, date(2024, 3, 5)) != key
+    assert duplicates.dedup_key("R-2024/001", "IT", 100.0, date(2024, 4, 5)) != key
+
+
+def test_duplicate_is_rejected_unless_allowed(client):
+    first = client.post("/invoices/", json=INVOICE).json()
+    duplicate = client.post("/invoices/", json={**INVOICE, "invoice_number": "R2024001", "invoice_date": "2024-03-20"})
+    assert duplicate.status_code == 409
+    assert duplicate.json()["detail"]["duplicate_of"] == first["id"]
+
+    assert client.post("/invoices/", params={"allow_duplicate": True}, json=INVOICE).status_code == 200
+
+
+def test_bulk_skips_existing_and_repeated_rows(client):
+    existing = client.post("/invoices/", json=INVOICE).json()
+    other = {**INVOICE, "invoice_number": "R-2024/002"}
+    report = client.post("/invoices/bulk", json=[INVOICE, other, other]).json()
+
+    assert len(report["created"]) == 1
+    assert report["duplicates"] == [
+        {"index": 0, "invoice_number": "R-2024/001", "duplicate_of": existing["id"], "duplicate_of_index": None},
+        {"index": 2, "invoice_number": "R-2024/002", "duplicate_of": None, "duplicate_of_index": 1},
+    ]
+
+
+def test_backfill_keys_for_unkeyed_invoices(db):
+    db.add(Invoice(invoice_number="R-1", invoice_date=date(2024, 3, 5), cost_center="IT", amount_net=10.0, amount_gross=11.9))
+    db.commit()
+    invoice = db.query(Invoice).one()
+    version = invoice.version
+
+    assert duplicates.backfill_keys(db) == 1
+    db.refresh(invoice)
+    assert invoice.dedup_key == duplicates.dedup_key("R-1", "IT", 10.0, date(2024, 3, 5))
+    assert invoice.version == version
+    assert duplicates.find_existing(db, [invoice.dedup_key], [invoice.invoice_date]) == {invoice.dedup_key: invoice.id}
+    assert duplicates.backfill_keys(db) == 0
+
+
+def test_scan_clusters_probable_duplicates(client):
+    a = client.post("/invoices/", json=INVOICE).json()
+    b = client.post("/invoices/", params={"allow_duplicate": True}, json={**INVOICE, "invoice_number": "R-2024-001"}).json()
+    client.post("/invoices/", json={**INVOICE, "invoice_number": "X-1", "amount_net": 5.0, "invoice_date": "2024-05-01"})
+
+    clusters = client.get("/invoices/duplicates").json()
+    assert [cluster["invoice_ids"] for cluster in clusters] == [[a["id"], b["id"]]]
@@ -0,0 +1,114 @@
+import io
+import os
+import zlib
+
+import pytest
+
+from app import einvoice
+
+UBL = """<?xml version="1.0" encoding="UTF-8"?>
+<Invoice xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
+         xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2"
+         xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2">
+  <cbc:ID>{number}</cbc:ID>
+  <cbc:IssueDate>2024-03-05</cbc:IssueDate>
+  <cbc:AccountingCost>IT</cbc:AccountingCost>
+  <cac:ContractDocumentReference><cbc:ID>V-7</cbc:ID></cac:ContractDocumentReference>
+  <cac:LegalMonetaryTotal>
+    <cbc:TaxExclusiveAmount>100.00</cbc:TaxExclusiveAmount>
+    <cbc:TaxInclusiveAmount>107.00</cbc:TaxInclusiveAmount>
+  </cac:LegalMonetaryTotal>
+  <cac:InvoiceLine><cbc:ID>1</cbc:ID></cac:InvoiceLine>
+</Invoice>
+"""
+
+CII = """<?xml version="1.0" encoding="UTF-8"?>
+<rsm:CrossIndustryInvoice xmlns:rsm="urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100"
+    xmlns:ram="urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100"
+    xmlns:udt="urn:un:unece:uncefact:data:standard:UnqualifiedDataType:100">
+  <rsm:ExchangedDocument>
+    <ram:ID>{number}</ram:ID>
+    <ram:IssueDateTime><udt:DateTimeString format="102">20240305</udt:DateTimeString></ram:IssueDateTime>
+  </rsm:ExchangedDocument>
+  <rsm:SupplyChainTradeTransaction>
+    <ram:ApplicableHeaderTradeSettlement>
+      <ram:SpecifiedTradeSettlementHeaderMonetarySummation>
+        <ram:TaxBasisTotalAmount>200.00</ram:TaxBasisTotalAmount>
+        <ram:GrandTotalAmount>238.00</ram:GrandTotalAmount>
+      </ram:SpecifiedTradeSettlementHeaderMonetarySummation>
+    </ram:ApplicableHeaderTradeSettlement>
+  </rsm:SupplyChainTradeTransaction>
+</rsm:CrossIndustryInvoice>
+"""
+
+
+def _pdf(xml: bytes, with_length: bool) -> bytes:
+    stream = zlib.compress(xml)
+    length = f"/Length {len(stream)} " if with_length else ""
+    return (
+        b"%PDF-1.7\n1 0 obj\n<< /Type /EmbeddedFile /Subtype /text#2Fxml " + length.encode()
+        + b"/Filter /FlateDecode >>\nstream\n" + stream + b"\nendstream\nendobj\n%%EOF\n"
+    )
+
+
+def _xml_compressing_to_trailing_newline() -> bytes:
+    # Rechnungsnummer so wählen, dass der komprimierte Stream auf ein Zeilenende-Byte endet
+    for i in range(10000):
+        xml = CII.format(number=f"ZF-{i}").encode()
+        if zlib.compress(xml)[-1:] in (b"\n", b"\r"):
+            return xml
+    raise AssertionError("no suitable document found")
+
+
+def test_parse_ubl_and_cii():
+    ubl = einvoice.parse_document(io.BytesIO(UBL.format(number="R-1").encode()))
+    assert ubl == {
+        "invoice_number": "R-1", "invoice_date": ubl["invoice_date"], "contract_number": "V-7",
+        "cost_center": "IT", "amount_net": 100.0, "amount_gross": 107.0,
+    }
+    assert str(ubl["invoice_date"]) == "2024-03-05"
+
+    cii = einvoice.parse_document(io.BytesIO(CII.format(number="ZF-1").encode()))
+    assert (cii["invoice_number"], str(cii["invoice_date"]), cii["cost_center"]) == ("ZF-1", "2024-03-05", "EINGANG")
+
+
+@pytest.mark.parametrize("with_length", [True, False])
+def test_pdf_payload_ending_in_newline_byte(with_length):
+    xml = _xml_compressing_to_trailing_newline()
+    assert einvoice.extract_xml_from_pdf(_pdf(xml, with_length)) == xml
+    assert einvoice.parse_document(io.BytesIO(_pdf(xml, with_length)))["amount_net"] == 200.0
+
+
+@pytest.mark.parametrize("document, message", [
+    (b"<Invoice><cbc:ID>", "Malformed XML"),
+    (b"<Order/>", "Unsupported root element"),
+    (UBL.format(number="R-1").replace("100.00", "abc").encode(), "Invalid invoice data"),
+    (UBL.format(number="R-1").replace("2024-03-05", "05.03.2024").encode(), "Invalid invoice date"),
+])
+def test_invalid_documents_raise_einvoice_error(document, message):
+    with pytest.raises(einvoice.EInvoiceError, match=message):
+        einvoice.parse_document(io.BytesIO(document))
+
+
+def test_upload_reports_errors_per_file(client):
+    files = [
+        ("files", ("good.xml", UBL.format(number="R-1"), "application/xml")),
+        ("files", ("broken.xml", "<Invoice><unclosed>", "application/xml")),
+        ("files", ("again.xml", UBL.format(number="R-1"), "application/xml")),
+    ]
+    report = client.post("/invoices/import/einvoice", files=files).json()
+    assert (report["imported"], report["duplicates"], report["files"]) == (1, 1, 3)
+    assert [error["file"] for error in report["errors"]] == ["broken.xml"]
+
+
+def test_inbox_moves_failed_files(db, tmp_path):
+    (tmp_path / "a.xml").write_text(UBL.format(number="R-1"))
+    (tmp_path / "b.xml").write_text("not xml at all")
+    (tmp_path / "c.pdf").write_bytes(_pdf(CII.format(number="ZF-2").encode(), True))
+
+    report = einvoice.import_inbox(str(tmp_path))
+    assert report["imported"] == 2
+    assert [os.path.basename(error["file"]) for error in report["errors"]] == ["b.xml"]
+    assert sorted(os.listdir(tmp_path / "done")) == ["a.xml", "c.pdf"]
+    assert os.listdir(tmp_path / "failed") == ["b.xml"]
+    assert einvoice.import_inbox(str(tmp_path)) is None
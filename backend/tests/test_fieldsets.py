@@ -0,0 +1,60 @@
+CONTRACT = {
+    "partner": "Stadtwerke Nord AG", "start_date": "2024-01-01", "end_date": "2024-12-31",
+    "notice_period": "3 Monate", "amount": "50", "category": "Dienstleistung", "notes": "x" * 2000,
+}
+BUDGET = {"contract_number": "K1", "initial_amount": 1000, "start_date": "2024-01-01", "end_date": "2024-12-31"}
+
+
+def test_fields_project_columns_and_always_include_id(client):
+    contract = client.post("/contracts/", data=CONTRACT).json()
+    rows = client.get("/contracts/", params={"fields": "amount,partner"}).json()
+    assert rows == [{"id": contract["id"], "partner": "Stadtwerke Nord AG", "amount": 50.0}]
+
+    detail = client.get(f"/contracts/{contract['id']}", params={"fields": "start_date"}).json()
+    assert detail == {"id": contract["id"], "start_date": "2024-01-01"}
+
+    # Ohne fields bleibt die Antwort vollständig
+    assert client.get("/contracts/").json()[0]["notes"] == CONTRACT["notes"]
+
+
+def test_unknown_fields_and_includes_are_rejected(client):
+    assert client.get("/contracts/", params={"fields": "partner,secret"}).status_code == 400
+    assert client.get("/invoices/", params={"fields": "dedup_key"}).status_code == 400
+    assert client.get("/budgets/", params={"include": "everything"}).status_code == 400
+
+
+def test_budget_includes(client):
+    budget = client.post("/budgets/", json=BUDGET).json()
+    client.post("/expenses/", json={"budget_id": budget["id"], "amount": 30, "date": "2024-03-01", "description": "a"})
+
+    plain = client.get("/budgets/", params={"fields": "initial_amount"}).json()
+    assert plain == [{"id": budget["id"], "initial_amount": 1000.0}]
+
+    spent = client.get(f"/budgets/{budget['id']}", params={"fields": "initial_amount", "include": "spent"}).json()
+    assert spent == {"id": budget["id"], "initial_amount": 1000.0, "spent": 30.0}
+
+    with_expenses = client.get(f"/budgets/{budget['id']}", params={"include": "expenses"}).json()
+    assert [expense["amount"] for expense in with_expenses["expenses"]] == [30.0]
+    assert client.get("/budgets/999", params={"include": "spent"}).status_code == 404
+
+
+def test_gzip_for_large_responses_only(client):
+    for number in range(20):
+        client.post("/contracts/", data={**CONTRACT, "contract_number": f"V-{number}"})
+
+    large = client.get("/contracts/", headers={"Accept-Encoding": "gzip"})
+    assert large.headers["content-encoding"] == "gzip"
+    assert len(large.json()) == 20
+
+    small = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+
+
+def test_documents_are_not_compressed(client):
+    contract = client.post(
+        "/contracts/", data=CONTRACT, files={"file": ("scan.txt", b"a" * 50000, "text/plain")}
+    ).json()
+    response = client.get(f"/contracts/{contract['id']}/document", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.content == b"a" * 50000
@@ -0,0 +1,57 @@
+from datetime import date
+
+import pytest
+
+from app import forecast
+from app.models import Budget, Expense
+
+
+@pytest.fixture
+def budgets(db):
+    forecast.invalidate()
+
+    def add(start, end, initial, expenses=()):
+        budget = Budget(contract_number="K", initial_amount=initial, start_date=start, end_date=end)
+        db.add(budget)
+        db.flush()
+        db.add_all(Expense(budget_id=budget.id, amount=amount, date=day) for day, amount in expenses)
+        db.commit()
+        return budget.id
+
+    return add
+
+
+def _by_id(db, today):
+    forecast.invalidate()
+    return {item["budget_id"]: item for item in forecast.budget_forecast(db, today=today)}
+
+
+def test_burn_rate_and_exhaustion(db, budgets):
+    # 10 Tage verstrichen, 500 € ausgegeben -> 50 €/Tag, Rest 500 € reicht 10 Tage
+    budget_id = budgets(date(2024, 1, 1), date(2024, 12, 31), 1000, [(date(2024, 1, 5), 500)])
+    item = _by_id(db, date(2024, 1, 10))[budget_id]
+
+    assert item["status"] == "active"
+    assert item["daily_burn_rate"] == 50.0
+    assert item["exhaustion_date"] == date(2024, 1, 20)
+    assert item["at_risk"] is True
+
+
+def test_budget_not_started_has_no_burn_rate(db, budgets):
+    budget_id = budgets(date(2025, 1, 1), date(2025, 12, 31), 1000, [(date(2024, 12, 1), 200)])
+    item = _by_id(db, date(2024, 12, 15))[budget_id]
+
+    assert item["status"] == "not_started"
+    assert item["daily_burn_rate"] == 0.0
+    assert item["exhaustion_date"] is None
+    assert item["projected_remaining_at_end"] == 800.0
+    assert item["at_risk"] is False
+
+
+def test_ended_budget_projects_actual_spend(db, budgets):
+    budget_id = budgets(date(2023, 1, 1), date(2023, 12, 31), 1000, [(date(2023, 6, 1), 400)])
+    item = _by_id(db, date(2024, 6, 1))[budget_id]
+
+    assert item["status"] == "ended"
+    assert item["projected_spent_at_end"] == 400.0
+    assert item["at_risk"] is False
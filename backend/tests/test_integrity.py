@@ -0,0 +1,93 @@
+import os
+import time
+
+import pytest
+
+from app import integrity
+from app.database import DOCUMENT_DIR
+from app.models import Contract
+
+
+def _write(name, data):
+    os.makedirs(DOCUMENT_DIR, exist_ok=True)
+    path = os.path.join(DOCUMENT_DIR, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_scan_reports_orphans_dangling_and_hashes_incrementally(db, make_contract):
+    make_contract("a.pdf", b"a")
+    orphan = _write("orphan.pdf", b"o")
+    missing = make_contract("missing.pdf", None)
+
+    first = integrity.scan(db)
+    assert first["hashed"] == 2
+    assert first["orphans"] == [orphan]
+    assert first["dangling"] == [missing]
+
+    # Unveränderte Dateien werden beim nächsten Scan nicht erneut gehasht
+    assert integrity.scan(db)["hashed"] == 0
+
+
+def test_full_scan_detects_silent_corruption(db, make_contract):
+    path = make_contract("a.pdf", b"original")
+    integrity.scan(db)
+    stat = os.stat(path)
+    with open(path, "wb") as f:
+        f.write(b"beschaed")  # gleiche Länge
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert integrity.scan(db)["corrupted"] == []
+    assert integrity.scan(db, full=True)["corrupted"] == [path]
+
+
+def test_garbage_collection_respects_grace_period(db):
+    old = _write("old.pdf", b"x")
+    fresh = _write("fresh.pdf", b"y")
+    past = time.time() - integrity.GC_GRACE_SECONDS - 10
+    os.utime(old, (past, past))
+
+    assert integrity.collect_garbage(db, dry_run=True)["removed"] == [old]
+    assert os.path.exists(old)
+    integrity.collect_garbage(db, dry_run=False)
+    assert not os.path.exists(old) and os.path.exists(fresh)
+
+
+def _age(*paths):
+    past = time.time() - integrity.GC_GRACE_SECONDS - 10
+    for path in paths:
+        os.utime(path, (past, past))
+
+
+def test_relocated_data_dir_matches_stored_paths(db, make_contract):
+    # Verweise wurden im Container unter /app/data gespeichert, die Dateien liegen jetzt im Test-DATA_DIR
+    kept = make_contract("a.pdf", b"a")
+    db.query(Contract).update({Contract.document_path: "/app/data/documents/a.pdf"})
+    db.commit()
+    orphan = _write("orphan.pdf", b"o")
+    _age(kept, orphan)
+
+    report = integrity.scan(db)
+    assert report["orphans"] == [orphan]
+    assert report["dangling"] == []
+    assert integrity.collect_garbage(db, dry_run=False)["removed"] == [orphan]
+    assert os.path.exists(kept)
+
+
+def test_garbage_collection_refuses_when_no_reference_resolves(db, make_contract):
+    path = make_contract("a.pdf", b"a")
+    db.query(Contract).update({Contract.document_path: "/srv/elsewhere/a.pdf"})
+    db.commit()
+    _age(path)
+
+    with pytest.raises(integrity.UnresolvedReferencesError):
+        integrity.collect_garbage(db, dry_run=False)
+    assert os.path.exists(path)
+
+
+def test_scan_endpoint_requires_post(client, make_contract):
+    make_contract("a.pdf", b"a")
+    # Der Scan schreibt Prüfsummen: per GET (Crawler, Prefetch) nicht erreichbar
+    assert client.get("/integrity/scan").status_code == 405
+    assert client.post("/integrity/scan").json()["hashed"] == 1
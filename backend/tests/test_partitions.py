@@ -0,0 +1,103 @@
+from datetime import date
+
+from app import database, partitions
+from app.database import SessionLocal
+from app.models import Expense, Invoice
+
+
+def _invoice(number, day, amount=100.0):
+    return {"invoice_number": number, "invoice_date": day, "cost_center": "IT", "amount_net": amount}
+
+
+def _numbers(client, **params):
+    return sorted(invoice["invoice_number"] for invoice in client.get("/invoices/", params=params).json())
+
+
+def test_archive_moves_rows_and_reads_through(client):
+    client.post("/invoices/", json=_invoice("R-2023-1", "2023-05-01"))
+    client.post("/invoices/", json=_invoice("R-2023-2", "2023-12-31"))
+    client.post("/invoices/", json=_invoice("R-2024-1", "2024-01-01"))
+    budget = client.post("/budgets/", json={"contract_number": "K", "initial_amount": 500, "start_date": "2023-01-01", "end_date": "2024-12-31"}).json()
+    client.post("/expenses/", json={"budget_id": budget["id"], "amount": 40, "date": "2023-06-01", "description": "x"})
+
+    report = client.post("/partitions/2023/archive").json()
+    assert report["moved"] == {"invoices": 2, "expenses": 1}
+
+    assert _numbers(client) == ["R-2023-1", "R-2023-2", "R-2024-1"]
+    assert _numbers(client, date_from="2024-01-01") == ["R-2024-1"]
+    assert _numbers(client, date_to="2023-06-30") == ["R-2023-1"]
+    assert client.get(f"/budgets/{budget['id']}", params={"include": "spent"}).json()["spent"] == 40
+
+    status = client.get("/partitions/").json()
+    assert [(entry["fiscal_year"], entry["rows"], entry["pending"]) for entry in status] == [
+        (2023, {"invoices": 2, "expenses": 1}, {"invoices": 0, "expenses": 0}),
+    ]
+
+
+def test_late_rows_are_moved_by_repeated_archive_and_ids_stay_unique(client):
+    archived = client.post("/invoices/", json=_invoice("R-1", "2023-05-01")).json()
+    client.post("/partitions/2023/archive")
+
+    late = client.post("/invoices/", json=_invoice("R-2", "2023-07-01")).json()
+    assert late["id"] > archived["id"]
+    assert client.get("/partitions/").json()[0]["pending"]["invoices"] == 1
+
+    assert client.post("/partitions/2023/archive").json()["moved"]["invoices"] == 1
+    assert client.get("/partitions/").json()[0]["rows"]["invoices"] == 2
+
+
+def test_detach_and_attach(client):
+    client.post("/invoices/", json=_invoice("R-1", "2023-05-01"))
+    client.post("/partitions/2023/archive")
+
+    assert client.post("/partitions/2023/detach").status_code == 200
+    assert _numbers(client) == []
+    assert client.post("/partitions/2023/archive").status_code == 400
+    assert client.post("/partitions/2023/detach").status_code == 404
+
+    assert client.post("/partitions/2023/attach").status_code == 200
+    assert _numbers(client) == ["R-1"]
+
+
+def test_open_year_cannot_be_archived(client):
+    year = partitions.fiscal_year(partitions.date.today())
+    assert client.post(f"/partitions/{year}/archive").status_code == 400
+
+
+def test_checkout_does_not_list_partition_directory(db, monkeypatch):
+    calls = []
+    original = database.partition_files
+    monkeypatch.setattr(database, "partition_files", lambda: calls.append(1) or original())
+
+    def checkout():
+        session = SessionLocal()
+        session.connection()
+        session.close()
+
+    # Nur der Verbindungsaufbau liest das Verzeichnis; Checkouts vergleichen den Änderungszähler
+    for _ in range(5):
+        checkout()
+    assert len(calls) == 1
+
+    database.partitions_changed()
+    checkout()
+    assert len(calls) == 2
+
+
+def test_multi_row_flush_after_archiving_the_highest_ids(client, db):
+    budget = client.post("/budgets/", json={"contract_number": "K", "initial_amount": 500, "start_date": "2023-01-01", "end_date": "2024-12-31"}).json()
+    client.post("/expenses/", json={"budget_id": budget["id"], "amount": 40, "date": "2023-06-01", "description": "x"})
+    highest = client.post("/invoices/", json=_invoice("R-2023", "2023-05-01")).json()
+    client.post("/partitions/2023/archive")
+
+    # Mehrere neue Zeilen in einem Commit: alle IDs liegen über den archivierten und sind verschieden
+    for i in range(1, 4):
+        db.add(Invoice(invoice_number=f"R-{i}", invoice_date=date(2024, 1, i), cost_center="IT",
+                       amount_net=1.0, amount_gross=1.19))
+        db.add(Expense(budget_id=budget["id"], amount=1.0, date=date(2024, 1, i), description="y"))
+    db.commit()
+
+    invoice_ids = sorted(invoice["id"] for invoice in client.get("/invoices/").json())
+    assert invoice_ids == [highest["id"], highest["id"] + 1, highest["id"] + 2, highest["id"] + 3]
+    expense_ids = [expense["id"] for expense in client.get(f"/budgets/{budget['id']}").json()["expenses"]]
+    assert len(set(expense_ids)) == 4
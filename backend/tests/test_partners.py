@@ -0,0 +1,63 @@
+from datetime import date
+
+import pytest
+
+from app import partners
+from app.models import Contract, Partner
+
+CONTRACT = {
+    "start_date": "2024-01-01", "end_date": "2024-12-31", "notice_period": "3 Monate",
+    "amount": "10", "category": "Sonstiges",
+}
+
+
+@pytest.fixture(autouse=True)
+def fresh_index():
+    # Der Index lebt im Prozess; nach dem Zurücksetzen der Datenbank neu aufbauen
+    partners.invalidate()
+    yield
+    partners.invalidate()
+
+
+def test_normalize_ignores_legal_form_order_and_umlauts():
+    assert partners.normalize("Max Mustermann GmbH") == partners.normalize("Mustermann GmbH, Max") == "max mustermann"
+    assert partners.normalize("Müller & Söhne e.K.") == partners.normalize("Mueller Soehne") == "mueller soehne"
+    # Nur Rechtsform: Name nicht zu einem leeren Schlüssel reduzieren
+    assert partners.normalize("GmbH") == "gmbh"
+
+
+def test_contracts_share_partner_and_autocomplete_finds_it(client):
+    first = client.post("/contracts/", data={**CONTRACT, "partner": "Max Mustermann GmbH"}).json()
+    second = client.post("/contracts/", data={**CONTRACT, "partner": "Mustermann GmbH, Max"}).json()
+    other = client.post("/contracts/", data={**CONTRACT, "partner": "Stadtwerke Nord AG"}).json()
+    assert first["partner_id"] == second["partner_id"] != other["partner_id"]
+
+    for query in ("muster", "Mustremann"):
+        matches = client.get("/partners/autocomplete", params={"q": query}).json()
+        assert matches[0]["id"] == first["partner_id"]
+
+    listed = client.get("/contracts/", params={"partner_id": first["partner_id"]}).json()
+    assert sorted(contract["id"] for contract in listed) == [first["id"], second["id"]]
+
+
+def test_dedupe_merges_partners_and_links_contracts(db):
+    a = Partner(name="Mustermann GmbH", normalized="mustermann")
+    b = Partner(name="Orphan AG", normalized="orphan")
+    db.add_all([a, b])
+    db.flush()
+    db.add_all([
+        Contract(partner="Mustermann GmbH", partner_id=b.id, **_contract_fields()),
+        Contract(partner="MUSTERMANN", **_contract_fields()),
+        Contract(partner="Neu GmbH", **_contract_fields()),
+    ])
+    db.commit()
+
+    report = partners.dedupe(db)
+    assert report == {"partners": 2, "partners_created": 1, "partners_removed": 1, "contracts_relinked": 3}
+    linked = {contract.partner: contract.partner_id for contract in db.query(Contract)}
+    assert linked["Mustermann GmbH"] == linked["MUSTERMANN"] == a.id
+    assert {partner.name for partner in db.query(Partner)} == {"Mustermann GmbH", "Neu GmbH"}
+
+
+def _contract_fields():
+    return {"start_date": date(2024, 1, 1), "end_date": date(2024, 12, 31), "notice_period": "-", "amount": 1.0, "category": "Sonstiges"}
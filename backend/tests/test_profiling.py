@@ -0,0 +1,62 @@
+import time
+
+import anyio
+import pytest
+
+from app import profiling
+
+
+@pytest.fixture
+def fast_sampling(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_INTERVAL", 0.001)
+    monkeypatch.setattr(profiling, "PROFILE_MIN_INTERVAL", 0)
+
+
+def _profiled_work(deadline):
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+def _other_request_work(deadline):
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+def test_only_worker_threads_of_the_profiled_request_are_sampled(fast_sampling):
+    async def main():
+        profile = profiling.Profile({"method": "GET", "path": "/test"})
+        deadline = time.perf_counter() + 0.3
+
+        async def profiled():
+            token = profiling._current.set(profile)
+            try:
+                await anyio.to_thread.run_sync(_profiled_work, deadline)
+            finally:
+                profiling._current.reset(token)
+
+        profile.start()
+        async with anyio.create_task_group() as group:
+            group.start_soon(profiled)
+            group.start_soon(anyio.to_thread.run_sync, _other_request_work, deadline)
+        profile.stop()
+        return profile
+
+    profile = anyio.run(main)
+    folded = profile.collapsed()
+    assert "_profiled_work" in folded
+    assert "_other_request_work" not in folded
+    assert profile.report()["thread_samples"]["worker"] > 0
+
+
+def test_profile_header_and_report(client, fast_sampling):
+    response = client.get("/budgets/", headers={"X-Profile": "1"})
+    profile_id = int(response.headers["x-profile-id"])
+
+    report = client.get(f"/admin/profiles/{profile_id}").json()
+    assert report["path"] == "/budgets/"
+    assert report["status"] == 200
+    assert report["sql"]["queries"] >= 1
+    assert set(report["thread_samples"]) == {"event_loop", "worker"}
+    # Der Profiler läuft innerhalb der Admission Control; deren Wartezeit steht getrennt im Profil
+    assert report["admission_wait_ms"] is not None
+    assert "x-profile-id" not in client.get("/budgets/").headers
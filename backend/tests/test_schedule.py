@@ -0,0 +1,75 @@
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from app import schedule
+from app.models import CashFlowMonth, Contract
+
+CONTRACT = {
+    "partner": "Stadtwerke", "start_date": "2024-01-31", "end_date": "2024-12-31",
+    "notice_period": "3 Monate", "amount": "100", "category": "Abonnement",
+}
+
+
+@pytest.mark.parametrize("start, months, expected", [
+    (date(2024, 1, 31), 1, date(2024, 2, 29)),
+    (date(2023, 1, 31), 1, date(2023, 2, 28)),
+    (date(2024, 2, 29), 12, date(2025, 2, 28)),
+    (date(2024, 11, 30), 3, date(2025, 2, 28)),
+    (date(2024, 12, 15), 1, date(2025, 1, 15)),
+    (date(2024, 3, 31), -1, date(2024, 2, 29)),
+])
+def test_add_months_clamps_to_month_end(start, months, expected):
+    assert schedule.add_months(start, months) == expected
+
+
+def test_month_end_correction_does_not_accumulate():
+    contract = SimpleNamespace(
+        id=1, start_date=date(2024, 1, 31), end_date=date(2024, 6, 30),
+        amount=10.0, payment_interval="monthly", category="Abonnement",
+    )
+    due = [row["due_date"] for row in schedule.schedule_rows(contract)]
+    assert due == [
+        date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31),
+        date(2024, 4, 30), date(2024, 5, 31), date(2024, 6, 30),
+    ]
+
+
+def test_cash_flow_follows_contract_changes(client):
+    contract = client.post("/contracts/", data=CONTRACT).json()
+    flow = client.get("/cashflow/", params={"date_from": "2024-01-01", "date_to": "2024-12-31"}).json()
+    assert len(flow) == 12
+    assert flow[1] == {"month": "2024-02", "amount": 100.0, "payments": 1}
+
+    client.delete(f"/contracts/{contract['id']}")
+    assert client.get("/cashflow/", params={"date_from": "2024-01-01", "date_to": "2024-12-31"}).json() == []
+
+
+def test_open_ended_contract_is_bounded():
+    contract = SimpleNamespace(
+        id=1, start_date=date(2024, 1, 15), end_date=date(9999, 12, 31),
+        amount=10.0, payment_interval="monthly", category="Abonnement",
+    )
+    rows = schedule.schedule_rows(contract)
+    assert len(rows) == 12 * schedule.SCHEDULE_MAX_YEARS + 1
+    assert rows[-1]["due_date"] == date(2024 + schedule.SCHEDULE_MAX_YEARS, 1, 15)
+
+
+def test_monthly_totals_do_not_drift(db):
+    def contract(amount):
+        row = Contract(partner="Stadtwerke", start_date=date(2024, 1, 1), end_date=date(2024, 1, 31),
+                       notice_period="3 Monate", amount=amount, category="Abonnement")
+        db.add(row)
+        schedule.refresh_contract(db, row)
+        return row
+
+    contract(0.1)
+    changing = contract(0.2)
+    # Viele Änderungen im selben Monat: Float-Summen mit ±Upserts würden hier abweichen
+    for amount in [0.7, 19.99, 0.03, 0.2] * 100:
+        changing.amount = amount
+        schedule.refresh_contract(db, changing)
+    schedule.delete_contract(db, changing.id)
+    db.commit()
+    assert db.query(CashFlowMonth.amount, CashFlowMonth.payments).one() == (0.1, 1)
@@ -0,0 +1,27 @@
+import time
+from datetime import datetime
+
+BUDGET = {"contract_number": "K1", "initial_amount": 1000, "start_date": "2024-01-01", "end_date": "2024-12-31"}
+
+
+def test_stale_version_is_rejected(client):
+    budget = client.post("/budgets/", json=BUDGET).json()
+    first = client.put(f"/budgets/{budget['id']}", json={**BUDGET, "initial_amount": 1200, "version": budget["version"]})
+    assert first.status_code == 200
+    assert first.json()["version"] == budget["version"] + 1
+
+    stale = client.put(f"/budgets/{budget['id']}", json={**BUDGET, "initial_amount": 900, "version": budget["version"]})
+    assert stale.status_code == 409
+
+
+def test_updated_since_returns_only_changed_rows(client):
+    old = client.post("/budgets/", json=BUDGET).json()
+    time.sleep(0.01)
+    since = datetime.now().isoformat()
+    new = client.post("/budgets/", json={**BUDGET, "contract_number": "K2"}).json()
+    # Neue Ausgabe markiert auch das bestehende Budget als geändert
+    client.post("/expenses/", json={"budget_id": old["id"], "amount": 10, "date": "2024-03-01", "description": "x"})
+
+    ids = {budget["id"] for budget in client.get("/budgets/", params={"updated_since": since}).json()}
+    assert ids == {old["id"], new["id"]}
+    assert client.get("/budgets/", params={"updated_since": datetime.now().isoformat()}).json() == []
@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BENCH_OUTPUT = os.path.join(ROOT, "bench_output.txt")
+
+# Kleine JSON-Anfrage wie die Vertragsübersicht im Frontend
+READ_PATH = "/contracts/?fields=partner,contract_number,end_date,amount"
+
+def multipart(fields, file_bytes):
+    boundary = uuid.uuid4().hex
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="scan.pdf"\r\n'
+        f"Content-Type: application/pdf\r\n\r\n".encode() + file_bytes + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+def upload(base_url, file_bytes, created, statuses):
+    body, content_type = multipart({
+        "partner": "Lasttest",
+        "start_date": "2024-01-01",
+        "end_date": "2024-12-31",
+        "notice_period": "3 Monate",
+        "amount": "1",
+        "category": "Lasttest",
+    }, file_bytes)
+    request = urllib.request.Request(base_url + "/contracts/", data=body, method="POST", headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(request) as response:
+            created.append(json.loads(response.read())["id"])
+            statuses.append(response.status)
+    except urllib.error.HTTPError as e:
+        statuses.append(e.code)
+    except urllib.error.URLError:
+        # Abgelehnt, während der Client noch sendet: der Server schließt die Verbindung nach der Antwort
+        statuses.append("reset")
+
+def read_latencies(base_url, stop, latencies, statuses, pause):
+    while not stop.wait(pause):
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(base_url + READ_PATH) as response:
+                response.read()
+                statuses.append(response.status)
+        except urllib.error.HTTPError as e:
+            statuses.append(e.code)
+        latencies.append(time.perf_counter() - started)
+
+def percentiles(latencies):
+    if len(latencies) < 2:
+        return {"requests": len(latencies)}
+    cuts = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(cuts[49] * 1000, 1),
+        "p95_ms": round(cuts[94] * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+    }
+
+def measure_reads(base_url, seconds, readers, pause, during=None):
+    stop = threading.Event()
+    latencies, statuses = [], []
+    threads = [threading.Thread(target=read_latencies, args=(base_url, stop, latencies, statuses, pause)) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    if during:
+        during()
+    else:
+        time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {**percentiles(latencies), "statuses": {str(code): statuses.count(code) for code in sorted(set(statuses))}}
+
+def burst(base_url, uploads, size_mb):
+    # Läuft in eigenem Prozess: das Erzeugen und Senden der Uploads soll die Leser nicht über den GIL bremsen
+    file_bytes = os.urandom(int(size_mb * 1024 * 1024))
+    created, statuses = [], []
+    threads = [threading.Thread(target=upload, args=(base_url, file_bytes, created, statuses)) for _ in range(uploads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return created, statuses, time.perf_counter() - started
+
+def run(base_url, uploads, size_mb, seconds, readers, pause):
+    outcome = {}
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        def during():
+            outcome["result"] = pool.submit(burst, base_url, uploads, size_mb).result()
+
+        result = {
+            "uploads": uploads,
+            "upload_mb": size_mb,
+            "readers": readers,
+            "baseline": measure_reads(base_url, seconds, readers, pause),
+            "during_uploads": measure_reads(base_url, seconds, readers, pause, during=during),
+        }
+    created, statuses, burst_seconds = outcome["result"]
+    result["upload_statuses"] = {str(code): statuses.count(code) for code in sorted(set(statuses), key=str)}
+    result["burst_seconds"] = round(burst_seconds, 2)
+    # Angelegte Testverträge wieder entfernen
+    for contract_id in created:
+        urllib.request.urlopen(urllib.request.Request(f"{base_url}/contracts/{contract_id}", method="DELETE")).read()
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Leselatenz während eines Upload-Bursts (Admission Control)")
+    parser.add_argument("--url", default=os.getenv("BACKEND_URL", "http://localhost:8000"))
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--size-mb", type=float, default=20)
+    parser.add_argument("--seconds", type=float, default=5, help="Dauer der Basismessung ohne Uploads")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--pause", type=float, default=0.05, help="Pause je Leser zwischen zwei Anfragen (Sekunden)")
+    args = parser.parse_args()
+
+    result = {"mode": "admission", **run(args.url.rstrip("/"), args.uploads, args.size_mb, args.seconds, args.readers, args.pause)}
+    result["measured_at"] = datetime.now().isoformat(timespec="seconds")
+    print(json.dumps(result, indent=2))
+    with open(BENCH_OUTPUT, "a") as f:
+        f.write(json.dumps(result) + "\n")
@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import statistics
+import time
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BENCH_OUTPUT = os.path.join(ROOT, "bench_output.txt")
+
+# Übersichtsseiten des Frontends: vollständige Antwort vs. Abfrage mit fields/include (wie frontend/app.py)
+PAGES = {
+    "contracts": ("/contracts/", "/contracts/?fields=partner,category,contract_number,contract_date,start_date,end_date,amount"),
+    "budgets": ("/budgets/", "/budgets/?fields=contract_number,start_date,end_date,initial_amount&include=spent"),
+    "invoices": ("/invoices/", "/invoices/?fields=invoice_number,invoice_date,contract_number,cost_center,amount_net,amount_gross"),
+}
+
+def fetch(url, encoding):
+    # urllib entpackt nicht selbst: gemessen werden die tatsächlich übertragenen Bytes
+    request = urllib.request.Request(url, headers={"Accept-Encoding": encoding})
+    started = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        body = response.read()
+    return len(body), time.perf_counter() - started
+
+def measure(base_url, path, encoding, repeat):
+    fetch(base_url + path, encoding)  # Aufwärmen (Caches, Verbindungsaufbau)
+    results = [fetch(base_url + path, encoding) for _ in range(repeat)]
+    return {
+        "bytes": results[0][0],
+        "median_ms": round(statistics.median(seconds for _, seconds in results) * 1000, 1),
+    }
+
+def run(base_url, repeat):
+    result = {}
+    for page, (full, sparse) in PAGES.items():
+        for variant, path in (("full", full), ("sparse", sparse)):
+            for encoding in ("identity", "gzip"):
+                result[f"{page}_{variant}_{encoding}"] = measure(base_url, path, encoding, repeat)
+        before = result[f"{page}_full_identity"]["bytes"]
+        after = result[f"{page}_sparse_gzip"]["bytes"]
+        result[f"{page}_reduction"] = f"{(1 - after / before) * 100:.1f} %" if before else None
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Payload- und Latenz-Benchmark der Übersichtsseiten")
+    parser.add_argument("--url", default=os.getenv("BACKEND_URL", "http://localhost:8000"))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    result = {"mode": "payload", **run(args.url.rstrip("/"), args.repeat)}
+    result["measured_at"] = datetime.now().isoformat(timespec="seconds")
+    print(json.dumps(result, indent=2))
+    with open(BENCH_OUTPUT, "a") as f:
+        f.write(json.dumps(result) + "\n")
@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BENCH_OUTPUT = os.path.join(ROOT, "bench_output.txt")
+
+def wait_for(url, started, timeout=120):
+    # Pollt die URL, bis sie mit 200 antwortet; liefert die Zeit seit `started` in Sekunden
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+def measure_import(env):
+    # Reine Importzeit von app.main in einem frischen Interpreter
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=os.path.join(ROOT, "backend"), env=env)
+    return float(output.decode().strip().splitlines()[-1])
+
+def measure_process(cmd, cwd, env, url):
+    started = time.perf_counter()
+    process = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        return wait_for(url, started)
+    finally:
+        process.terminate()
+        process.wait()
+
+def run_local(backend_port, frontend_port):
+    data_dir = tempfile.mkdtemp(prefix="vertragsdb-bench-")
+    env = dict(os.environ, DATA_DIR=data_dir, BACKEND_URL=f"http://127.0.0.1:{backend_port}")
+    result = {"mode": "local", "backend_import_seconds": measure_import(env)}
+    result["backend_first_request_seconds"] = measure_process(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(backend_port)],
+        os.path.join(ROOT, "backend"), env, f"http://127.0.0.1:{backend_port}/health",
+    )
+    result["frontend_first_request_seconds"] = measure_process(
+        [sys.executable, "-m", "streamlit", "run", "app.py", "--server.headless=true", f"--server.port={frontend_port}"],
+        os.path.join(ROOT, "frontend"), env, f"http://127.0.0.1:{frontend_port}/_stcore/health",
+    )
+    return result
+
+def run_docker():
+    # Misst die Zeit von "docker-compose up" bis zur ersten erfolgreichen Antwort beider Container
+    subprocess.check_call(["docker-compose", "build", "-q"], cwd=ROOT)
+    subprocess.check_call(["docker-compose", "down"], cwd=ROOT)
+    started = time.perf_counter()
+    subprocess.check_call(["docker-compose", "up", "-d"], cwd=ROOT)
+    return {
+        "mode": "docker",
+        "backend_first_request_seconds": wait_for("http://localhost:8000/health", started),
+        "frontend_first_request_seconds": wait_for("http://localhost:8501/_stcore/health", started),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startzeit-Benchmark für Backend und Frontend")
+    parser.add_argument("--docker", action="store_true", help="Container per docker-compose starten und messen")
+    parser.add_argument("--backend-port", type=int, default=8765)
+    parser.add_argument("--frontend-port", type=int, default=8766)
+    args = parser.parse_args()
+
+    result = run_docker() if args.docker else run_local(args.backend_port, args.frontend_port)
+    result = {key: round(value, 3) if isinstance(value, float) else value for key, value in result.items()}
+    result["measured_at"] = datetime.now().isoformat(timespec="seconds")
+    print(json.dumps(result, indent=2))
+    # Ergebnisse anhängen, um die Entwicklung über Commits hinweg zu verfolgen
+    with open(BENCH_OUTPUT, "a") as f:
+        f.write(json.dumps(result) + "\n")
@@ -1,39 +1,120 @@
 import streamlit as st
 import requests
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import time
-from requests.exceptions import ConnectionError
+import uuid
+from requests.exceptions import ConnectionError, Timeout
 from loguru import logger
-import plotly.graph_objects as go
 
 # Backend-URL aus Umgebungsvariable (wird von Docker gesetzt)
 BACKEND_URL = os.getenv("BACKEND_URL", "http://0.0.0.0:8000")
 
-# Warte, bis das Backend erreichbar ist
+# Warte, bis das Backend erreichbar ist. Das Ergebnis wird prozessweit gecacht, sodass nur der
+# erste Aufruf wartet und spätere Reruns sofort weiterlaufen. Fehlschläge werden nicht gecacht.
+@st.cache_resource(show_spinner="Warte auf Backend...")
 def wait_for_backend():
-    max_retries = 30
-    retry_interval = 2  # Sekunden
+    max_retries = 60
+    retry_interval = 0.5  # Sekunden
     for _ in range(max_retries):
         try:
-            response = requests.get(f"{BACKEND_URL}/health")
+            response = requests.get(f"{BACKEND_URL}/health", timeout=2)
             if response.status_code == 200:
                 logger.info("Backend ist bereit!")
                 return True
-        except ConnectionError:
+        except (ConnectionError, Timeout):
             logger.info("Warte auf Backend...")
-            time.sleep(retry_interval)
-    return False
+        time.sleep(retry_interval)
+    raise ConnectionError(f"Backend unter {BACKEND_URL} nicht erreichbar")
 
-if not wait_for_backend():
+try:
+    wait_for_backend()
+except ConnectionError:
     st.error("Backend nicht erreichbar! Bitte starte die Container neu.")
     st.stop()
 
+# Wartezeiten aus Retry-After bis zu dieser Länge überbrückt das Frontend selbst (429/503 der Admission Control)
+MAX_RETRY_WAIT = 3
+MAX_RETRIES = 2
+
+class BackendSession(requests.Session):
+    """HTTP-Session je Browser-Sitzung.
+
+    Das Backend begrenzt Anfragen je Client; da alle Benutzer über diesen Container kommen, trägt
+    jede Sitzung eine eigene X-Client-Id. Bei 429/503 wird nach Retry-After wiederholt; diese
+    Ablehnungen erreichen die Anwendung nicht, daher ist das auch für POST unkritisch. Große
+    abgelehnte Uploads liest das Backend nicht mehr; dann bricht die Verbindung ab, und es
+    bleibt bei einem Hinweis.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.headers["X-Client-Id"] = uuid.uuid4().hex
+
+    def request(self, method, url, *args, **kwargs):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except ConnectionError:
+                if not kwargs.get("files"):
+                    raise
+                st.warning("⏳ Der Upload wurde abgebrochen: Das Backend ist ausgelastet oder nicht erreichbar. Bitte gleich erneut versuchen.")
+                st.stop()
+            if response.status_code not in (429, 503):
+                return response
+            retry_after = int(response.headers.get("Retry-After", "1"))
+            if attempt == MAX_RETRIES or retry_after > MAX_RETRY_WAIT:
+                st.warning(f"⏳ Das Backend ist gerade ausgelastet. Bitte in {retry_after} s erneut versuchen.")
+                return response
+            time.sleep(retry_after)
+        return response
+
+def backend() -> BackendSession:
+    if "backend" not in st.session_state:
+        st.session_state.backend = BackendSession()
+    return st.session_state.backend
+
 if "editing_contract" not in st.session_state:
     st.session_state.editing_contract = None
 if "editing_budget" not in st.session_state:
     st.session_state.editing_budget = None
 
+def records_to_frame(records, columns, date_columns=()):
+    # pandas wird erst auf den Übersichtsseiten benötigt
+    import pandas as pd
+    # Ein DataFrame pro Übersicht; Datumsspalten werden spaltenweise statt pro Zeile konvertiert
+    df = pd.DataFrame.from_records(records, columns=columns)
+    for column in date_columns:
+        df[column] = pd.to_datetime(df[column], format="%Y-%m-%d", errors="coerce")
+    return df
+
+def table_key(name):
+    # Schlüssel mit Generation: ein neuer Schlüssel verwirft die Zeilenauswahl der Tabelle
+    return f"{name}_{st.session_state.get(f'{name}_generation', 0)}"
+
+def clear_selection(name):
+    # Nach dem Löschen würde der gleiche Zeilenindex sonst auf den nächsten Datensatz zeigen
+    st.session_state[f"{name}_generation"] = st.session_state.get(f"{name}_generation", 0) + 1
+
+def selected_record(event, records):
+    rows = event.selection.rows
+    # Nach dem Löschen kann die Auswahl auf eine nicht mehr vorhandene Zeile zeigen
+    if rows and rows[0] < len(records):
+        return records[rows[0]]
+    return None
+
+# Zahlungsintervalle für den Zahlungsplan; None = Backend leitet es aus der Kategorie ab
+PAYMENT_INTERVALS = {
+    None: "Automatisch (nach Kategorie)",
+    "monthly": "Monatlich",
+    "quarterly": "Vierteljährlich",
+    "annual": "Jährlich",
+    "once": "Einmalig",
+}
+
+DATE_FORMAT = "DD.MM.YYYY"
+EURO_FORMAT = "%.2f €"
+
 def render_create_contract():
     st.header("➕ Neuen Vertrag erfassen")
     with st.form("new_contract"):
@@ -52,6 +133,7 @@ def render_create_contract():
             "Kategorie",
             ["Abonnement", "Dienstleistung", "Kaufvertrag", "Wartungsvertrag", "Sonstiges"]
         )
+        payment_interval = st.selectbox("Zahlungsintervall", list(PAYMENT_INTERVALS), format_func=PAYMENT_INTERVALS.get)
         notes = st.text_area("Notizen", placeholder="Zusätzliche Informationen...")
         document = st.file_uploader(
             "Dokument hochladen (PDF/Word)",
@@ -74,9 +156,11 @@ def render_create_contract():
                     "amount": str(amount),
                     "category": category,
                     "notes": notes,
+                    "payment_interval": payment_interval,
                 }
-                files = {"file": document} if document else None
-                response = requests.post(f"{BACKEND_URL}/contracts/", data=data, files=files)
+                # Bytes statt Dateiobjekt, damit eine Wiederholung bei 429/503 den vollständigen Inhalt sendet
+                files = {"file": (document.name, document.getvalue(), document.type)} if document else None
+                response = backend().post(f"{BACKEND_URL}/contracts/", data=data, files=files)
                 if response.status_code == 200:
                     st.success("✅ Vertrag erfolgreich gespeichert!")
                 else:
@@ -105,7 +189,7 @@ def render_edit_contract(contract):
         
         # Button zum Herunterladen (ruft Backend-Endpoint auf)
         try:
-            doc_response = requests.get(f"{BACKEND_URL}/contracts/{contract['id']}/document")
+            doc_response = backend().get(f"{BACKEND_URL}/contracts/{contract['id']}/document")
             if doc_response.status_code == 200:
                 st.download_button(
                     label=f"📥 Download {file_name}",
@@ -139,6 +223,9 @@ def render_edit_contract(contract):
             cat_index = categories.index(contract['category'])
             
         category = st.selectbox("Kategorie", categories, index=cat_index)
+        intervals = list(PAYMENT_INTERVALS)
+        interval_index = intervals.index(contract.get("payment_interval")) if contract.get("payment_interval") in intervals else 0
+        payment_interval = st.selectbox("Zahlungsintervall", intervals, index=interval_index, format_func=PAYMENT_INTERVALS.get)
         notes = st.text_area("Notizen", value=contract['notes'] or "")
         document = st.file_uploader(
             "Neues Dokument hochladen (überschreibt altes)",
@@ -160,13 +247,17 @@ def render_edit_contract(contract):
                 "amount": str(amount),
                 "category": category,
                 "notes": notes,
+                "payment_interval": payment_interval,
+                "version": contract.get("version"),
             }
-            files = {"file": document} if document else None
-            response = requests.put(f"{BACKEND_URL}/contracts/{contract['id']}", data=data, files=files)
+            files = {"file": (document.name, document.getvalue(), document.type)} if document else None
+            response = backend().put(f"{BACKEND_URL}/contracts/{contract['id']}", data=data, files=files)
             if response.status_code == 200:
                 st.success("✅ Änderungen gespeichert!")
                 st.session_state.editing_contract = None # Zurück zur Übersicht
                 st.rerun()
+            elif response.status_code == 409:
+                st.error("❌ Der Vertrag wurde zwischenzeitlich geändert. Bitte zurück zur Übersicht und erneut öffnen.")
             else:
                 st.error(f"❌ Fehler: {response.text}")
     
@@ -177,7 +268,7 @@ def render_edit_contract(contract):
             st.rerun()
     with col2:
         if st.button("🗑️ Vertrag löschen", type="primary"):
-            response = requests.delete(f"{BACKEND_URL}/contracts/{contract['id']}")
+            response = backend().delete(f"{BACKEND_URL}/contracts/{contract['id']}")
             if response.status_code == 200:
                 st.success("✅ Vertrag gelöscht!")
                 st.session_state.editing_contract = None
@@ -192,37 +283,82 @@ def render_overview():
         render_edit_contract(st.session_state.editing_contract)
         return
 
-    response = requests.get(f"{BACKEND_URL}/contracts/")
-    if response.status_code == 200:
-        contracts = response.json()
-        if not contracts:
-            st.info("Keine Verträge vorhanden.")
-        else:
-            for contract in contracts:
-                col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
-                with col1:
-                    st.write(f"**{contract['partner']}** ({contract['category']})")
-                with col2:
-                     # Datum formatieren
-                    start = datetime.strptime(contract['start_date'], "%Y-%m-%d").strftime("%d.%m.%Y")
-                    end = datetime.strptime(contract['end_date'], "%Y-%m-%d").strftime("%d.%m.%Y")
-                    c_date = datetime.strptime(contract['contract_date'], "%Y-%m-%d").strftime("%d.%m.%Y") if contract.get('contract_date') else "-"
-                    st.write(f"{start} - {end} (V: {c_date})")
-                with col3:
-                    if st.button("✏️ Bearbeiten", key=f"edit_{contract['id']}"):
-                        st.session_state.editing_contract = contract
-                        st.rerun()
-                with col4:
-                    if st.button("🗑️ Löschen", key=f"delete_{contract['id']}", type="secondary"):
-                        response = requests.delete(f"{BACKEND_URL}/contracts/{contract['id']}")
-                        if response.status_code == 200:
-                            st.success("✅ Vertrag gelöscht!")
-                            st.rerun()
-                        else:
-                            st.error(f"❌ Fehler: {response.text}")
-                st.markdown("---")
-    else:
+    render_contract_table()
+
+# Fragment: Auswahl und Löschen laufen nur diesen Teil neu, nicht die ganze Seite
+@st.fragment
+def render_contract_table():
+    # Vertragspartner über die Autovervollständigung auswählen; Schreibvarianten zählen als ein Partner
+    params = {}
+    search = st.text_input("🔎 Vertragspartner filtern", placeholder="z. B. 'Mustermann'", key="partner_search")
+    if search:
+        response = backend().get(f"{BACKEND_URL}/partners/autocomplete", params={"q": search})
+        if response.status_code != 200:
+            st.error("Fehler beim Laden der Vertragspartner.")
+            return
+        matches = response.json()
+        if not matches:
+            st.info("Kein passender Vertragspartner gefunden.")
+            return
+        partner = st.selectbox("Vertragspartner", matches, format_func=lambda match: match["name"], key="partner_filter")
+        params["partner_id"] = partner["id"]
+
+    # Nur die Tabellenspalten laden (ohne Notizen und Dokumentpfade); der Bearbeiten-Dialog lädt den Vertrag vollständig
+    params["fields"] = "partner,category,contract_number,contract_date,start_date,end_date,amount"
+    response = backend().get(f"{BACKEND_URL}/contracts/", params=params)
+    if response.status_code != 200:
         st.error("Fehler beim Laden der Verträge.")
+        return
+    contracts = response.json()
+    if not contracts:
+        st.info("Keine Verträge vorhanden.")
+        return
+
+    df = records_to_frame(
+        contracts,
+        ["partner", "category", "contract_number", "contract_date", "start_date", "end_date", "amount"],
+        date_columns=["contract_date", "start_date", "end_date"],
+    )
+    event = st.dataframe(
+        df,
+        key=table_key("contracts_table"),
+        on_select="rerun",
+        selection_mode="single-row",
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "partner": "Vertragspartner",
+            "category": "Kategorie",
+            "contract_number": "Vertragsnummer",
+            "contract_date": st.column_config.DateColumn("Vertragsdatum", format=DATE_FORMAT),
+            "start_date": st.column_config.DateColumn("Start", format=DATE_FORMAT),
+            "end_date": st.column_config.DateColumn("Ende", format=DATE_FORMAT),
+            "amount": st.column_config.NumberColumn("Betrag", format=EURO_FORMAT),
+        },
+    )
+
+    contract = selected_record(event, contracts)
+    if not contract:
+        st.caption("Zeile auswählen, um einen Vertrag zu bearbeiten oder zu löschen.")
+        return
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button(f"✏️ {contract['partner']} bearbeiten", key="edit_contract_selected"):
+            response = backend().get(f"{BACKEND_URL}/contracts/{contract['id']}")
+            if response.status_code == 200:
+                st.session_state.editing_contract = response.json()
+                st.rerun()
+            else:
+                st.error(f"❌ Fehler: {response.text}")
+    with col2:
+        if st.button(f"🗑️ {contract['partner']} löschen", key="delete_contract_selected", type="secondary"):
+            response = backend().delete(f"{BACKEND_URL}/contracts/{contract['id']}")
+            if response.status_code == 200:
+                st.success("✅ Vertrag gelöscht!")
+                clear_selection("contracts_table")
+                st.rerun(scope="fragment")
+            else:
+                st.error(f"❌ Fehler: {response.text}")
 
 def render_create_budget():
     st.header("➕ Neues Budget erstellen")
@@ -246,7 +382,7 @@ def render_create_budget():
                     "start_date": start_date.strftime("%Y-%m-%d"),
                     "end_date": end_date.strftime("%Y-%m-%d"),
                 }
-                response = requests.post(f"{BACKEND_URL}/budgets/", json=data)
+                response = backend().post(f"{BACKEND_URL}/budgets/", json=data)
                 if response.status_code == 200:
                     st.success("✅ Budget erfolgreich erstellt!")
                     st.rerun()
@@ -280,15 +416,18 @@ def render_edit_budget(budget):
                 "initial_amount": initial_amount,
                 "start_date": start_date.strftime("%Y-%m-%d"),
                 "end_date": end_date.strftime("%Y-%m-%d"),
+                "version": budget.get("version"),
             }
-            response = requests.put(f"{BACKEND_URL}/budgets/{budget['id']}", json=data)
+            response = backend().put(f"{BACKEND_URL}/budgets/{budget['id']}", json=data)
             if response.status_code == 200:
                 st.success("✅ Änderungen gespeichert!")
                 # Budget neu laden
-                budget_response = requests.get(f"{BACKEND_URL}/budgets/{budget['id']}")
+                budget_response = backend().get(f"{BACKEND_URL}/budgets/{budget['id']}")
                 if budget_response.status_code == 200:
                     st.session_state.editing_budget = budget_response.json()
                     st.rerun()
+            elif response.status_code == 409:
+                st.error("❌ Das Budget wurde zwischenzeitlich geändert. Bitte über \"Zurück zu Details\" neu laden.")
             else:
                 st.error(f"❌ Fehler: {response.text}")
     
@@ -296,13 +435,13 @@ def render_edit_budget(budget):
     with col1:
         if st.button("Zurück zu Details"):
             # Budget neu laden
-            budget_response = requests.get(f"{BACKEND_URL}/budgets/{budget['id']}")
+            budget_response = backend().get(f"{BACKEND_URL}/budgets/{budget['id']}")
             if budget_response.status_code == 200:
                 st.session_state.editing_budget = budget_response.json()
                 st.rerun()
     with col2:
         if st.button("🗑️ Budget löschen", type="primary"):
-            response = requests.delete(f"{BACKEND_URL}/budgets/{budget['id']}")
+            response = backend().delete(f"{BACKEND_URL}/budgets/{budget['id']}")
             if response.status_code == 200:
                 st.success("✅ Budget gelöscht!")
                 st.session_state.editing_budget = None
@@ -340,6 +479,8 @@ def render_budget_detail(budget, edit_mode=False):
     st.subheader("📊 Budget-Übersicht")
     
     if total_spent > 0:
+        # plotly erst laden, wenn tatsächlich ein Diagramm gezeichnet wird
+        import plotly.graph_objects as go
         fig = go.Figure(data=[go.Pie(
             labels=['Verbraucht', 'Verfügbar'],
             values=[total_spent, max(0, remaining)],
@@ -363,6 +504,24 @@ def render_budget_detail(budget, edit_mode=False):
     with col3:
         percentage = (total_spent / budget['initial_amount'] * 100) if budget['initial_amount'] > 0 else 0
         st.metric("Verbraucht %", f"{percentage:.1f}%")
+
+    # Prognose aus der Burn-Rate (wird im Backend für alle Budgets gemeinsam berechnet)
+    forecast_response = backend().get(f"{BACKEND_URL}/budgets/forecast", params={"budget_id": budget['id']})
+    prognosis = forecast_response.json()[0] if forecast_response.status_code == 200 and forecast_response.json() else None
+    if prognosis and prognosis['status'] == "not_started":
+        st.info(f"ℹ️ Die Laufzeit beginnt erst am {start}; bis dahin gibt es keine Burn-Rate.")
+    elif prognosis:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Burn-Rate pro Tag", f"{prognosis['daily_burn_rate']:.2f} €")
+        with col2:
+            exhaustion = prognosis.get('exhaustion_date')
+            exhaustion_text = datetime.strptime(exhaustion, "%Y-%m-%d").strftime("%d.%m.%Y") if exhaustion else "-"
+            st.metric("Voraussichtlich erschöpft", exhaustion_text)
+        with col3:
+            st.metric("Prognose Restbetrag zum Ende", f"{prognosis['projected_remaining_at_end']:.2f} €")
+        if prognosis['at_risk']:
+            st.warning("⚠️ Bei gleichbleibender Burn-Rate ist das Budget vor dem Laufzeitende aufgebraucht.")
     
     st.markdown("---")
     
@@ -387,7 +546,7 @@ def render_budget_detail(budget, edit_mode=False):
                     "date": expense_date.strftime("%Y-%m-%d"),
                     "description": description if description else None,
                 }
-                response = requests.post(f"{BACKEND_URL}/expenses/", json=data)
+                response = backend().post(f"{BACKEND_URL}/expenses/", json=data)
                 if response.status_code == 200:
                     st.success("✅ Ausgabe erfolgreich erfasst!")
                     st.rerun()
@@ -397,17 +556,17 @@ def render_budget_detail(budget, edit_mode=False):
     # Ausgaben-Liste
     if expenses:
         st.subheader("📋 Erfasste Ausgaben")
-        for exp in sorted(expenses, key=lambda x: x['date'], reverse=True):
-            col1, col2, col3 = st.columns([2, 2, 1])
-            with col1:
-                exp_date = datetime.strptime(exp['date'], "%Y-%m-%d").strftime("%d.%m.%Y")
-                st.write(f"**{exp_date}**")
-            with col2:
-                desc = exp.get('description', 'Keine Beschreibung')
-                st.write(desc)
-            with col3:
-                st.write(f"**{exp['amount']:.2f} €**")
-            st.markdown("---")
+        df = records_to_frame(expenses, ["date", "description", "amount"], date_columns=["date"])
+        st.dataframe(
+            df.sort_values("date", ascending=False),
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "date": st.column_config.DateColumn("Datum", format=DATE_FORMAT),
+                "description": "Beschreibung",
+                "amount": st.column_config.NumberColumn("Betrag", format=EURO_FORMAT),
+            },
+        )
     
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -421,7 +580,7 @@ def render_budget_detail(budget, edit_mode=False):
             st.rerun()
     with col3:
         if st.button("🗑️ Budget löschen", type="primary"):
-            response = requests.delete(f"{BACKEND_URL}/budgets/{budget['id']}")
+            response = backend().delete(f"{BACKEND_URL}/budgets/{budget['id']}")
             if response.status_code == 200:
                 st.success("✅ Budget gelöscht!")
                 st.session_state.editing_budget = None
@@ -436,42 +595,69 @@ def render_budget_overview():
         render_budget_detail(st.session_state.editing_budget)
         return
     
-    response = requests.get(f"{BACKEND_URL}/budgets/")
-    if response.status_code == 200:
-        budgets = response.json()
-        if not budgets:
-            st.info("Keine Budgets vorhanden.")
-        else:
-            for budget in budgets:
-                expenses = budget.get('expenses', [])
-                total_spent = sum(exp['amount'] for exp in expenses)
-                remaining = budget['initial_amount'] - total_spent
-                
-                col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 1, 1])
-                with col1:
-                    contract_info = f" ({budget['contract_number']})" if budget.get('contract_number') else ""
-                    st.write(f"**Budget{contract_info}**")
-                with col2:
-                    start = datetime.strptime(budget['start_date'], "%Y-%m-%d").strftime("%d.%m.%Y")
-                    end = datetime.strptime(budget['end_date'], "%Y-%m-%d").strftime("%d.%m.%Y")
-                    st.write(f"{start} - {end}")
-                with col3:
-                    st.write(f"Verfügbar: **{remaining:.2f} €** / {budget['initial_amount']:.2f} €")
-                with col4:
-                    if st.button("📊 Details", key=f"budget_{budget['id']}"):
-                        st.session_state.editing_budget = budget
-                        st.rerun()
-                with col5:
-                    if st.button("🗑️ Löschen", key=f"delete_budget_{budget['id']}", type="secondary"):
-                        response = requests.delete(f"{BACKEND_URL}/budgets/{budget['id']}")
-                        if response.status_code == 200:
-                            st.success("✅ Budget gelöscht!")
-                            st.rerun()
-                        else:
-                            st.error(f"❌ Fehler: {response.text}")
-                st.markdown("---")
-    else:
+    render_budget_table()
+
+@st.fragment
+def render_budget_table():
+    # Verbrauch berechnet das Backend; die Ausgaben lädt erst die Detailansicht
+    response = backend().get(
+        f"{BACKEND_URL}/budgets/",
+        params={"fields": "contract_number,start_date,end_date,initial_amount", "include": "spent"},
+    )
+    if response.status_code != 200:
         st.error("Fehler beim Laden der Budgets.")
+        return
+    budgets = response.json()
+    if not budgets:
+        st.info("Keine Budgets vorhanden.")
+        return
+
+    df = records_to_frame(
+        budgets,
+        ["id", "contract_number", "start_date", "end_date", "initial_amount", "spent"],
+        date_columns=["start_date", "end_date"],
+    )
+    df["remaining"] = df["initial_amount"] - df["spent"]
+
+    event = st.dataframe(
+        df.drop(columns=["id"]),
+        key=table_key("budgets_table"),
+        on_select="rerun",
+        selection_mode="single-row",
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "contract_number": "Vertragsnummer",
+            "start_date": st.column_config.DateColumn("Beginn", format=DATE_FORMAT),
+            "end_date": st.column_config.DateColumn("Ende", format=DATE_FORMAT),
+            "initial_amount": st.column_config.NumberColumn("Ausgangswert", format=EURO_FORMAT),
+            "spent": st.column_config.NumberColumn("Verbraucht", format=EURO_FORMAT),
+            "remaining": st.column_config.NumberColumn("Verfügbar", format=EURO_FORMAT),
+        },
+    )
+
+    budget = selected_record(event, budgets)
+    if not budget:
+        st.caption("Zeile auswählen, um Details anzuzeigen oder das Budget zu löschen.")
+        return
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("📊 Details", key="budget_selected"):
+            response = backend().get(f"{BACKEND_URL}/budgets/{budget['id']}")
+            if response.status_code == 200:
+                st.session_state.editing_budget = response.json()
+                st.rerun()
+            else:
+                st.error(f"❌ Fehler: {response.text}")
+    with col2:
+        if st.button("🗑️ Löschen", key="delete_budget_selected", type="secondary"):
+            response = backend().delete(f"{BACKEND_URL}/budgets/{budget['id']}")
+            if response.status_code == 200:
+                st.success("✅ Budget gelöscht!")
+                clear_selection("budgets_table")
+                st.rerun(scope="fragment")
+            else:
+                st.error(f"❌ Fehler: {response.text}")
 
 def render_create_invoice():
     st.header("➕ Neue Rechnung erfassen")
@@ -484,6 +670,7 @@ def render_create_invoice():
         
         # Vorschau Brutto (nur visuell, Berechnung erfolgt im Backend auch nochmal zur Sicherheit)
         st.write(f"Voraussichtliche Summe Brutto (19%): **{amount_net * 1.19:.2f} €**")
+        allow_duplicate = st.checkbox("Auch speichern, wenn eine gleiche Rechnung bereits erfasst ist")
 
         submitted = st.form_submit_button("Rechnung speichern")
         if submitted:
@@ -497,50 +684,123 @@ def render_create_invoice():
                     "cost_center": cost_center,
                     "amount_net": amount_net
                 }
-                response = requests.post(f"{BACKEND_URL}/invoices/", json=data)
+                response = backend().post(f"{BACKEND_URL}/invoices/", json=data, params={"allow_duplicate": allow_duplicate})
                 if response.status_code == 200:
                     st.success("✅ Rechnung erfolgreich gespeichert!")
+                elif response.status_code == 409:
+                    st.warning("⚠️ Eine Rechnung mit gleicher Nummer, Kostenstelle, gleichem Betrag und Monat ist bereits erfasst. Zum Speichern bitte bestätigen.")
                 else:
                     st.error(f"❌ Fehler: {response.text}")
 
+    st.subheader("📥 E-Rechnungen importieren")
+    with st.form("import_einvoice"):
+        uploads = st.file_uploader(
+            "XRechnung / ZUGFeRD (XML oder PDF)",
+            type=["xml", "pdf"],
+            accept_multiple_files=True,
+        )
+        submitted = st.form_submit_button("Importieren")
+        if submitted and uploads:
+            files = [("files", (upload.name, upload.getvalue())) for upload in uploads]
+            response = backend().post(f"{BACKEND_URL}/invoices/import/einvoice", files=files)
+            if response.status_code == 200:
+                report = response.json()
+                st.success(f"✅ {report['imported']} Rechnung(en) importiert, {report['duplicates']} Duplikat(e) übersprungen.")
+                for error in report["errors"]:
+                    st.error(f"❌ {error['file']}: {error['error']}")
+            else:
+                st.error(f"❌ Fehler: {response.text}")
+
 def render_invoice_overview():
     st.header("🧾 Rechnungsübersicht")
-    
-    response = requests.get(f"{BACKEND_URL}/invoices/")
-    if response.status_code == 200:
-        invoices = response.json()
-        if not invoices:
-            st.info("Keine Rechnungen vorhanden.")
-        else:
-            for invoice in invoices:
-                col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 1])
-                with col1:
-                    st.write(f"**{invoice['invoice_number']}**")
-                    if invoice.get('contract_number'):
-                        st.caption(f"Ref: {invoice['contract_number']}")
-                with col2:
-                    st.write(datetime.strptime(invoice['invoice_date'], "%Y-%m-%d").strftime("%d.%m.%Y"))
-                with col3:
-                   st.write(invoice['cost_center'])
-                with col4:
-                    st.write(f"{invoice['amount_net']:.2f} € Netto")
-                    st.write(f"**{invoice['amount_gross']:.2f} € Brutto**")
-                with col5:
-                    if st.button("🗑️", key=f"delete_inv_{invoice['id']}", type="secondary", help="Löschen"):
-                        response = requests.delete(f"{BACKEND_URL}/invoices/{invoice['id']}")
-                        if response.status_code == 200:
-                            st.success("Gelöscht!")
-                            st.rerun()
-                        else:
-                            st.error(f"Fehler: {response.text}")
-                st.markdown("---")
-    else:
+    render_invoice_table()
+
+@st.fragment
+def render_invoice_table():
+    response = backend().get(
+        f"{BACKEND_URL}/invoices/",
+        params={"fields": "invoice_number,invoice_date,contract_number,cost_center,amount_net,amount_gross"},
+    )
+    if response.status_code != 200:
         st.error("Fehler beim Laden der Rechnungen.")
+        return
+    invoices = response.json()
+    if not invoices:
+        st.info("Keine Rechnungen vorhanden.")
+        return
+
+    df = records_to_frame(
+        invoices,
+        ["invoice_number", "invoice_date", "contract_number", "cost_center", "amount_net", "amount_gross"],
+        date_columns=["invoice_date"],
+    )
+    event = st.dataframe(
+        df,
+        key=table_key("invoices_table"),
+        on_select="rerun",
+        selection_mode="single-row",
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "invoice_number": "Rechnungsnummer",
+            "invoice_date": st.column_config.DateColumn("Rechnungsdatum", format=DATE_FORMAT),
+            "contract_number": "Vertragsnummer",
+            "cost_center": "Kostenstelle",
+            "amount_net": st.column_config.NumberColumn("Netto", format=EURO_FORMAT),
+            "amount_gross": st.column_config.NumberColumn("Brutto", format=EURO_FORMAT),
+        },
+    )
+
+    invoice = selected_record(event, invoices)
+    if invoice and st.button(f"🗑️ Rechnung {invoice['invoice_number']} löschen", key="delete_invoice_selected", type="secondary"):
+        response = backend().delete(f"{BACKEND_URL}/invoices/{invoice['id']}")
+        if response.status_code == 200:
+            st.success("Gelöscht!")
+            clear_selection("invoices_table")
+            st.rerun(scope="fragment")
+        else:
+            st.error(f"Fehler: {response.text}")
+
+def render_cash_flow():
+    st.header("📈 Cashflow-Prognose")
+    today = datetime.now().date()
+    col1, col2 = st.columns(2)
+    with col1:
+        date_from = st.date_input("Von", today.replace(day=1), format="DD.MM.YYYY")
+    with col2:
+        # timedelta statt replace(year=...): am 29.02. gibt es im Folgejahr keinen passenden Tag
+        date_to = st.date_input("Bis", today + timedelta(days=365), format="DD.MM.YYYY")
+
+    response = backend().get(
+        f"{BACKEND_URL}/cashflow/",
+        params={"date_from": date_from.strftime("%Y-%m-%d"), "date_to": date_to.strftime("%Y-%m-%d")},
+    )
+    if response.status_code != 200:
+        st.error("Fehler beim Laden der Cashflow-Prognose.")
+        return
+    months = response.json()
+    if not months:
+        st.info("Im gewählten Zeitraum sind keine Zahlungen geplant.")
+        return
+
+    df = records_to_frame(months, ["month", "amount", "payments"])
+    st.bar_chart(df, x="month", y="amount", x_label="Monat", y_label="Betrag (€)")
+    st.metric("Summe im Zeitraum", f"{df['amount'].sum():.2f} €")
+    st.dataframe(
+        df,
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "month": "Monat",
+            "amount": st.column_config.NumberColumn("Betrag", format=EURO_FORMAT),
+            "payments": "Zahlungen",
+        },
+    )
 
 # Main Layout
 st.title("📄 Vertragsarchiv")
 
-page = st.sidebar.radio("Navigation", ["Verträge - Übersicht", "Verträge - Neu", "Budgets - Übersicht", "Budgets - Neu", "Rechnungen - Übersicht", "Rechnungen - Neu"])
+page = st.sidebar.radio("Navigation", ["Verträge - Übersicht", "Verträge - Neu", "Budgets - Übersicht", "Budgets - Neu", "Rechnungen - Übersicht", "Rechnungen - Neu", "Cashflow - Prognose"])
 
 if page == "Verträge - Übersicht":
     if st.session_state.editing_budget:
@@ -567,3 +827,5 @@ elif page == "Rechnungen - Übersicht":
     render_invoice_overview()
 elif page == "Rechnungen - Neu":
     render_create_invoice()
+elif page == "Cashflow - Prognose":
+    render_cash_flow()
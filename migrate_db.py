@@ -3,6 +3,37 @@ import os
 
 DB_PATH = "data/contracts.db"
 
+# (Tabelle, Spalte, Typ) – neue Tabellen legt das Backend beim Start selbst an
+COLUMNS = [
+    ("contracts", "contract_date", "DATE"),
+    ("contracts", "payment_interval", "VARCHAR"),
+    ("contracts", "partner_id", "INTEGER REFERENCES partners(id)"),
+    ("invoices", "dedup_key", "VARCHAR"),
+]
+VERSIONED_TABLES = ["contracts", "budgets", "expenses", "invoices"]
+for table in VERSIONED_TABLES:
+    COLUMNS += [
+        (table, "created_at", "DATETIME"),
+        (table, "updated_at", "DATETIME"),
+        (table, "version", "INTEGER NOT NULL DEFAULT 1"),
+    ]
+
+STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS ix_invoices_dedup_key ON invoices (dedup_key)",
+    "CREATE INDEX IF NOT EXISTS ix_contracts_partner_id ON contracts (partner_id)",
+    "CREATE INDEX IF NOT EXISTS ix_invoices_invoice_date ON invoices (invoice_date)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_date ON expenses (date)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_budget_id ON expenses (budget_id)",
+]
+for table in VERSIONED_TABLES:
+    STATEMENTS += [
+        # Bestandszeilen erhalten den Migrationszeitpunkt als Zeitstempel
+        f"UPDATE {table} SET created_at = datetime('now', 'localtime') WHERE created_at IS NULL",
+        f"UPDATE {table} SET updated_at = created_at WHERE updated_at IS NULL",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_created_at ON {table} (created_at)",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_updated_at ON {table} (updated_at)",
+    ]
+
 def migrate():
     if not os.path.exists(DB_PATH):
         print(f"Database not found at {DB_PATH}")
@@ -11,14 +42,23 @@ def migrate():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute("ALTER TABLE contracts ADD COLUMN contract_date DATE")
+        for table, column, column_type in COLUMNS:
+            try:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                print(f"Migration successful: added {table}.{column} column.")
+            except sqlite3.OperationalError as e:
+                if "duplicate column name" in str(e):
+                    print(f"Column {table}.{column} already exists.")
+                elif "no such table" in str(e):
+                    print(f"Table {table} does not exist yet.")
+                else:
+                    print(f"Error: {e}")
+        for statement in STATEMENTS:
+            try:
+                cursor.execute(statement)
+            except sqlite3.OperationalError as e:
+                print(f"Error: {e}")
         conn.commit()
-        print("Migration successful: added contract_date column.")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            print("Column already exists.")
-        else:
-            print(f"Error: {e}")
     finally:
         conn.close()
 
@@ -18,11 +18,11 @@ echo "1. Stoppe Docker-Container..."
 docker-compose down
 
 echo "2. Lösche Datenbank-Datei (contracts.db)..."
-rm -f data/contracts.db
+rm -f data/contracts.db data/contracts.db-wal data/contracts.db-shm
 
 echo "3. Lösche hochgeladene Dokumente..."
 # Löscht den Inhalt von documents/, behält aber den Ordner
-rm -rf data/documents/*
+rm -rf data/documents/* data/archive data/snapshot data/partitions
 
 echo "4. Starte Anwendung neu (Rebuild)..."
 docker-compose up -d --build